@@ -2,17 +2,42 @@
 # 標準ライブラリ
 # ============================
 import os                                # 
-import tempfile                          # 一時ファイル
+import math                              # 数学関数
 from typing import (                     # 型定義
-    Tuple
+    Tuple,
+    Annotated,
+    Any,
 )
 import numpy as np                       # 数値処理
+from numpy.lib.stride_tricks import sliding_window_view  # 配列の窓
 from operator import index               # インデックス操作関連
 from xml.etree import ElementTree        # XML/SVG の DOM 解析
 import logging                           # ログ
 import asyncio                           # 非同期処理
+import io                                # バイト列のストリーム
+import json                              # JSON
+import hashlib                           # ハッシュ
+import threading                         # 排他制御
+from collections import OrderedDict      # LRU キャッシュ
+from concurrent.futures import (         # ワーカープール
+    BrokenExecutor,
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from contextlib import (                 # FastAPI の lifespan・非同期ジェネレーターの終了
+    aclosing,
+    asynccontextmanager,
+)
 from enum import Enum                    # 列挙型
-from dataclasses import dataclass        # データクラス
+from dataclasses import dataclass, replace  # データクラス
+import copy                              # 入力規則の複製
+import struct                            # バイナリ形式の固定長部分
+import zipfile                           # 一括生成のアーカイブ
+from functools import (                  # 遅延評価・キャッシュ
+    cached_property,
+    lru_cache,
+)
 
 # ============================
 # サードパーティライブラリ
@@ -27,7 +52,6 @@ from pydantic_core import(                # Pydantic の検証エラー
     PydanticCustomError, ValidationError
 )
 from svgpathtools import (                # SVG パス解析ツール
-    parse_path,
     wsvg,
     Path,
     Line,
@@ -39,18 +63,25 @@ from shapely.geometry import (            # 形状処理（点・多角形）
     Polygon
 )
 from shapely.ops import unary_union       # ジオメトリ結合
+import shapely                            # ベクトル化された述語
 from fastapi import(                      # FastAPI
     FastAPI,
     Request,
     HTTPException,
-    BackgroundTasks,
 )
 from fastapi.responses import(
-    FileResponse,
     JSONResponse,
+    Response,
+    StreamingResponse,
 )
 import openpyxl
 from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.worksheet.dimensions import ColumnDimension, SheetFormatProperties
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Font, Alignment
+
+# チャート生成処理のバージョン 生成結果が変わる変更をした場合は更新する（キャッシュのキーに含める）
+GENERATOR_VERSION = "3"
 
 # ロガーの初期化
 logging.basicConfig(
@@ -61,8 +92,16 @@ logging.basicConfig(
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
+# FastAPI のライフサイクル
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # チャート生成のワーカープールを起動し、終了時に停止する
+    worker_pool.start()
+    yield
+    worker_pool.shutdown()
+
 # FastAPI の初期化
-app = FastAPI(title="Sweater Chart Generator")
+app = FastAPI(title="Sweater Chart Generator", lifespan=lifespan)
 
 # 編み目記号のEnum
 class Symbol(Enum):
@@ -97,6 +136,15 @@ class Symbol(Enum):
                 return item
         return cls.NONE
 
+# パスを折れ線に近似する際の許容誤差（1目の大きさに対する比率）
+FLATTENING_TOLERANCE = 0.01
+
+# チャートの内外判定の方式のEnum
+class Rasterizer(str, Enum):
+    POINTWISE = "pointwise"     # 判定点ごとに Point を生成する従来の方式（検証用）
+    VECTORIZED = "vectorized"   # 全ての判定点をまとめて判定する方式
+    SCANLINE = "scanline"       # 行ごとに輪郭との交点を求めて区間を塗りつぶす方式
+
 # セーターの形状のEnum
 class SweaterType(str, Enum):
     CREW_NECK_SWEATER = "crew-neck-sweater"
@@ -120,6 +168,22 @@ class Metric(str, Enum):
     INCH = "inch"
     MM = "mm"
 
+# 出力ファイルの形式のEnum
+class OutputFormat(str, Enum):
+    CSV = "csv"
+    XLSX = "xlsx"
+
+    @property
+    def media_type(self) -> str:
+        return {
+            OutputFormat.CSV: "text/csv",
+            OutputFormat.XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        }[self]
+
+    @property
+    def filename(self) -> str:
+        return f"sweater_pattern_data.{self.value}"
+
 class Gauge(BaseModel):
     """ ゲージの幅と高さを表現するクラス """
     metric: Metric = Field(default=Metric.MM, description="寸法の単位")
@@ -362,20 +426,28 @@ class SweaterDimensions(BaseModel):
         """ 袖山の段数"""
         return int(self.length_of_sleeve_cap / self.gauge.stitch_length)
 
+    def _stitches(self, value, stitch: float) -> float:
+        """
+        寸法が stitch の何倍かを返す
+
+        丸めた後の寸法をもう一度丸めても同じ値になるよう、割り算の誤差で整数倍をわずかに下回る場合は整数倍とする
+        """
+        return round(value / stitch, 9)
+
     def _round_to_multiple_stitch_length(self, value) -> float:
         """ 寸法を stitch_length の整数倍に丸める"""
-        return int(value / self.gauge.stitch_length) * self.gauge.stitch_length
+        return int(self._stitches(value, self.gauge.stitch_length)) * self.gauge.stitch_length
 
     def _round_to_multiple_stitch_width(self, value) -> float:
         """ 寸法を stitch_width の整数倍に丸める"""
-        return int(value / self.gauge.stitch_width) * self.gauge.stitch_width
+        return int(self._stitches(value, self.gauge.stitch_width)) * self.gauge.stitch_width
 
     def _round_to_multiple_odd_or_even_stitch_width(self, value) -> float:
         """ 寸法を stitch_width の奇数倍または偶数倍に丸める"""
         if self.is_odd:
-            return int(value / self.gauge.stitch_width / 2) * 2 * self.gauge.stitch_width + self.gauge.stitch_width
+            return int(self._stitches(value, self.gauge.stitch_width) / 2) * 2 * self.gauge.stitch_width + self.gauge.stitch_width
         else:
-            return int(value / self.gauge.stitch_width / 2) * 2 * self.gauge.stitch_width
+            return int(self._stitches(value, self.gauge.stitch_width) / 2) * 2 * self.gauge.stitch_width
 
     def _round_to_multiple_odd_or_even_stitch_width_half(self, value) -> float:
         """ 寸法を stitch_width の(整数+1/2)倍または整数倍に丸める"""
@@ -433,6 +505,101 @@ class SweaterDimensions(BaseModel):
         logger.debug(self)
         return self
 
+    def canonical_hash(self) -> str:
+        """
+        丸めた後の寸法・ゲージ・形状・目数の偶奇と生成処理のバージョンから求めたハッシュ値
+
+        丸めた結果が同じ寸法は同じチャートになるので、生成結果のキャッシュのキーに使う
+        """
+        fields = self.model_dump(mode='json', exclude=set(type(self).model_computed_fields))
+        fields['gauge'] = self.gauge.model_dump(mode='json', exclude=set(Gauge.model_computed_fields))
+        fields['generator_version'] = GENERATOR_VERSION
+        canonical = json.dumps(fields, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# グレーディングで増減できる寸法
+GRADABLE_FIELDS = tuple(
+    name for name in SweaterDimensions.model_fields if name.startswith(("length_of_", "width_of_"))
+)
+
+class SizeGrading(BaseModel):
+    """
+    基準サイズの寸法と1サイズごとの増分から、サイズ展開の寸法を求めるデータモデル
+
+    Args:
+        base (SweaterDimensions): 基準サイズの寸法
+        size_names (list[str]): 小さい順に並べたサイズ名
+        base_size (str): 基準サイズの名前
+        increments (dict[str, float]): 1サイズ大きくなるごとの寸法の増分（GRADABLE_FIELDS のみ）
+    """
+    base: SweaterDimensions = Field(..., description="基準サイズの寸法")
+    size_names: list[Annotated[str, Field(pattern=r"^[A-Za-z0-9_.-]+$")]] = Field(..., description="小さい順のサイズ名", min_length=1)
+    base_size: str = Field(..., description="基準サイズの名前")
+    increments: dict[str, float] = Field(default_factory=dict, description="1サイズごとの寸法の増分")
+
+    @model_validator(mode='after')
+    def _check_sizes(self) -> 'SizeGrading':
+        if len(set(self.size_names)) != len(self.size_names):
+            raise PydanticCustomError('value_error', "size_names must be unique")
+        if self.base_size not in self.size_names:
+            raise PydanticCustomError('value_error', "base_size must be one of size_names")
+        unknown = set(self.increments) - set(GRADABLE_FIELDS)
+        if unknown:
+            raise PydanticCustomError('value_error', "increments has fields that cannot be graded: {fields}", {"fields": sorted(unknown)})
+        return self
+
+    def dimensions(self) -> dict[str, SweaterDimensions]:
+        """
+        サイズ名ごとの寸法を返す
+
+        基準サイズから n サイズ離れたサイズの寸法は、基準サイズの寸法に増分の n 倍を足して丸めたもの
+
+        Raises:
+            ValidationError: いずれかのサイズの寸法が正しくない場合
+        """
+        base_index = self.size_names.index(self.base_size)
+        fields = self.base.model_dump(exclude=set(SweaterDimensions.model_computed_fields) | {"gauge"})
+        sizes = {}
+        for index, name in enumerate(self.size_names):
+            if index == base_index or not self.increments:
+                sizes[name] = self.base
+                continue
+            graded = dict(fields)
+            for field, increment in self.increments.items():
+                graded[field] += (index - base_index) * increment
+            sizes[name] = SweaterDimensions(gauge=self.base.gauge, **graded)
+        return sizes
+
+class ChartRegeneration(BaseModel):
+    """
+    直前の寸法と変更したフィールドから、チャートを差分で再生成するためのデータモデル
+
+    Args:
+        previous (SweaterDimensions): 直前に生成した寸法
+        changes (dict[str, Any]): 変更したフィールドと新しい値
+    """
+    previous: SweaterDimensions = Field(..., description="直前に生成した寸法")
+    changes: dict[str, Any] = Field(..., description="変更したフィールドと新しい値")
+
+    @model_validator(mode='after')
+    def _check_changes(self) -> 'ChartRegeneration':
+        unknown = set(self.changes) - set(SweaterDimensions.model_fields)
+        if unknown:
+            raise PydanticCustomError('value_error', "changes has unknown fields: {fields}", {"fields": sorted(unknown)})
+        return self
+
+    def dimensions(self) -> SweaterDimensions:
+        """
+        変更後の寸法を返す
+
+        Raises:
+            ValidationError: 変更後の寸法が正しくない場合
+        """
+        fields = self.previous.model_dump(exclude=set(SweaterDimensions.model_computed_fields) | {"gauge"})
+        fields["gauge"] = self.previous.gauge
+        fields.update(self.changes)
+        return SweaterDimensions(**fields)
+
 # 検証エラーを捕捉するための例外ハンドラー
 @app.exception_handler(ValidationError)
 async def validation_exception_handler(request: Request, exc: ValidationError):
@@ -449,23 +616,476 @@ async def validation_exception_handler(request: Request, exc: ValidationError):
         content={"detail": "input value is invalid.", "errors": error_details},
     )
 
+# CSV の書き出し
+_CSV_TOKEN_WIDTH = 8
+
+def _build_csv_tokens() -> tuple[np.ndarray, np.ndarray]:
+    """
+    int8 の各値（添字は値 + 128）の10進表記に区切り文字を付けたバイト列を、8バイトに揃えて
+    uint64 として引けるようにした表を生成する
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 表 (2, 256)（[0] はカンマ区切り、[1] は改行区切り）と、値ごとのバイト数 (256,)
+    """
+    tokens = np.zeros((2, 256, _CSV_TOKEN_WIDTH), dtype=np.uint8)
+    lengths = np.zeros(256, dtype=np.uint8)
+    for value in range(-128, 128):
+        token = str(value).encode('ascii')
+        for i, separator in enumerate((b",", b"\n")):
+            tokens[i, value + 128, :len(token) + 1] = np.frombuffer(token + separator, dtype=np.uint8)
+        lengths[value + 128] = len(token) + 1
+    return tokens.view(np.uint64)[..., 0], lengths
+
+_CSV_TOKENS, _CSV_TOKEN_LENGTHS = _build_csv_tokens()
+
+# 一度に書き出すグリッド数の目安
+_CSV_BLOCK_CELLS = 1 << 18
+
+def _as_int8(array: np.ndarray) -> np.ndarray:
+    """
+    記号の番号の配列を int8 の配列として返す（int8 の場合はコピーしない）
+
+    Raises:
+        TypeError: 整数の配列でない場合
+        ValueError: int8 の範囲外の値がある場合
+    """
+    array = np.asarray(array)
+    if array.dtype == np.int8:
+        return array
+    if not (np.issubdtype(array.dtype, np.integer) or array.dtype == np.bool_):
+        raise TypeError(f"chart values must be integers, got {array.dtype}")
+    if array.size > 0 and (array.min() < -128 or array.max() > 127):
+        raise ValueError("chart values must be in the int8 range [-128, 127]")
+    return array.astype(np.int8)
+
+def _write_csv_rows(stream, array: np.ndarray):
+    """
+    整数の二次元配列を、カンマ区切り・改行区切りでバイナリのストリームに書き出す
+
+    int8 に変換し、値ごとの区切り文字付きのバイト列を _CSV_TOKENS から引き、余白のバイトを
+    マスクで取り除く。一定の行数ごとにまとめて書き出す
+    """
+    array = _as_int8(array)
+    h, w = array.shape
+    if h == 0 or w == 0:
+        stream.write(b"\n" * h)
+        return
+
+    positions = np.arange(_CSV_TOKEN_WIDTH, dtype=np.uint8)
+    block_rows = max(1, _CSV_BLOCK_CELLS // w)
+    for start in range(0, h, block_rows):
+        indices = array[start:start + block_rows].view(np.uint8) ^ 0x80 # 値 + 128
+        tokens = np.empty(indices.shape, dtype=np.uint64)
+        tokens[:, :-1] = _CSV_TOKENS[0][indices[:, :-1]]
+        tokens[:, -1] = _CSV_TOKENS[1][indices[:, -1]]
+        mask = positions < _CSV_TOKEN_LENGTHS[indices][..., None]
+        stream.write(tokens.view(np.uint8).reshape(*indices.shape, _CSV_TOKEN_WIDTH)[mask].tobytes())
+
+
+# バイナリ形式のチャート
+# 1件のレコードは、固定長の前置部・JSON のヘッダー・グリッドの順に並び、グリッドとレコードの
+# 末尾は _CHART_FILE_ALIGNMENT バイト境界にそろえる。レコードを続けて書き出したものをアーカイブとする
+CHART_FILE_MAGIC = b"SWCHART\0"
+CHART_FILE_VERSION = 1
+_CHART_FILE_ALIGNMENT = 64
+# 識別子・形式のバージョン・ヘッダーのバイト数
+_CHART_FILE_PREFIX = struct.Struct("<8sHxxI")
+
+def _align(offset: int) -> int:
+    """ offset 以上で最小の _CHART_FILE_ALIGNMENT の倍数を返す """
+    return -(-offset // _CHART_FILE_ALIGNMENT) * _CHART_FILE_ALIGNMENT
+
+# バイナリ形式のグリッドの格納方式のEnum
+class ChartEncoding(str, Enum):
+    RAW = "raw"     # int8 の二次元配列をそのまま格納する（np.memmap で読み込める）
+    RLE = "rle"     # 行ごとの連長圧縮
+
+class ChartFileError(ValueError):
+    """ バイナリ形式のチャートが壊れている、または対応していない形式である """
+
+@dataclass(frozen=True)
+class ChartHeader:
+    """
+    バイナリ形式のチャートのヘッダー
+
+    Args:
+        name (str): パーツ名
+        gauge (Gauge): ゲージ
+        shape (tuple[int, int]): チャートの行数と列数
+        encoding (ChartEncoding): グリッドの格納方式
+        dimensions_hash (str): 生成元の SweaterDimensions.canonical_hash。不明な場合は None
+        generator_version (str): 生成したときの GENERATOR_VERSION
+        num_runs (int): 連長圧縮の連の数（RLE の場合のみ）
+    """
+    name: str
+    gauge: Gauge | None
+    shape: tuple[int, int]
+    encoding: ChartEncoding = ChartEncoding.RAW
+    dimensions_hash: str | None = None
+    generator_version: str = GENERATOR_VERSION
+    num_runs: int = 0
+
+    @property
+    def data_nbytes(self) -> int:
+        """ グリッドのバイト数 """
+        num_rows, num_cols = self.shape
+        if self.encoding is ChartEncoding.RAW:
+            return num_rows * num_cols
+        # 行ごとの連の開始位置（uint32）・連の長さ（uint32）・連の値（int8）
+        return 4 * (num_rows + 1) + 5 * self.num_runs
+
+    def to_json(self) -> bytes:
+        fields = {
+            "name": self.name,
+            "gauge": None if self.gauge is None else self.gauge.model_dump(mode='json', exclude=set(Gauge.model_computed_fields)),
+            "shape": list(self.shape),
+            "encoding": self.encoding.value,
+            "dimensions_hash": self.dimensions_hash,
+            "generator_version": self.generator_version,
+            "num_runs": self.num_runs,
+        }
+        return json.dumps(fields, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def from_json(cls, data: bytes) -> 'ChartHeader':
+        try:
+            fields = json.loads(data)
+            num_rows, num_cols = (int(n) for n in fields["shape"])
+            header = cls(
+                name=fields["name"],
+                gauge=None if fields["gauge"] is None else Gauge.model_validate(fields["gauge"]),
+                shape=(num_rows, num_cols),
+                encoding=ChartEncoding(fields["encoding"]),
+                dimensions_hash=fields.get("dimensions_hash"),
+                generator_version=fields["generator_version"],
+                num_runs=int(fields.get("num_runs", 0)),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ChartFileError(f"invalid chart header: {e}") from e
+        if num_rows < 0 or num_cols < 0:
+            raise ChartFileError(f"invalid chart header: negative shape {header.shape}")
+        if header.num_runs < 0:
+            raise ChartFileError(f"invalid chart header: negative num_runs {header.num_runs}")
+        return header
+
+def _encode_runs(array: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    二次元配列を行ごとに連長圧縮する（連は行をまたがない）
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: 行ごとの連の開始位置（行数 + 1）、連の長さ、連の値
+    """
+    num_rows, num_cols = array.shape
+    flat = np.ascontiguousarray(array).ravel()
+    changes = np.ones(flat.size, dtype=bool)
+    changes[1:] = flat[1:] != flat[:-1]
+    changes[::max(num_cols, 1)] = True
+    starts = np.flatnonzero(changes)
+    lengths = np.diff(np.append(starts, flat.size)).astype(np.uint32)
+    row_offsets = np.searchsorted(starts, np.arange(num_rows + 1) * num_cols).astype(np.uint32)
+    return row_offsets, lengths, flat[starts]
+
+def _decode_runs(lengths: np.ndarray, values: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """ _encode_runs で圧縮した連を二次元配列に戻す """
+    return np.repeat(values, lengths).reshape(shape)
+
+def _write_chart_record(stream, array: np.ndarray | None, header: ChartHeader, runs: tuple | None = None) -> int:
+    """
+    1件のレコードをバイナリのストリームに書き出し、書き出したバイト数を返す
+
+    ヘッダーの直後から数えずレコードの先頭からの位置でそろえるので、ストリームの途中でもよい。
+    RLE の場合は、圧縮済みの連（_encode_runs の戻り値）を runs に渡すと array は使わない
+    """
+    if header.encoding is ChartEncoding.RLE:
+        if runs is None:
+            runs = _encode_runs(array) # type: ignore
+        header = replace(header, num_runs=len(runs[1]))
+    else:
+        runs = None
+
+    header_json = header.to_json()
+    prefix_nbytes = _CHART_FILE_PREFIX.size + len(header_json)
+    data_offset = _align(prefix_nbytes)
+    stream.write(_CHART_FILE_PREFIX.pack(CHART_FILE_MAGIC, CHART_FILE_VERSION, len(header_json)))
+    stream.write(header_json)
+    stream.write(bytes(data_offset - prefix_nbytes))
+
+    if runs is None:
+        stream.write(np.ascontiguousarray(array, dtype=np.int8).tobytes())
+    else:
+        row_offsets, lengths, values = runs
+        stream.write(row_offsets.astype('<u4').tobytes())
+        stream.write(lengths.astype('<u4').tobytes())
+        stream.write(values.astype(np.int8).tobytes())
+
+    end = data_offset + header.data_nbytes
+    stream.write(bytes(_align(end) - end))
+    return _align(end)
+
+def _read_chart_header(buffer, offset: int = 0) -> tuple[ChartHeader, int]:
+    """
+    バッファーの offset の位置からレコードのヘッダーを読み込む
+
+    Returns:
+        tuple[ChartHeader, int]: ヘッダーと、グリッドの先頭の位置
+    """
+    view = memoryview(buffer)
+    if len(view) - offset < _CHART_FILE_PREFIX.size:
+        raise ChartFileError("truncated chart record")
+    magic, version, header_nbytes = _CHART_FILE_PREFIX.unpack_from(view, offset)
+    if magic != CHART_FILE_MAGIC:
+        raise ChartFileError("not a chart record")
+    if version != CHART_FILE_VERSION:
+        raise ChartFileError(f"unsupported chart file version {version}")
+    start = offset + _CHART_FILE_PREFIX.size
+    if len(view) < start + header_nbytes:
+        raise ChartFileError("truncated chart record")
+    header = ChartHeader.from_json(bytes(view[start:start + header_nbytes]))
+    data_offset = offset + _align(_CHART_FILE_PREFIX.size + header_nbytes)
+    if len(view) < data_offset + header.data_nbytes:
+        raise ChartFileError("truncated chart record")
+    return header, data_offset
+
+def _read_row_offsets(buffer, header: ChartHeader, data_offset: int) -> np.ndarray:
+    """
+    RLE のレコードから行ごとの連の開始位置を読み込む
+
+    Raises:
+        ChartFileError: 開始位置が 0 から始まって減少せずに連の数で終わっていない場合
+    """
+    num_rows, _ = header.shape
+    row_offsets = np.frombuffer(buffer, dtype='<u4', count=num_rows + 1, offset=data_offset)
+    if row_offsets[0] != 0 or row_offsets[-1] != header.num_runs or np.any(np.diff(row_offsets.astype(np.int64)) < 0):
+        raise ChartFileError("row offsets do not match the runs")
+    return row_offsets
+
+def _read_chart_record(buffer, offset: int = 0) -> tuple[np.ndarray, ChartHeader, int]:
+    """
+    バッファーの offset の位置からレコードを読み込む
+
+    RAW の場合はバッファーをコピーせずに参照する読み取り専用の配列を返す
+
+    Returns:
+        tuple[np.ndarray, ChartHeader, int]: グリッド、ヘッダー、次のレコードの位置
+    """
+    header, data_offset = _read_chart_header(buffer, offset)
+    num_rows, num_cols = header.shape
+    if header.encoding is ChartEncoding.RAW:
+        array = np.frombuffer(buffer, dtype=np.int8, count=num_rows * num_cols, offset=data_offset)
+        array = array.reshape(header.shape)
+    else:
+        _read_row_offsets(buffer, header, data_offset)
+        lengths_offset = data_offset + 4 * (num_rows + 1)
+        lengths = np.frombuffer(buffer, dtype='<u4', count=header.num_runs, offset=lengths_offset)
+        values = np.frombuffer(buffer, dtype=np.int8, count=header.num_runs, offset=lengths_offset + 4 * header.num_runs)
+        if int(lengths.sum()) != num_rows * num_cols:
+            raise ChartFileError("run lengths do not match the chart shape")
+        array = _decode_runs(lengths, values, header.shape)
+        array.flags.writeable = False
+    return array, header, _align(data_offset + header.data_nbytes)
+
+def _open_chart_buffer(source):
+    """ ファイル名なら読み取り専用でメモリマップし、バイト列などはそのまま返す """
+    if isinstance(source, (str, os.PathLike)):
+        if os.path.getsize(source) == 0:
+            return b""
+        return np.memmap(source, dtype=np.uint8, mode='r')
+    return source
+
+
+# パーツ単位のメモ化
+class PieceMemo:
+    """
+    パーツごとの生成結果を、そのパーツが参照する寸法だけをキーとして保持するメモ
+
+    最近使われていないものから削除し、件数を max_entries 以下に保つ。
+    enabled が False の場合は何も保持せず、get は常に None を返す
+
+    Args:
+        max_entries (int): 保持する件数の上限
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        """ キーに対応する結果を返す。ない場合は None を返す """
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """ 結果を保持し、上限を超えた分を削除する """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+# シェイプとチャートのメモ プロセスプールの場合は親プロセスだけが保持し、ヒット数も親プロセスのもの
+shape_memo = PieceMemo(int(os.environ.get("SWEATER_CHART_PIECE_MEMO_ENTRIES", 128)))
+chart_memo = PieceMemo(int(os.environ.get("SWEATER_CHART_PIECE_MEMO_ENTRIES", 128)))
+
+def _gauge_key(gauge: Gauge) -> tuple:
+    return (gauge.metric.value, gauge.vertical, gauge.horizontal)
+
+def _body_piece_key(data: SweaterDimensions, is_front: bool) -> tuple:
+    """ 身頃のシェイプが参照する寸法 """
+    return (
+        "front_body" if is_front else "back_body",
+        _gauge_key(data.gauge),
+        data.length_of_front_neck_drop if is_front else data.length_of_back_neck_drop,
+        data.length_of_shoulder_drop,
+        data.width_of_shoulder,
+        data.width_of_horizontal_armhole,
+        data.length_of_vertical_armhole,
+        data.width_of_neck,
+        # 脇と裾のゴム編みは1本の直線なので、ゴム編みの長さだけが変わってもシェイプは変わらない
+        data.length_of_body_side + data.length_of_ribbed_hem,
+        data.width_of_body,
+    )
+
+def _sleeve_piece_key(data: SweaterDimensions) -> tuple:
+    """ 袖のシェイプが参照する寸法 """
+    return (
+        "sleeve",
+        _gauge_key(data.gauge),
+        data.length_of_sleeve_cap,
+        data.width_of_sleeve,
+        data.width_of_cuff,
+        data.length_of_sleeve_side,
+        data.length_of_ribbed_cuff,
+    )
+
+
+# パスの組み立て
+class _PathBuilder:
+    """
+    SVG の相対コマンドと同じ要領でセグメントを直接組み立てるクラス
+
+    パス文字列を経由しないので、文字列化と再解析のコストがかからない
+    """
+    def __init__(self):
+        self.segments = []
+        self._start_pos = 0j
+        self._current_pos = 0j
+
+    def move_to(self, x: float, y: float) -> '_PathBuilder':
+        """ M x,y """
+        self._start_pos = self._current_pos = complex(x, y)
+        return self
+
+    def curve_by(self, x1: float, y1: float, x2: float, y2: float, x: float, y: float) -> '_PathBuilder':
+        """ c x1,y1 x2,y2 x,y """
+        control1 = complex(x1, y1) + self._current_pos
+        control2 = complex(x2, y2) + self._current_pos
+        end = complex(x, y) + self._current_pos
+        self.segments.append(CubicBezier(self._current_pos, control1, control2, end))
+        self._current_pos = end
+        return self
+
+    def line_by(self, x: float, y: float) -> '_PathBuilder':
+        """ l x,y """
+        end = complex(x, y) + self._current_pos
+        self.segments.append(Line(self._current_pos, end))
+        self._current_pos = end
+        return self
+
+    def horizontal_by(self, x: float) -> '_PathBuilder':
+        """ h x """
+        end = complex(x, self._current_pos.imag) + self._current_pos.real
+        self.segments.append(Line(self._current_pos, end))
+        self._current_pos = end
+        return self
+
+    def vertical_by(self, y: float) -> '_PathBuilder':
+        """ v y """
+        end = complex(self._current_pos.real, y) + self._current_pos.imag * 1j
+        self.segments.append(Line(self._current_pos, end))
+        self._current_pos = end
+        return self
+
+    def close(self) -> list:
+        """ Z 始点と離れている場合は始点までの直線を追加してセグメントのリストを返す """
+        if self._current_pos != self._start_pos:
+            self.segments.append(Line(self._current_pos, self._start_pos))
+        self._current_pos = self._start_pos
+        return self.segments
+
+
 # シェイプ（型紙）
 class Shape:
-    def __init__(self, path: Path, gauge: Gauge):
-        self.path = path
+    def __init__(self, segments: list, gauge: Gauge, key: tuple | None = None):
+        self.segments = segments
         self.gauge = gauge
 
+        # メモ化のキー（シェイプが参照した寸法） None の場合はメモ化しない
+        self.key = key
+
     def __getattr__(self, name):
-        # クラスにないものは Path に投げる
+        # クラスにないものは Path に投げる（pickle などが参照する特殊属性は除く）
+        if name.startswith('__') or name in ('segments', 'path', 'key'):
+            raise AttributeError(name)
         return getattr(self.path, name)
 
+    @cached_property
+    def path(self) -> Path:
+        """ SVG の出力などで必要になった時点で Path を生成する """
+        return Path(*self.segments)
+
+    def bbox(self) -> Tuple[float, float, float, float]:
+        """ バウンドボックス (xmin, xmax, ymin, ymax) を返す """
+        bboxes = np.array([segment.bbox() for segment in self.segments])
+        return (
+            bboxes[:, 0].min(),
+            bboxes[:, 1].max(),
+            bboxes[:, 2].min(),
+            bboxes[:, 3].max(),
+        )
+
+    def isclosed(self) -> bool:
+        """ 終点が始点と一致する場合に True を返す """
+        return len(self.segments) > 0 and self.segments[0].start == self.segments[-1].end
+
     @classmethod
     def front_body_from(cls, data: SweaterDimensions) -> 'Shape':
-        return cls._body_from(data, is_front=True)
+        return cls._memoized(_body_piece_key(data, is_front=True), lambda: cls._body_from(data, is_front=True))
     
     @classmethod
     def back_body_from(cls, data: SweaterDimensions) -> 'Shape':
-        return cls._body_from(data, is_front=False)
+        return cls._memoized(_body_piece_key(data, is_front=False), lambda: cls._body_from(data, is_front=False))
+
+    @classmethod
+    def _memoized(cls, key: tuple, build) -> 'Shape':
+        """ キーに対応するシェイプがメモにない場合は生成してメモに追加する """
+        shape = shape_memo.get(key)
+        if shape is None:
+            shape = build()
+            shape.key = key
+            shape_memo.put(key, shape)
+        return shape
 
     @classmethod
     def _body_from(cls, data, is_front:bool) -> 'Shape':
@@ -495,54 +1115,62 @@ class Shape:
         horizonal_shoulder_line_width = stitch_num_of_horizonal_shoulder_line * data.gauge.stitch_width
 
         # 身頃のパス
-        path = parse_path(
+        segments = (
+            _PathBuilder()
             # 起点に移動 右の脇下
-            f"M {0} {data.length_of_shoulder_drop + data.length_of_vertical_armhole} "
+            .move_to(0, data.length_of_shoulder_drop + data.length_of_vertical_armhole)
 
             # 袖ぐりの半分までの曲線
-            f"c {data.width_of_horizontal_armhole},0 {data.width_of_horizontal_armhole},-{data.length_of_vertical_armhole / 2} {data.width_of_horizontal_armhole},-{data.length_of_vertical_armhole / 2} "
+            .curve_by(data.width_of_horizontal_armhole, 0, data.width_of_horizontal_armhole, -data.length_of_vertical_armhole / 2, data.width_of_horizontal_armhole, -data.length_of_vertical_armhole / 2)
 
             # 左肩の左端までの垂直な直線
-            f"v -{data.length_of_vertical_armhole / 2} "
+            .vertical_by(-data.length_of_vertical_armhole / 2)
 
             # 左肩の右端の少し前までの直線
-            f"l {data.width_of_shoulder - horizonal_shoulder_line_width},-{data.length_of_shoulder_drop} "
+            .line_by(data.width_of_shoulder - horizonal_shoulder_line_width, -data.length_of_shoulder_drop)
 
             # 襟ぐりの左の上端までの水平な直線
-            f"h {horizonal_shoulder_line_width} "
+            .horizontal_by(horizonal_shoulder_line_width)
 
             # 襟ぐりの下端までの曲線
-            f"c 0,{length_of_neck_drop} {data.width_of_neck / 2},{length_of_neck_drop} {data.width_of_neck / 2},{length_of_neck_drop} "
+            .curve_by(0, length_of_neck_drop, data.width_of_neck / 2, length_of_neck_drop, data.width_of_neck / 2, length_of_neck_drop)
 
             # 襟ぐりの右の上端までの曲線
-            f"c {data.width_of_neck / 2},0 {data.width_of_neck / 2},-{length_of_neck_drop} {data.width_of_neck / 2},-{length_of_neck_drop} "
+            .curve_by(data.width_of_neck / 2, 0, data.width_of_neck / 2, -length_of_neck_drop, data.width_of_neck / 2, -length_of_neck_drop)
 
             # 襟ぐりの右の上端から少し右への水平な直線
-            f"h {horizonal_shoulder_line_width} "
+            .horizontal_by(horizonal_shoulder_line_width)
 
             # 右肩の右端までの直線
-            f"l {data.width_of_shoulder - horizonal_shoulder_line_width},{data.length_of_shoulder_drop} "
+            .line_by(data.width_of_shoulder - horizonal_shoulder_line_width, data.length_of_shoulder_drop)
 
             # 右の襟ぐりの半分までの直線
-            f"v {data.length_of_vertical_armhole / 2} "
+            .vertical_by(data.length_of_vertical_armhole / 2)
 
             # 脇下までの曲線
-            f"c 0,{data.length_of_vertical_armhole / 2} {data.width_of_horizontal_armhole},{data.length_of_vertical_armhole / 2} {data.width_of_horizontal_armhole},{data.length_of_vertical_armhole / 2} "
+            .curve_by(0, data.length_of_vertical_armhole / 2, data.width_of_horizontal_armhole, data.length_of_vertical_armhole / 2, data.width_of_horizontal_armhole, data.length_of_vertical_armhole / 2)
 
             # 裾の右の下端までの垂直な直線
-            f"v {data.length_of_body_side + data.length_of_ribbed_hem} "
+            .vertical_by(data.length_of_body_side + data.length_of_ribbed_hem)
 
             # 裾の端から端までの水平な直線
-            f"h {-data.width_of_body}"
+            .horizontal_by(-data.width_of_body)
 
             # 始点まで
-            f"Z"
+            .close()
         )
         
-        return cls(path, data.gauge)
+        return cls(segments, data.gauge)
 
     @classmethod
     def sleeve_from(cls, data: SweaterDimensions) -> 'Shape':
+        """
+        袖のシェイプ（SVG）を生成する（メモ化あり）
+        """
+        return cls._memoized(_sleeve_piece_key(data), lambda: cls._sleeve_from(data))
+
+    @classmethod
+    def _sleeve_from(cls, data: SweaterDimensions) -> 'Shape':
         """
         袖のシェイプ（SVG）を生成する
 
@@ -555,50 +1183,255 @@ class Shape:
         """
 
         # 袖のパス
-        path = parse_path(
+        segments = (
+            _PathBuilder()
             # 始点 袖山の左端まで移動する
-            f"M {0},{data.length_of_sleeve_cap} "
+            .move_to(0, data.length_of_sleeve_cap)
 
             # 袖山のトップまでの曲線
-            f" c {data.width_of_sleeve/2},{0} {data.width_of_sleeve/2},{-data.length_of_sleeve_cap} {data.width_of_sleeve},{-data.length_of_sleeve_cap} "
+            .curve_by(data.width_of_sleeve/2, 0, data.width_of_sleeve/2, -data.length_of_sleeve_cap, data.width_of_sleeve, -data.length_of_sleeve_cap)
 
             # 袖山の右端までの曲線
-            f" c {data.width_of_sleeve/2},{0} {data.width_of_sleeve/2},{data.length_of_sleeve_cap} {data.width_of_sleeve},{data.length_of_sleeve_cap} "
+            .curve_by(data.width_of_sleeve/2, 0, data.width_of_sleeve/2, data.length_of_sleeve_cap, data.width_of_sleeve, data.length_of_sleeve_cap)
 
             # 右の袖の上端までの斜めの直線
-            f"l {data.width_of_cuff - data.width_of_sleeve},{data.length_of_sleeve_side} "
+            .line_by(data.width_of_cuff - data.width_of_sleeve, data.length_of_sleeve_side)
 
             # 右の袖の上端から下端までの垂直な直線
-            f"v {data.length_of_ribbed_cuff} "
+            .vertical_by(data.length_of_ribbed_cuff)
 
             # 袖の下端の端から端までの水平な直線
-            f"h {-data.width_of_cuff * 2} "
+            .horizontal_by(-data.width_of_cuff * 2)
 
             # 左の袖の下端のから上端での垂直な直線
-            f"v {-data.length_of_ribbed_cuff} "
+            .vertical_by(-data.length_of_ribbed_cuff)
 
             # 始点まで
-            f"Z"
+            .close()
         )
 
-        return cls(path, data.gauge)
+        return cls(segments, data.gauge)
     
     def write_svg(self, filename: str, **kwargs):
         wsvg(self.path, filename=filename, **kwargs)
 
 
+# パターン置換の規則
+@dataclass(frozen=True, eq=False)
+class RewriteRule:
+    """
+    配列中の template に一致する箇所の1点を置換する規則
+
+    Args:
+        template (np.ndarray): 検索するパターン
+        replacement (int): 置換後の値
+        position (Tuple[int, int]): パターン内の置換する位置
+        start_row (int): 判定を開始する行
+        step_rows (int): 判定する行の間隔
+    """
+    template: np.ndarray
+    replacement: int
+    position: Tuple[int, int]
+    start_row: int = 0
+    step_rows: int = 1
+
+    def apply(self, arr: np.ndarray) -> np.ndarray:
+        """
+        一致する全ての箇所を判定してから、arr を直接書き換える
+        """
+        rows, cols = self.template.shape
+        r_y, r_x = self.position
+        h, w = arr.shape
+
+        # 判定不能な場合はそのまま返す
+        if self.start_row > h - rows or cols > w:
+            return arr
+
+        # (判定する行数, w - cols + 1, rows, cols) の窓をコピーせずに作る
+        windows = sliding_window_view(arr, (rows, cols))[self.start_row::self.step_rows]
+        mask = np.all(windows == self.template, axis=(2, 3))
+
+        # mask が True の場所だけ replacement を代入
+        rows_to_change, cols_to_change = np.nonzero(mask)
+        arr[self.start_row + rows_to_change * self.step_rows + r_y, cols_to_change + r_x] = self.replacement
+        return arr
+
+
+# 右上がりの段の上のグリッドを検出するパターン
+_MARKER_1_TEMPLATE = np.array([
+    [Symbol.NONE.number, Symbol.NONE.number],
+    [Symbol.NONE.number, Symbol.KNIT.number]
+    ])
+
+# マーカーの伝播で一度に処理するグリッド数の目安
+_MARKER_BLOCK_CELLS = 1 << 16
+
+# 左上がりの段の上のグリッドを検出するパターン
+_MARKER_2_TEMPLATE = np.array([
+    [Symbol.NONE.number, Symbol.NONE.number],
+    [Symbol.KNIT.number, Symbol.NONE.number]
+    ])
+
+# 伏止・減らし目・増目記号を挿入する規則（この順番で適用する）
+_SYMBOL_RULES = [
+    # 伏止記号
+    RewriteRule(
+        template=np.array([
+            [Symbol.NONE.number],
+            [Symbol.KNIT.number]
+            ]),
+        replacement=Symbol.BO.number,
+        position=(0,0)
+    ),
+    # 右上2目1度記号
+    RewriteRule(
+        template=np.array([
+            [Symbol.KNIT.number, Symbol.BO.number]
+            ]),
+        replacement=Symbol.K2TOG.number,
+        position=(0,1)
+    ),
+    # 左上2目1度記号
+    RewriteRule(
+        template=np.array([
+            [Symbol.BO.number, Symbol.KNIT.number]
+            ]),
+        replacement=Symbol.SSK.number,
+        position=(0,0)
+    ),
+    # 増目記号
+    RewriteRule(
+        template=np.array([
+            [Symbol.KNIT.number, Symbol.KNIT.number],
+            [Symbol.KNIT.number, Symbol.NONE.number]
+            ]),
+        replacement=Symbol.M1.number,
+        position=(0,0)
+    ),
+    RewriteRule(
+        template=np.array([
+            [Symbol.KNIT.number, Symbol.KNIT.number],
+            [Symbol.NONE.number, Symbol.KNIT.number]
+            ]),
+        replacement=Symbol.M1.number,
+        position=(0,1)
+    ),
+]
+
+
+# 記号を決めるために参照する近傍（行方向のずれ, 列方向のずれ）
+# _SYMBOL_RULES を順番に適用すると、あるグリッドの記号は下3行・左右1列の範囲の値で決まる
+_SYMBOL_FOOTPRINT = [(dy, dx) for dy in range(4) for dx in range(-1, 2)]
+
+def _build_symbol_lookup_table() -> np.ndarray:
+    """
+    近傍の符号から記号を引くルックアップテーブルを生成する
+
+    マーカーの伝播後の配列は Symbol.NONE と Symbol.KNIT だけからなるので、近傍の
+    各グリッドが Symbol.KNIT かどうかを1ビットとして符号化できる。全ての符号の近傍を
+    タイル状に並べた配列に _SYMBOL_RULES を一度適用し、各タイルの基準のグリッドの値を
+    テーブルとする
+
+    Returns:
+        np.ndarray: 符号を添字とする記号の番号の配列
+    """
+    num_codes = 2 ** len(_SYMBOL_FOOTPRINT)
+    tile_h = max(dy for dy, _ in _SYMBOL_FOOTPRINT) + 1
+    tile_w = max(dx for _, dx in _SYMBOL_FOOTPRINT) - min(dx for _, dx in _SYMBOL_FOOTPRINT) + 1
+    origin_x = -min(dx for _, dx in _SYMBOL_FOOTPRINT)
+
+    # 1列に num_tiles_x 個のタイルを並べる
+    num_tiles_x = int(np.ceil(np.sqrt(num_codes)))
+    num_tiles_y = int(np.ceil(num_codes / num_tiles_x))
+    tiles = np.full((num_tiles_y * tile_h, num_tiles_x * tile_w), Symbol.NONE.number, dtype=np.int8)
+
+    codes = np.arange(num_codes)
+    tile_y = codes // num_tiles_x * tile_h
+    tile_x = codes % num_tiles_x * tile_w + origin_x
+    for bit, (dy, dx) in enumerate(_SYMBOL_FOOTPRINT):
+        is_knit = (codes >> bit) & 1 == 1
+        tiles[tile_y[is_knit] + dy, tile_x[is_knit] + dx] = Symbol.KNIT.number
+
+    for rule in _SYMBOL_RULES:
+        rule.apply(tiles)
+
+    return tiles[tile_y, tile_x]
+
+_SYMBOL_LOOKUP_TABLE = _build_symbol_lookup_table()
+
+
+# サイズ展開で次のサイズに引き継ぐパーツの生成結果
+@dataclass(frozen=True, eq=False)
+class RasterizedPiece:
+    """
+    Chart.from_shape_reusing の生成結果
+
+    Args:
+        polygon_points (np.ndarray): シェイプを線分に分割した頂点列
+        raster (np.ndarray): 内外判定の結果（編み目記号の挿入前）。再利用できない場合は None
+        chart (Chart): 編み目記号を挿入したチャート（読み取り専用）
+        start_y (float): シェイプのバウンドボックスの上端（グリッドの原点）
+    """
+    polygon_points: np.ndarray
+    raster: np.ndarray | None
+    chart: 'Chart'
+    start_y: float = 0.0
+
 # チャート（編み図）
 class Chart:
     def __init__(self, array: np.ndarray, gauge: Gauge):
         self.array = array
         self.gauge = gauge
 
+        # 先頭に行を追加するために確保済みの領域（self.array はその末尾の行のビュー）
+        self._buffer = array
+        self._headroom = 0
+
     def __getattr__(self, name):
-        # クラスにないものはnp.ndarrayに投げる
+        # クラスにないものはnp.ndarrayに投げる（pickle などが参照する特殊属性は除く）
+        if name.startswith('__') or name == 'array':
+            raise AttributeError(name)
         return getattr(self.array, name)
+
+    def __getstate__(self):
+        # ワーカー間で受け渡す際は確保済みの領域を含めない
+        state = self.__dict__.copy()
+        state['_buffer'] = self.array
+        state['_headroom'] = 0
+        return state
+
+    @classmethod
+    def allocate(cls, shape: Tuple[int, int], gauge: Gauge, headroom: int = 1) -> 'Chart':
+        """
+        先頭に headroom 行を追加できる領域を確保して、Symbol.NONE で埋めた Chart を生成する
+
+        _insert_row_to_top(in_place=True) は確保済みの行を使うので配列をコピーしない
+
+        Args:
+            shape (Tuple[int, int]): チャートの行数と列数
+            gauge (Gauge): ゲージ
+            headroom (int): 先頭に確保しておく行数
+
+        Returns:
+            Chart: 生成されたチャート
+        """
+        num_rows, num_cols = shape
+        buffer = np.full((headroom + num_rows, num_cols), Symbol.NONE.number, dtype=np.int8)
+        chart = cls(buffer[headroom:], gauge)
+        chart._buffer = buffer
+        chart._headroom = headroom
+        return chart
+
+    def _has_headroom(self) -> bool:
+        """ self.array が確保済みの領域のビューのままで、先頭に空きがある場合に True を返す """
+        return (
+            self._headroom > 0
+            and self.array.base is self._buffer
+            and self.array.shape == (self._buffer.shape[0] - self._headroom, self._buffer.shape[1])
+        )
     
     @classmethod
-    def from_shape(cls, shape: Shape) -> 'Chart':
+    def from_shape(cls, shape: Shape, rasterizer: Rasterizer = Rasterizer.VECTORIZED) -> 'Chart':
         """
         Shape の Path オブジェクトを元に Chart を生成します
 
@@ -613,15 +1446,63 @@ class Chart:
 
         Args:
             shape: Shape 
+            rasterizer (Rasterizer): 内外判定の方式
 
         Returns:
             np.ndarray: チャートの二次元配列
         """
+        return cls._memoized(shape, (rasterizer,), lambda: cls._generate_from_shape(shape, rasterizer))
+
+    @classmethod
+    def _memoized(cls, shape: Shape, options: tuple, generate) -> 'Chart':
+        """
+        シェイプのキーと生成時のオプションに対応するチャートがメモにある場合はそのコピーを返す
+
+        ない場合は生成し、コピーを読み取り専用にしてメモに追加する。メモが無効な場合はコピーせずに生成したものを返す
+        """
+        if shape.key is None or not chart_memo.enabled:
+            return generate()
+
+        key = (shape.key, *options)
+        chart = chart_memo.get(key)
+        if chart is not None:
+            return cls(chart.array.copy(), chart.gauge)
+
+        chart = generate()
+        cls._remember(key, chart)
+        return chart
+
+    @classmethod
+    def _remember(cls, key: tuple, chart: 'Chart'):
+        """ チャートのコピーを読み取り専用にしてメモに追加する """
+        if not chart_memo.enabled:
+            return
+        memo = cls(chart.array.copy(), chart.gauge)
+        memo.array.flags.writeable = False
+        chart_memo.put(key, memo)
+
+    @classmethod
+    def memoized_from_shape(cls, shape: Shape, rasterizer: Rasterizer = Rasterizer.VECTORIZED) -> 'Chart | None':
+        """ Chart.from_shape(shape, rasterizer) の結果がメモにある場合はそのコピーを返す。ない場合は None を返す """
+        if shape.key is None:
+            return None
+        chart = chart_memo.get((shape.key, rasterizer))
+        return None if chart is None else cls(chart.array.copy(), chart.gauge)
+
+    @classmethod
+    def memoize_from_shape(cls, shape: Shape, chart: 'Chart', rasterizer: Rasterizer = Rasterizer.VECTORIZED):
+        """ ワーカープロセスで生成した Chart.from_shape(shape, rasterizer) の結果をメモに追加する """
+        if shape.key is not None:
+            cls._remember((shape.key, rasterizer), chart)
+
+    @classmethod
+    def _generate_from_shape(cls, shape: Shape, rasterizer: Rasterizer) -> 'Chart':
+        """ Chart.from_shape の本体（メモ化なし） """
 
         logger.debug(f"<<< Generating chart from shape >>>")
 
         # バウンドボックスのサイズを取得する
-        start_x, end_x, start_y,  end_y = shape.path.bbox()
+        start_x, end_x, start_y,  end_y = shape.bbox()
         width = end_x - start_x
         height = end_y - start_y
 
@@ -635,247 +1516,623 @@ class Chart:
             f"num_grid_height={num_grid_height}\n"
         )
 
-        # グリッドと同じ行列数の配列を生成
-        array = np.zeros((num_grid_height, num_grid_width), dtype=np.int8)
+        # グリッドと同じ行列数の配列を、編み目記号の挿入で追加する行の分も含めて確保する
+        result = cls.allocate((num_grid_height, num_grid_width), shape.gauge)
+        array = result.array
         logger.debug(f"grid_array is created")
 
-        # パス要素からポリゴンを生成
-        polygon = None
-        polygon_points = [] # パスを線分に分割して点を取得
-        num_samples = 100 # サンプリング数
-        for segment in shape.path:
-            if isinstance(segment, (Line, CubicBezier, QuadraticBezier)):
-                for i in range(num_samples + 1):
-                    t = i / num_samples
-                    p = segment.point(t)
-                    polygon_points.append((p.real, p.imag))
-            else: pass
-        # 閉じたパスの場合のみポリゴンとして追加
-        if shape.path.isclosed() and len(polygon_points) >= 3:
-            try:
-                # TopologyException を回避するための裏技
-                polygon = Polygon(polygon_points).buffer(0)
-            except Exception as e:
-                logger.warning(f"Could not create polygon from path due to {e}")
-        else: pass
+        # パスを線分に分割する
+        polygon_points = cls._flatten(shape)
 
-        if not polygon:
+        if not shape.isclosed() or len(polygon_points) < 3:
             # 形状が一つも抽出されなかった場合
             logger.warning(f"No polygon could be created from the shape path. Returning empty chart.")
-            return Chart(array, shape.gauge)
-        
+            return result
+
         # 1目の縦横の長さに対応したグリッドの中心が内側かどうかは判定する
-        for y_index, y_coordinate in enumerate(np.arange(0, height, shape.gauge.stitch_length)):
-            for x_index, x_coordinate in enumerate(np.arange(0, width, shape.gauge.stitch_width)):
-                # 判定点
-                point = Point(float(x_coordinate + shape.gauge.stitch_width / 2), float(y_coordinate + shape.gauge.stitch_length / 2))
-                # 右側の判定点が結合された形状の内部にあるか判定
-                if polygon.contains(point):
-                    # 内部にある場合、グリッドを描画
-                    if x_index < num_grid_width and y_index < num_grid_height:
-                        array[y_index, x_index] = Symbol.KNIT.number
+        if not cls._rasterize(array, shape, polygon_points, width, height, rasterizer):
+            # 形状が一つも抽出されなかった場合
+            logger.warning(f"No polygon could be created from the shape path. Returning empty chart.")
+            return result
 
-        result = cls(array, shape.gauge)
         result._insert_symbol()
 
-        logger.debug(f"grid_array is generated: shape{array.shape[0]} length_of_x={array.shape[1]}")
+        logger.debug(f"grid_array is generated: shape{result.array.shape[0]} length_of_x={result.array.shape[1]}")
         return result
 
-    def _insert_symbol(self) -> np.ndarray:
+    @classmethod
+    def outline_from_shape(cls, shape: Shape, max_rows: int) -> 'Chart':
         """
-        1.伏止め・減らし目が適切な位置になるように、段の位置を
-            a. 右上がりの段は偶数行目にあらわれる
-            b. 左上がりの段は奇数行目にあらわれる
-        に再配置する
-        2.編み目記号を挿入する
+        Shape から、編み目記号を挿入しない内外判定だけの粗いチャートを生成します
+
+        縦横を同じ倍率で粗くしたゲージで、行数が max_rows 以下になるように走査線方式で判定します。
+        内部のグリッドは Symbol.KNIT、外部は Symbol.NONE になります
+
+        Args:
+            shape (Shape): 生成するシェイプ
+            max_rows (int): 粗いチャートの行数の上限
 
         Returns:
-            np.ndarray: 変換後の配列
+            Chart: 粗いゲージのチャート
         """
+        start_x, end_x, start_y, end_y = shape.bbox()
+        width = end_x - start_x
+        height = end_y - start_y
 
-        # === 1. 段の位置を調整する ===
+        # 全体の行数が max_rows 以下になる倍率
+        scale = max(1, math.ceil(int(height / shape.gauge.stitch_length) / max_rows))
+        gauge = shape.gauge.model_copy(update={
+            "vertical": shape.gauge.vertical / scale,
+            "horizontal": shape.gauge.horizontal / scale,
+        })
+        array = np.full((int(height / gauge.stitch_length), int(width / gauge.stitch_width)), Symbol.NONE.number, dtype=np.int8)
 
-        # 1.1 開始行とステップ行数の設定
-        # 右上がりの段のマーカーは奇数行、左上がりの段のマーカーは偶数行に挿入する
-        odd_start_row, even_start_row = 0, 1 # 配列の行数が奇数の場合
-        if self.array.shape[0] % 2 == 0:
-            odd_start_row, even_start_row = 1, 0 # 配列の行数が偶数の場合
+        polygon_points = cls._flatten(shape)
+        if shape.isclosed() and len(polygon_points) >= 3:
+            cls._rasterize_scanline(array, polygon_points, width, height, gauge)
+        return cls(array, gauge)
 
-        step_rows = 2
+    @classmethod
+    def from_shape_sharing_rows(cls, shape: Shape, base_chart: 'Chart', num_differing_rows: int, rasterizer: Rasterizer = Rasterizer.VECTORIZED) -> 'Chart':
+        """
+        上端の num_differing_rows 段以外の輪郭が base_chart の元のシェイプと共通な Shape から
+        Chart を生成します
 
-        # 1.2 右上がりの段の上のグリッドにマーカーを挿入
-        self._replace_in(
-            target_array = np.array([
-                [Symbol.NONE.number, Symbol.NONE.number],
-                [Symbol.NONE.number, Symbol.KNIT.number]
-                ]),
-            replacement=Symbol._MARKER_1.number,
-            replacement_position=(0,1),
-            start_row=odd_start_row,
-            step_rows=step_rows
-        )
+        共通な段は base_chart からコピーし、上端の帯だけ内外判定と編み目記号の挿入を行います。
+        ある段の編み目記号は、その段と下の3段の内外判定の結果で決まるので、帯は
+        num_differing_rows + 4 段とし、段数の偶奇をチャート全体と揃えます。
 
-        # 1.3 左上がりの段の上のグリッドにマーカーを挿入
-        self._replace_in(
-            target_array = np.array([
-                [Symbol.NONE.number, Symbol.NONE.number],
-                [Symbol.KNIT.number, Symbol.NONE.number]
-                ]),
-            replacement=Symbol._MARKER_2.number,
-            replacement_position=(0,0),
-            start_row=even_start_row,
-            step_rows=step_rows
-        )
+        生成結果は Chart.from_shape(shape, rasterizer) と同じなので、同じキーでメモ化する
 
-        # 1.4 マーカーを水平方向のSymbol.NONEに伝播させ、Symbol.NONEがなくなるまで繰り返し、最後にマーカーをSymbol.KNITに置換
-        while True:
-            # 変化前の配列
-            prev_array = self.array.copy()
+        Args:
+            shape (Shape): 生成するシェイプ
+            base_chart (Chart): 共通部分を持つシェイプから Chart.from_shape で生成済みのチャート
+            num_differing_rows (int): 内外判定の結果が異なりうる上端からの段数
+            rasterizer (Rasterizer): 内外判定の方式
 
-            # Symbol._MARKER_1の右にあるSymbol.NONEを見つけて置換
-            self._replace_in(
-                target_array=np.array([
-                    [Symbol._MARKER_1.number, Symbol.NONE.number]
-                    ]),
-                replacement=Symbol._MARKER_1.number,
-                replacement_position=(0,1)
-                )
+        Returns:
+            Chart: 生成されたチャート
+        """
+        return cls._memoized(
+            shape, (rasterizer,),
+            lambda: cls._generate_sharing_rows(shape, base_chart, num_differing_rows, rasterizer)
+        )
 
-            # Symbol._MARKER_2の左にあるSymbol.NONEを見つけて置換
-            self._replace_in(
-                target_array=np.array([
-                    [Symbol.NONE.number, Symbol._MARKER_2.number]
-                    ]),
-                replacement=Symbol._MARKER_2.number,
-                replacement_position=(0,0)
-                )
-            
-            # 変化がなければ終了
-            if np.array_equal(prev_array, self.array):
-                # マーカーを Symbol.KNIT.number に置換
-                self.array[self.array == Symbol._MARKER_1.number] = Symbol.KNIT.number
-                self.array[self.array == Symbol._MARKER_2.number] = Symbol.KNIT.number
-                break
+    @classmethod
+    def _generate_sharing_rows(cls, shape: Shape, base_chart: 'Chart', num_differing_rows: int, rasterizer: Rasterizer) -> 'Chart':
+        """ Chart.from_shape_sharing_rows の本体（メモ化なし） """
+        start_x, end_x, start_y,  end_y = shape.bbox()
+        width = end_x - start_x
+        height = end_y - start_y
 
-        # ===== 2.編み目記号を挿入する =====
+        num_grid_width = int(width / shape.gauge.stitch_width)
+        num_grid_height = int(height / (shape.gauge.stitch_length))
 
-        # 2.1 最上行にSymbol.NONEの行を追加
-        self._insert_row_to_top(fill=Symbol.NONE.number)
-
-        # 2.2 伏止記号の挿入
-        self._replace_in(
-            target_array = np.array([
-                [Symbol.NONE.number],
-                [Symbol.KNIT.number]
-                ]),
-            replacement=Symbol.BO.number,
-            replacement_position=(0,0)
-        )
+        # 帯の段数 段数の偶奇で減らし目の段の位置が変わるので全体と揃える
+        num_band_rows = num_differing_rows + 4
+        num_band_rows += (num_grid_height - num_band_rows) % 2
+
+        polygon_points = cls._flatten(shape)
+        if (
+            base_chart.array.shape != (num_grid_height + 1, num_grid_width)
+            or num_band_rows > num_grid_height
+            or not shape.isclosed()
+            or len(polygon_points) < 3
+        ):
+            # 共通部分を使えない場合は全体を生成する
+            logger.debug(f"rows cannot be shared with base chart. generating the whole chart.")
+            return cls.from_shape(shape, rasterizer=rasterizer)
+
+        logger.debug(f"<<< Generating chart from shape (band of {num_band_rows} rows) >>>")
+
+        # 上端の帯だけ内外判定と編み目記号の挿入を行う
+        band = cls.allocate((num_band_rows, num_grid_width), shape.gauge)
+        if not cls._rasterize(band.array, shape, polygon_points, width, height, rasterizer):
+            return cls.from_shape(shape, rasterizer=rasterizer)
+        band._insert_symbol()
+
+        # 追加した最上行を含めて、帯の上端の num_differing_rows + 1 段と base_chart の残りを繋げる
+        num_new_rows = num_differing_rows + 1
+        array = np.empty_like(base_chart.array)
+        array[:num_new_rows] = band.array[:num_new_rows]
+        array[num_new_rows:] = base_chart.array[num_new_rows:]
+
+        return cls(array, shape.gauge)
 
-        # 2.3 右上2目1度記号の挿入
-        self._replace_in(
-            target_array = np.array([
-                [Symbol.KNIT.number, Symbol.BO.number]
-                ]),
-            replacement=Symbol.K2TOG.number,
-            replacement_position=(0,1)
-        )
+    @classmethod
+    def from_shape_reusing(cls, shape: Shape, previous: RasterizedPiece | None, rasterizer: Rasterizer = Rasterizer.VECTORIZED) -> RasterizedPiece:
+        """
+        直前に生成した同じパーツ（隣のサイズなど）の結果を再利用して Shape から Chart を生成します
 
-        # 2.4 左上2目1度記号の挿入
-        self._replace_in(
-            target_array = np.array([
-                [Symbol.BO.number, Symbol.KNIT.number]
-                ]),
-            replacement=Symbol.SSK.number,
-            replacement_position=(0,0)
-        )
+        輪郭の辺のうち previous と共通でない辺が通る段だけ内外判定を行い、残りの段は previous の
+        判定結果をコピーします。編み目記号は、判定結果が上端から揃っている段（段数の差が偶数の場合）と
+        下端から揃っている段を previous のチャートからコピーし、残りの帯だけ挿入します
 
-        # 2.5 増目記号の挿入
-        self._replace_in(
-            target_array = np.array([
-                [Symbol.KNIT.number, Symbol.KNIT.number],
-                [Symbol.KNIT.number, Symbol.NONE.number]
-                ]),
-            replacement=Symbol.M1.number,
-            replacement_position=(0,0)
-        )
-        self._replace_in(
-            target_array = np.array([
-                [Symbol.KNIT.number, Symbol.KNIT.number],
-                [Symbol.NONE.number, Symbol.KNIT.number]
-                ]),
-            replacement=Symbol.M1.number,
-            replacement_position=(0,1)
-        )
+        生成結果は Chart.from_shape(shape, rasterizer) と同じ
 
-        return self.array
+        Args:
+            shape (Shape): 生成するシェイプ
+            previous (RasterizedPiece): 直前に生成した結果。None の場合は全体を生成する
+            rasterizer (Rasterizer): 内外判定の方式
+
+        Returns:
+            RasterizedPiece: 生成結果（次のサイズの previous に渡す）
+        """
+        start_x, end_x, start_y, end_y = shape.bbox()
+        width = end_x - start_x
+        height = end_y - start_y
+        num_grid_width = int(width / shape.gauge.stitch_width)
+        num_grid_height = int(height / shape.gauge.stitch_length)
+
+        polygon_points = cls._flatten(shape)
+        if not shape.isclosed() or len(polygon_points) < 3:
+            return RasterizedPiece(polygon_points, None, cls._generate_from_shape(shape, rasterizer), start_y)
+
+        if (
+            previous is not None
+            and previous.raster is not None
+            and previous.raster.shape[1] == num_grid_width
+            and previous.chart.gauge == shape.gauge
+            and previous.start_y == start_y
+        ):
+            raster = np.full((num_grid_height, num_grid_width), Symbol.NONE.number, dtype=np.int8)
+            differing = cls._differing_rows(polygon_points, previous.polygon_points, height, shape.gauge, num_grid_height)
+            num_shared = min(num_grid_height, previous.raster.shape[0])
+            differing[num_shared:] = True
+            shared = ~differing[:num_shared]
+            raster[:num_shared][shared] = previous.raster[:num_shared][shared]
+            logger.debug(f"reusing {int(shared.sum())} of {num_grid_height} rasterized rows")
+        else:
+            raster = np.full((num_grid_height, num_grid_width), Symbol.NONE.number, dtype=np.int8)
+            differing = np.ones(num_grid_height, dtype=bool)
+            previous = None
+
+        # 内外判定が必要な段を、連続する区間ごとに判定する
+        bounds = np.flatnonzero(np.diff(np.r_[0, differing.astype(np.int8), 0]))
+        for first_row, end_row in zip(bounds[::2].tolist(), bounds[1::2].tolist()):
+            if not cls._rasterize(raster[first_row:end_row], shape, polygon_points, width, height, rasterizer, first_row):
+                return RasterizedPiece(polygon_points, None, cls._generate_from_shape(shape, rasterizer), start_y)
+
+        chart = cls._insert_symbol_reusing(raster, previous, shape.gauge)
+        chart.array.flags.writeable = False
+        raster.flags.writeable = False
+        return RasterizedPiece(polygon_points, raster, chart, start_y)
+
+    @staticmethod
+    def _differing_rows(polygon_points: np.ndarray, other_points: np.ndarray, height: float, gauge: Gauge, num_rows: int) -> np.ndarray:
+        """
+        2つの輪郭で内外判定の結果が異なりうる段を返す
+
+        ある段の判定結果は、その段の中心の y 座標を通る辺だけで決まるので、
+        一方の輪郭にしかない辺が通る段を異なりうる段とする。
+        中心が辺の上にある判定点は誤差程度の違いでも結果が変わるので、
+        座標が完全に一致する辺だけを共通の辺とする
+
+        Returns:
+            np.ndarray: 段ごとの真偽値 (num_rows,)
+        """
+        def edges(points):
+            return np.column_stack([points, np.roll(points, -1, axis=0)])
+
+        edges_a, edges_b = edges(polygon_points), edges(other_points)
+        set_a, set_b = set(map(tuple, edges_a.tolist())), set(map(tuple, edges_b.tolist()))
+        unique = np.array(
+            [edge for edge in edges_a.tolist() if tuple(edge) not in set_b]
+            + [edge for edge in edges_b.tolist() if tuple(edge) not in set_a]
+        ).reshape(-1, 4)
+
+        _, y_centers = Chart._grid_centers(0, height, gauge, (num_rows, 0))
+        eps = gauge.stitch_length * 1e-6
+        low = np.minimum(unique[:, 1], unique[:, 3]) - eps
+        high = np.maximum(unique[:, 1], unique[:, 3]) + eps
+        y = y_centers[:, None]
+        differing = ((low <= y) & (y <= high)).any(axis=1)
+        # 判定点の数が足りない場合（浮動小数点の誤差）も判定し直す
+        return np.pad(differing, (0, num_rows - len(differing)), constant_values=True)
+
+    @classmethod
+    def _insert_symbol_reusing(cls, raster: np.ndarray, previous: RasterizedPiece | None, gauge: Gauge) -> 'Chart':
+        """
+        内外判定の結果に編み目記号を挿入したチャートを返す
+
+        ある段の編み目記号はその段と下の3段の判定結果と、下端からの段数の偶奇で決まるので、
+        previous と判定結果が下端から揃っている段と、段数の差が偶数の場合に上端から揃っている
+        段（の下3段を除く）は previous のチャートからコピーする
+        """
+        num_rows, num_cols = raster.shape
+        if previous is None or previous.raster is None or previous.raster.shape[1] != num_cols or num_rows == 0:
+            result = cls.allocate((num_rows, num_cols), gauge)
+            result.array[...] = raster
+            result._insert_symbol()
+            return result
+
+        previous_raster = previous.raster
+        num_previous_rows = previous_raster.shape[0]
+        num_shared = min(num_rows, num_previous_rows)
+
+        # 上端・下端から揃っている段数
+        top_equal = (raster[:num_shared] == previous_raster[:num_shared]).all(axis=1)
+        num_top = num_shared if top_equal.all() else int(np.argmin(top_equal))
+        bottom_equal = (raster[num_rows - num_shared:] == previous_raster[num_previous_rows - num_shared:]).all(axis=1)[::-1]
+        num_bottom = num_shared if bottom_equal.all() else int(np.argmin(bottom_equal))
+
+        # 上端の段は、段数の差が偶数で、追加する最上行が参照する3段が揃っている場合だけ再利用する
+        reuse_top = (num_rows - num_previous_rows) % 2 == 0 and num_top >= 3
+        band_start = num_top - 3 if reuse_top else 0
+        band_end = max(num_rows - num_bottom, band_start)
+        if not reuse_top:
+            # 追加する最上行は帯と一緒に挿入する
+            band_end = max(band_end, 1)
+
+        array = np.empty((num_rows + 1, num_cols), dtype=np.int8)
+        if band_end > band_start:
+            # 帯の下に参照する3段を含め、下端からの段数の偶奇を全体と揃える
+            band_bottom = min(num_rows, band_end + 3)
+            band_bottom += (num_rows - band_bottom) % 2
+            band = cls.allocate((band_bottom - band_start, num_cols), gauge)
+            band.array[...] = raster[band_start:band_bottom]
+            band._insert_symbol()
+            array[1 + band_start:1 + band_end] = band.array[1:1 + band_end - band_start]
+            if not reuse_top:
+                array[0] = band.array[0]
+
+        if reuse_top:
+            array[:1 + band_start] = previous.chart.array[:1 + band_start]
+        offset = num_previous_rows - num_rows
+        array[1 + band_end:] = previous.chart.array[1 + band_end + offset:]
+        return cls(array, gauge)
+
+    @classmethod
+    def _rasterize(cls, array: np.ndarray, shape: Shape, polygon_points: np.ndarray, width: float, height: float, rasterizer: Rasterizer, first_row: int = 0) -> bool:
+        """
+        array の各グリッドの中心がシェイプの内部にある場合に Symbol.KNIT を書き込む
+
+        array が全体の first_row 行目からの一部の行の場合は、その行だけを判定する
+
+        Returns:
+            bool: ポリゴンを生成できなかった場合は False
+        """
+        if rasterizer is Rasterizer.SCANLINE:
+            # 走査線方式は Shapely を経由しない
+            cls._rasterize_scanline(array, polygon_points, width, height, shape.gauge, first_row)
+            return True
+
+        # パス要素からポリゴンを生成
+        polygon = cls._polygon_from(shape, polygon_points)
+        if not polygon:
+            return False
+
+        if rasterizer is Rasterizer.POINTWISE:
+            cls._rasterize_pointwise(array, polygon, width, height, shape.gauge, first_row)
+        else:
+            cls._rasterize_vectorized(array, polygon, width, height, shape.gauge, first_row)
+        return True
+
+    @classmethod
+    def _flatten(cls, shape: Shape) -> np.ndarray:
+        """
+        Shape の Path を線分に分割した頂点列を返す
+
+        直線は両端の2点、曲線は曲率に応じた分割数で分割し、近似誤差が
+        1目の縦横の短い方の FLATTENING_TOLERANCE 倍以下になるようにする
+
+        Returns:
+            np.ndarray: 頂点の座標 (頂点数, 2)
+        """
+        tolerance = min(shape.gauge.stitch_width, shape.gauge.stitch_length) * FLATTENING_TOLERANCE
+
+        polygon_points = [] # パスを線分に分割して点を取得
+        for segment in shape.segments:
+            if isinstance(segment, (Line, CubicBezier, QuadraticBezier)):
+                # 終点は次のセグメントの始点と重なるので含めない
+                polygon_points.append(cls._flatten_segment(segment, tolerance)[:-1])
+            else: pass
+        if not polygon_points:
+            return np.empty((0, 2), dtype=float)
+
+        points = np.concatenate(polygon_points)
+        return np.column_stack([points.real, points.imag])
+
+    @staticmethod
+    def _flatten_segment(segment, tolerance: float) -> np.ndarray:
+        """
+        セグメントを許容誤差以内の折れ線に分割する
+
+        次数 d のベジェ曲線を n 等分した折れ線の誤差は
+        d(d-1)/8 * max|P[i+2] - 2P[i+1] + P[i]| / n^2 以下なので、これが
+        許容誤差以下となる最小の n を分割数とする
+
+        Returns:
+            np.ndarray: 頂点の複素座標 (分割数 + 1,)
+        """
+        control_points = np.array(segment.bpoints(), dtype=complex)
+        degree = len(control_points) - 1
+
+        if degree < 2:
+            num_samples = 1
+        else:
+            second_difference = np.abs(np.diff(control_points, n=2)).max()
+            num_samples = int(np.ceil(np.sqrt(degree * (degree - 1) * second_difference / (8 * tolerance))))
+            num_samples = max(num_samples, 1)
+
+        # バーンスタイン多項式で全ての点を一度に評価する
+        t = np.linspace(0, 1, num_samples + 1)[:, None]
+        i = np.arange(degree + 1)
+        binomial = np.array([math.comb(degree, k) for k in i])
+        basis = binomial * t ** i * (1 - t) ** (degree - i)
+        return basis @ control_points
+
+    @classmethod
+    def _polygon_from(cls, shape: Shape, polygon_points: np.ndarray):
+        """
+        頂点列から Shapely の Polygon を生成する
+
+        Returns:
+            Polygon: 生成したポリゴン。生成できない場合は None
+        """
+        polygon = None
+        # 閉じたパスの場合のみポリゴンとして追加
+        if shape.isclosed() and len(polygon_points) >= 3:
+            try:
+                # TopologyException を回避するための裏技
+                polygon = Polygon(polygon_points).buffer(0)
+            except Exception as e:
+                logger.warning(f"Could not create polygon from path due to {e}")
+        else: pass
+        return polygon
+
+    @staticmethod
+    def _grid_centers(width: float, height: float, gauge: Gauge, shape: Tuple[int, int], first_row: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        各グリッドの中心（判定点）の x 座標と y 座標を返す
+
+        first_row を指定した場合は、全体の first_row 行目からの行の y 座標を返す
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 列ごとの x 座標、行ごとの y 座標
+        """
+        num_grid_height, num_grid_width = shape
+        x_centers = np.arange(0, width, gauge.stitch_width)[:num_grid_width] + gauge.stitch_width / 2
+        y_centers = np.arange(0, height, gauge.stitch_length)[first_row:first_row + num_grid_height] + gauge.stitch_length / 2
+        return x_centers, y_centers
+
+    @staticmethod
+    def _rasterize_pointwise(array: np.ndarray, polygon, width: float, height: float, gauge: Gauge, first_row: int = 0):
+        """ 判定点ごとに Point を生成して内外判定する（検証用の従来の方式） """
+        num_grid_height, num_grid_width = array.shape
+        for y_index, y_coordinate in enumerate(np.arange(0, height, gauge.stitch_length)[first_row:]):
+            for x_index, x_coordinate in enumerate(np.arange(0, width, gauge.stitch_width)):
+                # 判定点
+                point = Point(float(x_coordinate + gauge.stitch_width / 2), float(y_coordinate + gauge.stitch_length / 2))
+                # 右側の判定点が結合された形状の内部にあるか判定
+                if polygon.contains(point):
+                    # 内部にある場合、グリッドを描画
+                    if x_index < num_grid_width and y_index < num_grid_height:
+                        array[y_index, x_index] = Symbol.KNIT.number
+
+    @classmethod
+    def _rasterize_vectorized(cls, array: np.ndarray, polygon, width: float, height: float, gauge: Gauge, first_row: int = 0):
+        """ 準備済みのジオメトリに対して全ての判定点をまとめて内外判定する """
+        x_centers, y_centers = cls._grid_centers(width, height, gauge, array.shape, first_row)
+        xx, yy = np.meshgrid(x_centers, y_centers)
+
+        shapely.prepare(polygon)
+        inside = shapely.contains_xy(polygon, xx, yy)
+        array[inside] = Symbol.KNIT.number
+
+    @classmethod
+    def _rasterize_scanline(cls, array: np.ndarray, polygon_points: np.ndarray, width: float, height: float, gauge: Gauge, first_row: int = 0):
+        """
+        各行の中心の y 座標で輪郭の辺との交点を求め、偶奇規則で交点の間の列を塗りつぶす
+
+        計算量は 行数 × 辺の数 で、列数に依存しない
+        """
+        x_centers, y_centers = cls._grid_centers(width, height, gauge, array.shape, first_row)
+
+        # 始点に戻る辺を含めた全ての辺 (辺の数,)
+        x0, y0 = polygon_points[:, 0], polygon_points[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+
+        # 走査線と交差する辺 (行数, 辺の数)  頂点の二重計上を避けるため半開区間で判定する
+        y = y_centers[:, None]
+        crosses = (y0 <= y) != (y1 <= y)
+
+        # 交点の x 座標 交差しない辺は NaN として末尾に並べる
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        x_cross = np.sort(np.where(crosses, x_cross, np.nan), axis=1)
+
+        # 交点を2つずつ組にして区間の左端・右端とする
+        num_spans = x_cross.shape[1] // 2
+        left = x_cross[:, 0:2 * num_spans:2]
+        right = x_cross[:, 1:2 * num_spans:2]
+        span_rows, span_index = np.nonzero(~np.isnan(left) & ~np.isnan(right))
+
+        # 区間の内部に中心がある列の範囲 [start_col, end_col)
+        start_col = np.searchsorted(x_centers, left[span_rows, span_index], side='right')
+        end_col = np.searchsorted(x_centers, right[span_rows, span_index], side='left')
+
+        # 差分配列の累積和で区間を塗りつぶす
+        num_grid_height, num_grid_width = array.shape
+        diff = np.zeros((num_grid_height, num_grid_width + 1), dtype=np.int32)
+        np.add.at(diff, (span_rows, start_col), 1)
+        np.add.at(diff, (span_rows, end_col), -1)
+        inside = np.cumsum(diff[:, :-1], axis=1) > 0
+        array[inside] = Symbol.KNIT.number
+
+    def _insert_symbol(self, use_lookup_table: bool = True) -> np.ndarray:
+        """
+        1.伏止め・減らし目が適切な位置になるように、段の位置を
+            a. 右上がりの段は偶数行目にあらわれる
+            b. 左上がりの段は奇数行目にあらわれる
+        に再配置する
+        2.編み目記号を挿入する
+
+        Args:
+            use_lookup_table (bool): 近傍の符号とルックアップテーブルで記号を決める。
+                False の場合は _SYMBOL_RULES を順番に適用する
+
+        Returns:
+            np.ndarray: 変換後の配列
+        """
+
+        # === 1. 段の位置を調整する ===
+
+        # 1.1 開始行とステップ行数の設定
+        # 右上がりの段のマーカーは奇数行、左上がりの段のマーカーは偶数行に挿入する
+        odd_start_row, even_start_row = 0, 1 # 配列の行数が奇数の場合
+        if self.array.shape[0] % 2 == 0:
+            odd_start_row, even_start_row = 1, 0 # 配列の行数が偶数の場合
+
+        step_rows = 2
+
+        # 1.2 右上がりの段の上のグリッドにマーカーを挿入
+        # 1.3 左上がりの段の上のグリッドにマーカーを挿入
+        self._rewrite([
+            RewriteRule(
+                template=_MARKER_1_TEMPLATE,
+                replacement=Symbol._MARKER_1.number,
+                position=(0,1),
+                start_row=odd_start_row,
+                step_rows=step_rows
+            ),
+            RewriteRule(
+                template=_MARKER_2_TEMPLATE,
+                replacement=Symbol._MARKER_2.number,
+                position=(0,0),
+                start_row=even_start_row,
+                step_rows=step_rows
+            ),
+        ])
+
+        # 1.4 マーカーを水平方向のSymbol.NONEに伝播させ、最後にマーカーをSymbol.KNITに置換
+        self._propagate_markers()
+
+        # ===== 2.編み目記号を挿入する =====
+
+        # 2.1 最上行にSymbol.NONEの行を追加
+        self._insert_row_to_top(fill=Symbol.NONE.number, in_place=True)
+
+        # 2.2 - 2.5 伏止・減らし目・増目記号の挿入
+        if use_lookup_table:
+            self._classify_neighborhoods()
+        else:
+            self._rewrite(_SYMBOL_RULES)
+
+        return self.array
+
+    def _classify_neighborhoods(self) -> np.ndarray:
+        """
+        各グリッドの近傍を整数に符号化し、_SYMBOL_LOOKUP_TABLE から記号を引く
+
+        配列が Symbol.NONE と Symbol.KNIT だけからなることを前提とする。
+        範囲外は Symbol.NONE として扱う（どの規則も範囲外が Symbol.NONE の場合には一致しない）
+        """
+        arr = self.array
+        h, w = arr.shape
+        pad_bottom = max(dy for dy, _ in _SYMBOL_FOOTPRINT)
+        pad_left = -min(dx for _, dx in _SYMBOL_FOOTPRINT)
+        pad_right = max(dx for _, dx in _SYMBOL_FOOTPRINT)
+
+        is_knit = np.zeros((h + pad_bottom, w + pad_left + pad_right), dtype=np.uint16)
+        is_knit[:h, pad_left:pad_left + w] = arr == Symbol.KNIT.number
+
+        code = np.zeros((h, w), dtype=np.uint16)
+        for bit, (dy, dx) in enumerate(_SYMBOL_FOOTPRINT):
+            code |= is_knit[dy:dy + h, pad_left + dx:pad_left + dx + w] << bit
+
+        arr[...] = _SYMBOL_LOOKUP_TABLE[code]
+        return arr
+
+    def _propagate_markers(self) -> np.ndarray:
+        """
+        Symbol._MARKER_1 を右に、Symbol._MARKER_2 を左に、連続する Symbol.NONE が
+        途切れるまで伝播させ、全てのマーカーを Symbol.KNIT に置換する
+
+        伝播後の各 Symbol.NONE は、左側で最も近い Symbol.NONE 以外の値が
+        Symbol._MARKER_1 であるか、右側で最も近い Symbol.NONE 以外の値が
+        Symbol._MARKER_2 である場合にマーカーになる。これを各行の前方・後方への
+        累積最大値で一度に求める
+        """
+        arr = self.array
+        h, w = arr.shape
+        if arr.size == 0:
+            return arr
+
+        # 行ごとに独立なので数行ずつ処理し、一時配列を _MARKER_BLOCK_CELLS 程度の大きさに抑える
+        index_dtype = np.int16 if w < np.iinfo(np.int16).max else np.int32
+        col_indices = np.arange(w, dtype=index_dtype)
+        block_rows = max(1, _MARKER_BLOCK_CELLS // w)
+        for start in range(0, h, block_rows):
+            block = arr[start:start + block_rows]
+            is_none = block == Symbol.NONE.number
+            row_indices = np.arange(block.shape[0])[:, None]
+
+            # 左側で最も近い Symbol.NONE 以外の値（なければ Symbol.NONE）
+            left_indices = np.maximum.accumulate(np.where(is_none, -1, col_indices), axis=1)
+            left_values = np.where(left_indices >= 0, block[row_indices, left_indices], Symbol.NONE.number)
+
+            # 右側で最も近い Symbol.NONE 以外の値（なければ Symbol.NONE）  行を反転して同様に求める
+            reversed_block = block[:, ::-1]
+            right_indices = np.maximum.accumulate(np.where(is_none[:, ::-1], -1, col_indices), axis=1)
+            right_values = np.where(right_indices >= 0, reversed_block[row_indices, right_indices], Symbol.NONE.number)[:, ::-1]
+
+            spread = is_none & ((left_values == Symbol._MARKER_1.number) | (right_values == Symbol._MARKER_2.number))
+
+            # マーカーを Symbol.KNIT.number に置換
+            block[spread] = Symbol.KNIT.number
+            block[block == Symbol._MARKER_1.number] = Symbol.KNIT.number
+            block[block == Symbol._MARKER_2.number] = Symbol.KNIT.number
+        return arr
 
     def _replace_in(self, 
                 target_array: np.ndarray, 
                 replacement: int, 
                 replacement_position: Tuple[int, int],
                 start_row: int = 0,
-                step_rows: int = 1) -> np.ndarray:
+                step_rows: int = 1,
+                in_place: bool = False) -> np.ndarray:
         """
         指定した行範囲・ステップで target_array に一致するパターンを検索し、
         特定の1点 (replacement_position) を置換する。
+
+        in_place が True の場合は、コピーせずに self.array を直接書き換える
         """
-        rows, cols = target_array.shape
-        r_y, r_x = replacement_position
-        
-        arr = self.array
-        h, w = arr.shape
-        
-        # --- 1. 判定範囲の決定 ---
-        # 判定を開始できる最終行のインデックス
-        last_possible_row = h - rows
-        
-        # start_row から last_possible_row までの範囲で step_rows ごとにインデックスを作成
-        if start_row > last_possible_row:
-            return arr # 判定不能な場合はそのまま返す
-            
-        row_indices = np.arange(start_row, last_possible_row + 1, step_rows)
-        
-        # --- 2. マスクの作成 ---
-        # マスクの形状は (選択された行数, w - cols + 1)
-        mask_h = len(row_indices)
-        mask_w = w - cols + 1
-        final_mask = np.ones((mask_h, mask_w), dtype=bool)
-        
-        for y in range(rows):
-            for x in range(cols):
-                # 行方向は row_indices を起点に y ずらした位置を参照
-                # 列方向は 0 から (w - cols + x + 1) まで
-                # np.ix_ を使うと不連続なインデックス（step）での抽出がスムーズです
-                selected_rows = row_indices + y
-                slice_part = arr[selected_rows[:, None], np.arange(x, w - cols + x + 1)]
-                
-                final_mask &= (slice_part == target_array[y, x])
-        
-        # --- 3. 置換の実行 ---
-        result = arr.copy()
-        
-        # 置換対象の y 座標を計算 (各判定開始行 + replacement_positionのy)
-        replace_y_indices = row_indices + r_y
-        # 置換対象の x 座標の範囲
-        replace_x_start = r_x
-        replace_x_end = w - cols + r_x + 1
-        
-        # mask が True の場所だけ replacement を代入
-        rows_to_change, cols_to_change = np.where(final_mask)
-        
-        actual_y = replace_y_indices[rows_to_change]
-        actual_x = replace_x_start + cols_to_change
-        
-        result[actual_y, actual_x] = replacement
-        
+        result = self.array if in_place else self.array.copy()
+        RewriteRule(
+            template=target_array,
+            replacement=replacement,
+            position=replacement_position,
+            start_row=start_row,
+            step_rows=step_rows
+        ).apply(result)
+
         self.array = result
         return result
+
+    def _rewrite(self, rules: list['RewriteRule']) -> np.ndarray:
+        """
+        置換規則を順番に配列へ直接適用する
+
+        各規則は直前の規則を適用した後の配列に対して判定する
+        """
+        for rule in rules:
+            rule.apply(self.array)
+        return self.array
     
-    def _insert_row_to_top(self, fill: int) -> np.ndarray:
+    def _insert_row_to_top(self, fill: int, in_place: bool = False) -> np.ndarray:
         """
         配列の先頭に fill の行を挿入する
+
+        in_place が True で、Chart.allocate で確保した行が残っている場合は
+        コピーせずに確保済みの行を使う
         """
+        if in_place and self._has_headroom():
+            self._headroom -= 1
+            self.array = self._buffer[self._headroom:]
+            self.array[0] = fill
+            return self.array
+
         result = self.array.copy()
         result = np.insert(result, 0, fill, axis=0)
         self.array = result
@@ -887,10 +2144,13 @@ class Chart:
         start_row: int = 0, 
         end_row: int = None, # type: ignore
         start_col: int = 0, 
-        end_col: int = None # type: ignore
+        end_col: int = None, # type: ignore
+        in_place: bool = False
     ):
         """
         指定された矩形範囲に、patternを繰り返し挿入する
+
+        in_place が True の場合は、コピーせずに self.array を直接書き換える
         """
         # 範囲の終点が未指定の場合は、グリッドの端までとする
         if end_row is None:
@@ -916,22 +2176,22 @@ class Chart:
         final_patch = tiled[:target_h, :target_w]
 
         # 3. 指定された矩形範囲を上書き
-        result = self.array.copy()
+        result = self.array if in_place else self.array.copy()
         result[start_row:end_row, start_col:end_col] = final_patch
 
         self.array = result
         return result
         
-    def symmetrize_rows(self, start_row: int = 0, end_row: int = None, based_on_right: bool = False) -> np.ndarray: # type: ignore
+    def symmetrize_rows(self, start_row: int = 0, end_row: int = None, based_on_right: bool = False, in_place: bool = False) -> np.ndarray: # type: ignore
         """
         チャートの指定された範囲の行を片側を基準にして左右対称にする
+
+        in_place が True の場合は、コピーせずに self.array を直接書き換える
         """
         if end_row is None:
             end_row = self.array.shape[0]
 
-        print(self.array.shape)
-
-        result = self.array.copy()
+        result = self.array if in_place else self.array.copy()
 
         # 列数が偶数か奇数かで中心列の位置が変わる
         if self.array.shape[1] % 2 == 0:
@@ -951,157 +2211,2021 @@ class Chart:
         self.array = result
         return result
 
-    def write_csv(self, filename: str):
-        """ チャートをCSVファイルに書き出す """
-        np.savetxt(
-            filename,
-            self.array,
-            fmt='%d',
-            delimiter=','
-        )
+    def replace_vertical_stripes_below(self, start_row: int, symbol: int, stripe_symbol: int, in_place: bool = False) -> np.ndarray:
+        """
+        start_row 以降の段の symbol を、奇数列だけ stripe_symbol に置換して縦縞にする（ゴム編み）
 
-class XLSX():
-    def __init__(self, xlsx: openpyxl.Workbook):
-        self._xlsx = xlsx
+        symbol 以外のグリッド（シェイプの外側など）は変更しない
 
-    def __getattr__(self, name):
-        # クラスにないものはopenpyxl.Workbookに投げる
-        return getattr(self._xlsx, name)
+        in_place が True の場合は、コピーせずに self.array を直接書き換える
+        """
+        result = self.array if in_place else self.array.copy()
 
-    @classmethod
-    def from_charts(cls, charts: dict[str, Chart]) -> 'XLSX':
-        # TODO
+        rows = result[max(start_row, 0):]
+        stripe = np.zeros(rows.shape[1], dtype=bool)
+        stripe[1::2] = True
+        rows[(rows == symbol) & stripe] = stripe_symbol
 
-        keys = np.array(list(charts.keys()))
-        num_charts = keys.shape[0]
+        self.array = result
+        return result
 
-        # 先頭のチャートからゲージを取得
-        gauge = charts[keys[0]].gauge
+    def count(self, symbol: int, per_row: bool = False):
+        """
+        symbol のグリッドの数を数える
 
-        gauge_info = [
-            ["metric", gauge.metric.name],
-            ["gauge of vertical", gauge.vertical],
-            ["horizontal", gauge.horizontal]
-        ]
+        per_row が True の場合は行ごとの数の配列を返す
+        """
+        matches = self.array == symbol
+        return matches.sum(axis=1) if per_row else int(matches.sum())
 
-        wb = openpyxl.load_workbook("template.xlsx")
-        ws = wb.active
-        if ws is None:
-            raise ValueError
-        ws.title = "info"
+    def row_runs(self):
+        """ 行ごとに、同じ値が続く区間の (値, 長さ) のリストを返す """
+        for row in self.array:
+            yield _runs(row)
 
-        # 先頭2列を固定列にする
-        num_frozen_cols = 2
+    def to_runs(self) -> 'RunLengthChart':
+        """ 行ごとの連長圧縮で保持するチャートに変換する """
+        return RunLengthChart.from_array(self.array, self.gauge)
 
-        for i in range(num_charts):
-            chart = charts[keys[i]]
-            ws = wb.create_sheet(keys[i])
-            for i, row in enumerate(range(chart.array.shape[0])):
-                for j, col in enumerate(range(num_frozen_cols,chart.array.shape[1] + num_frozen_cols)):
-                    ws.cell(row=row+1, column=col+1).value = chart.array[i, j]
+    def write_csv(self, filename, header: str = ''):
+        """
+        チャートをCSVファイルに書き出す
 
-        if wb is None:
-            raise ValueError
-        else:
-            return cls(wb)
-        
-    def save(self, filename: str):
-        return self._xlsx.save(filename)
-        
+        Args:
+            filename: ファイル名、またはバイナリのストリーム
+            header (str): 先頭に「# 」を付けて書き出す見出し
+        """
+        if isinstance(filename, (str, os.PathLike)):
+            with open(filename, 'wb') as f:
+                self.write_csv(f, header=header)
+            return
 
-    
-    
-@app.post("/generate_sweater_chart", response_description="generated file")
-async def main(sweaterDimensions: SweaterDimensions, is_debug=False):
-    """
-    Pydanticモデルで受け取ったデータから生成したファイルを送信する
-    
-    Args:
-        data (SweaterDimensions): 検証済みの寸法データクラス
-    """
+        if header:
+            filename.write(f"# {header}\n".encode('utf-8'))
+        _write_csv_rows(filename, self.array)
 
-    file_path = generate_file(sweaterDimensions)
+    @staticmethod
+    def write_csv_charts(stream, charts: dict[str, 'Chart']):
+        """
+        複数のチャートを、パーツ名の見出しを付けて1つのバイナリのストリームに続けて書き出す
 
-    background = BackgroundTasks()
-    background.add_task(cleanup_file(file_path))
+        Args:
+            stream: バイナリのストリーム
+            charts (dict[str, Chart]): パーツ名とチャート
+        """
+        for name, chart in charts.items():
+            chart.write_csv(stream, header=name)
 
-    try:
-        # 1. コアロジックを実行し、一時ファイルのパスを取得
-        file_path = generate_file(sweaterDimensions)
-        
-        # 2. FileResponseでファイルをクライアントに送信
-        return FileResponse(
-            path=file_path, 
-            filename="sweater_pattern_data.csv",
-            media_type="text/csv", # TODO .xlsx .pdf
-            background=background # 送信後にファイルを削除するタスクを設定
-        )
+    def write_binary(self, filename, name: str = '', dimensions_hash: str | None = None, encoding: ChartEncoding = ChartEncoding.RAW) -> int:
+        """
+        チャートをバイナリ形式で書き出す
 
-    except Exception as e:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-        raise HTTPException(status_code=500, detail=f"ファイル生成中にエラーが発生しました: {str(e)}")
+        Args:
+            filename: ファイル名、またはバイナリのストリーム
+            name (str): パーツ名
+            dimensions_hash (str): 生成元の SweaterDimensions.canonical_hash
+            encoding (ChartEncoding): グリッドの格納方式
 
-def cleanup_file(file_path: str):
-    import os
-    def _cleanup():
-        # ファイルが存在することを確認してから削除
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    return _cleanup
-    
-    if data.body_shape_type is BodyType.STANDARD:
-        front_body_shape = generate_shape_of_sweater_body(data)
-
-    def __call__(self):
-        import os
-        if os.path.exists(self.file_path):
-            os.remove(self.file_path)
-            print(f"一時ファイル {self.file_path} を削除しました。")
-        else:
-            print(f"一時ファイル {self.file_path} は既に存在しませんでした。")
+        Returns:
+            int: 書き出したバイト数
+        """
+        if isinstance(filename, (str, os.PathLike)):
+            with open(filename, 'wb') as f:
+                return self.write_binary(f, name=name, dimensions_hash=dimensions_hash, encoding=encoding)
 
-def generate_file(data: SweaterDimensions) -> str:
-    """
-    データから生成した一時ファイルのパスを返す
+        header = ChartHeader(name=name, gauge=self.gauge, shape=self.array.shape, encoding=encoding, dimensions_hash=dimensions_hash)
+        return _write_chart_record(filename, self.array, header)
 
-    Args:
-        data (SweaterDimensions): 検証済みの寸法データクラス
+    def to_binary(self, name: str = '', dimensions_hash: str | None = None, encoding: ChartEncoding = ChartEncoding.RAW) -> bytes:
+        """ バイナリ形式の内容を返す """
+        stream = io.BytesIO()
+        self.write_binary(stream, name=name, dimensions_hash=dimensions_hash, encoding=encoding)
+        return stream.getvalue()
 
-    Returns:
-        str: 一時ファイルのパス
-    
-    """
-    # TODO メイン処理
-    front_body_shape = Shape.front_body_from(data)
-    back_body_shape = Shape.back_body_from(data)
-    sleeve_shape = Shape.sleeve_from(data)
+    @classmethod
+    def read_binary(cls, source, offset: int = 0) -> tuple['Chart', ChartHeader]:
+        """
+        バイナリ形式のチャートを読み込む
 
-    front_body_chart = Chart.from_shape(front_body_shape)
-    back_body_chart = Chart.from_shape(back_body_shape)
-    sleeve_chart = Chart.from_shape(sleeve_shape)
+        ファイル名を渡した場合はメモリマップし、RAW 形式のグリッドはコピーせずにそのまま参照する。
+        読み込んだチャートは読み取り専用になる
 
-    start_row_of_ribbed_hem = int((data.length_of_body - data.length_of_ribbed_hem) / data.gauge.stitch_length)
-    start_row_of_ribbed_cuff = int((data.length_of_sleeve - data.length_of_ribbed_cuff) / data.gauge.stitch_length)
+        Args:
+            source: ファイル名、またはバイト列などバッファープロトコルに対応したオブジェクト
+            offset (int): レコードの先頭の位置
 
-    (
-        front_body_chart
-            .replace_vertical_stripes_below(front_body_chart, start_row_of_ribbed_hem, Symbol.KNIT.number, Symbol.PURL.number)
-    )
+        Returns:
+            tuple[Chart, ChartHeader]: チャートとヘッダー
+        """
+        array, header, _ = _read_chart_record(_open_chart_buffer(source), offset)
+        return cls(array, header.gauge), header
 
-    (
-        back_body_chart
-            .replace_vertical_stripes_below(back_body_chart, start_row_of_ribbed_hem, Symbol.KNIT.number, Symbol.PURL.number)
-    )
+    @staticmethod
+    def write_binary_charts(stream, charts: dict[str, 'Chart'], dimensions_hash: str | None = None, encoding: ChartEncoding = ChartEncoding.RAW) -> int:
+        """
+        複数のチャートを、パーツ名をヘッダーに入れて1つのアーカイブに続けて書き出す
 
-    (
-        sleeve_chart
-            .replace_vertical_stripes_below(sleeve_chart, start_row_of_ribbed_cuff, Symbol.KNIT.number, Symbol.PURL.number)
-    )
+        Args:
+            stream: ファイル名、またはバイナリのストリーム
+            charts (dict[str, Chart]): パーツ名とチャート
+            dimensions_hash (str): 生成元の SweaterDimensions.canonical_hash
+            encoding (ChartEncoding): グリッドの格納方式
+
+        Returns:
+            int: 書き出したバイト数
+        """
+        if isinstance(stream, (str, os.PathLike)):
+            with open(stream, 'wb') as f:
+                return Chart.write_binary_charts(f, charts, dimensions_hash=dimensions_hash, encoding=encoding)
+
+        return sum(
+            chart.write_binary(stream, name=name, dimensions_hash=dimensions_hash, encoding=encoding)
+            for name, chart in charts.items()
+        )
+
+    @classmethod
+    def read_binary_charts(cls, source) -> dict[str, 'Chart']:
+        """
+        write_binary_charts で書き出したアーカイブを読み込む
 
+        Args:
+            source: ファイル名、またはバイト列などバッファープロトコルに対応したオブジェクト
+
+        Returns:
+            dict[str, Chart]: パーツ名とチャート
+        """
+        buffer = _open_chart_buffer(source)
+        charts = {}
+        offset = 0
+        while offset < len(buffer):
+            array, header, offset = _read_chart_record(buffer, offset)
+            charts[header.name] = cls(array, header.gauge)
+        return charts
+
+def _merge_runs(values: np.ndarray, lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ 長さ 0 の連を除き、隣り合う同じ値の連を1つにまとめる """
+    keep = lengths > 0
+    values, lengths = values[keep], lengths[keep]
+    if values.size == 0:
+        return values, lengths
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    return values[starts], np.add.reduceat(lengths, starts)
+
+def _slice_runs(values: np.ndarray, lengths: np.ndarray, start: int, stop: int) -> tuple[np.ndarray, np.ndarray]:
+    """ 1行の連から、start 列目から stop 列目の手前までを切り出す """
+    ends = np.cumsum(lengths)
+    begins = ends - lengths
+    keep = (ends > start) & (begins < stop)
+    clipped = np.minimum(ends[keep], stop) - np.maximum(begins[keep], start)
+    return values[keep], clipped.astype(lengths.dtype)
+
+def _concat_runs(*parts: tuple[np.ndarray, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """ 1行の連をつなげる """
+    values = np.concatenate([part[0] for part in parts])
+    lengths = np.concatenate([part[1] for part in parts])
+    return _merge_runs(values, lengths)
+
+def _reverse_runs(runs: tuple[np.ndarray, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """ 1行の連を左右反転する """
+    return runs[0][::-1], runs[1][::-1]
+
+class RunLengthChart:
+    """
+    行ごとに (値, 長さ) の連で保持するチャート
+
+    チャートの行は大部分が KNIT か NONE の長い連で、減らし目や伏止は端に少しあるだけなので、
+    メモリ使用量と各処理の計算量は目数ではなく連の数で決まる。
+    Chart と同じ名前の操作と書き出しに対応する（in_place は常に True として扱う）
+
+    Args:
+        rows (list[tuple[np.ndarray, np.ndarray]]): 行ごとの連の値（int8）と長さ（int32）
+        num_cols (int): 列数
+        gauge (Gauge): ゲージ
+    """
+    def __init__(self, rows: list[tuple[np.ndarray, np.ndarray]], num_cols: int, gauge: Gauge):
+        self.rows = rows
+        self.num_cols = num_cols
+        self.gauge = gauge
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, gauge: Gauge) -> 'RunLengthChart':
+        row_offsets, lengths, values = _encode_runs(_as_int8(array))
+        lengths = lengths.astype(np.int32)
+        rows = [
+            (values[start:stop], lengths[start:stop])
+            for start, stop in zip(row_offsets[:-1].tolist(), row_offsets[1:].tolist())
+        ]
+        return cls(rows, array.shape[1], gauge)
+
+    def to_array(self) -> np.ndarray:
+        if not self.rows:
+            return np.empty((0, self.num_cols), dtype=np.int8)
+        _, lengths, values = self.encoded_runs()
+        return _decode_runs(lengths, values, self.shape)
+
+    def to_chart(self) -> Chart:
+        return Chart(self.to_array(), self.gauge)
+
+    def encoded_runs(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ _encode_runs と同じ形式（行ごとの連の開始位置、連の長さ、連の値）で返す """
+        counts = [len(values) for values, _ in self.rows]
+        row_offsets = np.zeros(len(self.rows) + 1, dtype=np.uint32)
+        np.cumsum(counts, out=row_offsets[1:])
+        lengths = np.concatenate([lengths for _, lengths in self.rows] or [np.empty(0, np.int32)])
+        values = np.concatenate([values for values, _ in self.rows] or [np.empty(0, np.int8)])
+        return row_offsets, lengths.astype(np.uint32), values.astype(np.int8)
 
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (len(self.rows), self.num_cols)
 
+    @property
+    def num_runs(self) -> int:
+        return sum(len(values) for values, _ in self.rows)
 
-    tmp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', encoding='utf-8', newline='')
-    return tmp_file.name
-    
\ No newline at end of file
+    @property
+    def nbytes(self) -> int:
+        return sum(values.nbytes + lengths.nbytes for values, lengths in self.rows)
+
+    def row_runs(self):
+        """ 行ごとに、同じ値が続く区間の (値, 長さ) のリストを返す """
+        for values, lengths in self.rows:
+            yield list(zip(values.tolist(), lengths.tolist()))
+
+    def count(self, symbol: int, per_row: bool = False):
+        """
+        symbol のグリッドの数を数える
+
+        per_row が True の場合は行ごとの数の配列を返す
+        """
+        counts = np.array([int(lengths[values == symbol].sum()) for values, lengths in self.rows], dtype=np.int64)
+        return counts if per_row else int(counts.sum())
+
+    def _row_range(self, start_row: int, end_row: int | None) -> range:
+        return range(*slice(start_row, end_row).indices(len(self.rows)))
+
+    def replace_vertical_stripes_below(self, start_row: int, symbol: int, stripe_symbol: int, in_place: bool = True) -> 'RunLengthChart':
+        """
+        start_row 以降の段の symbol を、奇数列だけ stripe_symbol に置換して縦縞にする（ゴム編み）
+
+        symbol の連は1目ずつの連に分かれる（ゴム編みの段だけ連の数が目数に比例する）
+        """
+        for i in self._row_range(max(start_row, 0), None):
+            values, lengths = self.rows[i]
+            is_symbol = values == symbol
+            if not is_symbol.any():
+                continue
+            # symbol の連は1目ずつに分け、それ以外の連はそのまま残す
+            pieces = np.where(is_symbol, lengths, 1)
+            first_piece = np.cumsum(pieces) - pieces
+            index_in_run = np.arange(pieces.sum()) - np.repeat(first_piece, pieces)
+            cols = np.repeat(np.cumsum(lengths) - lengths, pieces) + index_in_run
+            split = np.repeat(is_symbol, pieces)
+            new_values = np.repeat(values, pieces)
+            new_values[split & (cols % 2 == 1)] = stripe_symbol
+            new_lengths = np.where(split, 1, np.repeat(lengths, pieces)).astype(lengths.dtype)
+            self.rows[i] = _merge_runs(new_values, new_lengths)
+        return self
+
+    def insert_pattern_repeatedly(
+        self,
+        pattern: np.ndarray,
+        start_row: int = 0,
+        end_row: int = None, # type: ignore
+        start_col: int = 0,
+        end_col: int = None, # type: ignore
+        in_place: bool = True
+    ) -> 'RunLengthChart':
+        """
+        指定された矩形範囲に、patternを繰り返し挿入する
+
+        Chart と同じく、範囲がチャートからはみ出す場合は ValueError を送出する
+        """
+        if end_row is None:
+            end_row = len(self.rows)
+        if end_col is None:
+            end_col = self.num_cols
+        target_w = end_col - start_col
+        if end_row - start_row <= 0 or target_w <= 0:
+            return self
+        if start_row < 0 or end_row > len(self.rows) or start_col < 0 or end_col > self.num_cols:
+            raise ValueError(
+                f"pattern range rows [{start_row}, {end_row}) cols [{start_col}, {end_col}) "
+                f"is outside the chart of shape {self.shape}"
+            )
+        rows = range(start_row, end_row)
+
+        # パターンの各行を横に並べた連を一度だけ作る
+        reps_x = int(np.ceil(target_w / pattern.shape[1]))
+        tiled_rows = []
+        for pattern_row in pattern:
+            _, lengths, values = _encode_runs(pattern_row[None, :])
+            tiled = _merge_runs(np.tile(values, reps_x), np.tile(lengths.astype(np.int32), reps_x))
+            tiled_rows.append(_slice_runs(*tiled, 0, target_w))
+
+        for k, i in enumerate(rows):
+            row = self.rows[i]
+            self.rows[i] = _concat_runs(
+                _slice_runs(*row, 0, start_col),
+                tiled_rows[k % len(tiled_rows)],
+                _slice_runs(*row, end_col, self.num_cols),
+            )
+        return self
+
+    def symmetrize_rows(self, start_row: int = 0, end_row: int = None, based_on_right: bool = False, in_place: bool = True) -> 'RunLengthChart': # type: ignore
+        """ チャートの指定された範囲の行を片側を基準にして左右対称にする """
+        # 列数が偶数か奇数かで中心列の位置が変わる
+        center_col_end = self.num_cols // 2
+        center_col_start = center_col_end + self.num_cols % 2
+
+        for i in self._row_range(start_row, end_row):
+            row = self.rows[i]
+            center = _slice_runs(*row, center_col_end, center_col_start)
+            if based_on_right:
+                # 右側を基準に左側を反転
+                left = _slice_runs(*row, 0, center_col_end)
+                self.rows[i] = _concat_runs(left, center, _reverse_runs(left))
+            else:
+                # 左側を基準に右側を反転
+                right = _slice_runs(*row, center_col_start, self.num_cols)
+                self.rows[i] = _concat_runs(_reverse_runs(right), center, right)
+        return self
+
+    def write_csv(self, filename, header: str = ''):
+        """
+        チャートをCSVファイルに書き出す（Chart.write_csv と同じ内容）
+
+        一定の行数ごとに連を展開し、Chart と同じ _write_csv_rows の表引きで書き出す
+
+        Args:
+            filename: ファイル名、またはバイナリのストリーム
+            header (str): 先頭に「# 」を付けて書き出す見出し
+        """
+        if isinstance(filename, (str, os.PathLike)):
+            with open(filename, 'wb') as f:
+                self.write_csv(f, header=header)
+            return
+
+        if header:
+            filename.write(f"# {header}\n".encode('utf-8'))
+        block_rows = max(1, _CSV_BLOCK_CELLS // max(self.num_cols, 1))
+        for start in range(0, len(self.rows), block_rows):
+            block = self.rows[start:start + block_rows]
+            _write_csv_rows(filename, np.stack([np.repeat(values, lengths) for values, lengths in block]))
+
+    def write_binary(self, filename, name: str = '', dimensions_hash: str | None = None, encoding: ChartEncoding = ChartEncoding.RLE) -> int:
+        """
+        チャートをバイナリ形式で書き出す（RLE の場合は連をそのまま書き出す）
+
+        Returns:
+            int: 書き出したバイト数
+        """
+        if isinstance(filename, (str, os.PathLike)):
+            with open(filename, 'wb') as f:
+                return self.write_binary(f, name=name, dimensions_hash=dimensions_hash, encoding=encoding)
+
+        header = ChartHeader(name=name, gauge=self.gauge, shape=self.shape, encoding=encoding, dimensions_hash=dimensions_hash)
+        if encoding is ChartEncoding.RLE:
+            return _write_chart_record(filename, None, header, runs=self.encoded_runs())
+        return _write_chart_record(filename, self.to_array(), header)
+
+    def to_binary(self, name: str = '', dimensions_hash: str | None = None, encoding: ChartEncoding = ChartEncoding.RLE) -> bytes:
+        """ バイナリ形式の内容を返す """
+        stream = io.BytesIO()
+        self.write_binary(stream, name=name, dimensions_hash=dimensions_hash, encoding=encoding)
+        return stream.getvalue()
+
+    @classmethod
+    def read_binary(cls, source, offset: int = 0) -> tuple['RunLengthChart', ChartHeader]:
+        """
+        バイナリ形式のチャートを読み込む（RLE の場合はグリッドに展開せずに連を読み込む）
+
+        Args:
+            source: ファイル名、またはバイト列などバッファープロトコルに対応したオブジェクト
+            offset (int): レコードの先頭の位置
+        """
+        buffer = _open_chart_buffer(source)
+        header, data_offset = _read_chart_header(buffer, offset)
+        if header.encoding is not ChartEncoding.RLE:
+            array, header, _ = _read_chart_record(buffer, offset)
+            return cls.from_array(array, header.gauge), header
+
+        num_rows, num_cols = header.shape
+        row_offsets = _read_row_offsets(buffer, header, data_offset)
+        lengths_offset = data_offset + 4 * (num_rows + 1)
+        lengths = np.frombuffer(buffer, dtype='<u4', count=header.num_runs, offset=lengths_offset).astype(np.int32)
+        values = np.frombuffer(buffer, dtype=np.int8, count=header.num_runs, offset=lengths_offset + 4 * header.num_runs).copy()
+        rows = [
+            (values[start:stop], lengths[start:stop])
+            for start, stop in zip(row_offsets[:-1].tolist(), row_offsets[1:].tolist())
+        ]
+        if any(int(row_lengths.sum()) != num_cols for _, row_lengths in rows):
+            raise ChartFileError("run lengths do not match the chart shape")
+        return cls(rows, num_cols, header.gauge), header
+
+# XLSX のテンプレートのパス 既定では main.py と同じディレクトリの template.xlsx
+TEMPLATE_PATH = os.environ.get(
+    "SWEATER_CHART_TEMPLATE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "template.xlsx")
+)
+
+@lru_cache(maxsize=1)
+def _load_template() -> bytes | None:
+    """
+    XLSX のテンプレートを読み込む（プロセスごとに一度だけ読み込む）
+
+    テンプレートがない場合は None を返し、info シートを空にして書き出す
+    """
+    try:
+        with open(TEMPLATE_PATH, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        logger.warning(f"{TEMPLATE_PATH} is not found. writing XLSX with an empty info sheet.")
+        return None
+
+# テンプレートのセルから書き写す書式
+_TEMPLATE_CELL_STYLES = ("font", "fill", "border", "alignment", "number_format", "protection")
+
+@dataclass(frozen=True)
+class XLSXTemplate:
+    """
+    テンプレートの info シートから書き出しに必要な内容だけを取り出したもの
+
+    書き込み専用のワークブックはテンプレートを直接開けないため、値・書式・結合セル・行の高さ・列幅・
+    入力規則をここから書き写す
+    """
+    rows: tuple[tuple[tuple[Any, tuple] | None, ...], ...]  # 各行のセルの (値, 書式)。空のセルは None
+    column_widths: tuple[tuple[str, float], ...]            # (列名, 幅)
+    row_heights: tuple[tuple[int, float], ...]              # (行番号, 高さ)
+    merged_ranges: tuple[str, ...]                          # 結合セルの範囲
+    data_validations: tuple[DataValidation, ...]            # 入力規則
+
+    @classmethod
+    def empty(cls) -> 'XLSXTemplate':
+        """ テンプレートがない場合の空の内容 """
+        return cls(rows=(), column_widths=(), row_heights=(), merged_ranges=(), data_validations=())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'XLSXTemplate':
+        ws = openpyxl.load_workbook(io.BytesIO(data)).active
+        if ws is None:
+            raise ValueError
+        return cls(
+            rows=tuple(
+                tuple(
+                    (cell.value, tuple(copy.copy(getattr(cell, name)) for name in _TEMPLATE_CELL_STYLES))
+                    if cell.value is not None or cell.has_style else None
+                    for cell in row
+                )
+                for row in ws.iter_rows()
+            ),
+            column_widths=tuple(
+                (key, dim.width) for key, dim in ws.column_dimensions.items() if dim.width is not None
+            ),
+            row_heights=tuple(
+                (index, dim.height) for index, dim in ws.row_dimensions.items() if dim.height is not None
+            ),
+            merged_ranges=tuple(str(merged) for merged in ws.merged_cells.ranges),
+            data_validations=tuple(ws.data_validations.dataValidation)
+        )
+
+    def write_to(self, ws):
+        """ 書き込み専用のシートにテンプレートの内容を書き写す """
+        for key, width in self.column_widths:
+            ws.column_dimensions[key].width = width
+        for index, height in self.row_heights:
+            ws.row_dimensions[index].height = height
+        for merged in self.merged_ranges:
+            ws.merged_cells.add(merged)
+        for validation in self.data_validations:
+            ws.data_validations.append(copy.copy(validation))
+        for row in self.rows:
+            ws.append([self._write_only_cell(ws, cell) for cell in row])
+
+    @staticmethod
+    def _write_only_cell(ws, cell: tuple[Any, tuple] | None) -> 'WriteOnlyCell | None':
+        if cell is None:
+            return None
+        value, styles = cell
+        write_only_cell = WriteOnlyCell(ws, value=value)
+        for name, style in zip(_TEMPLATE_CELL_STYLES, styles):
+            setattr(write_only_cell, name, style)
+        return write_only_cell
+
+@lru_cache(maxsize=1)
+def _parse_template() -> XLSXTemplate:
+    """ XLSX のテンプレートを解析する（プロセスごとに一度だけ解析する） """
+    data = _load_template()
+    return XLSXTemplate.empty() if data is None else XLSXTemplate.from_bytes(data)
+
+# XLSX で記号ごとに付ける塗りつぶしの色（RGB）。None は塗りつぶさない
+_SYMBOL_FILLS: dict[Symbol, str | None] = {
+    Symbol.NONE: "BFBFBF",
+    Symbol.KNIT: None,
+    Symbol.PURL: "F2F2F2",
+    Symbol.M1: "C6EFCE",
+    Symbol.K2TOG: "DDEBF7",
+    Symbol.P2TOG: "DDEBF7",
+    Symbol.SSK: "FCE4D6",
+    Symbol.SSP: "FCE4D6",
+    Symbol.CO: "FFF2CC",
+    Symbol.BO: "F8CBAD",
+    Symbol.HOLD: "E4DFEC",
+}
+
+# XLSX で記号を表示するフォント。記号の幅が揃う等幅の日本語フォントを使う
+_SYMBOL_FONT_NAME = "MS Gothic"
+
+# XLSX のチャートの行の高さ（ポイント）
+XLSX_ROW_HEIGHT = 15.0
+
+def _symbol_named_styles() -> dict[int, NamedStyle]:
+    """
+    記号ごとの名前付きスタイルを作る
+
+    値は数値のまま残し、表示形式で記号を表示する。ワークブックごとに一度だけ登録し、
+    セルからは名前で参照するので、セルの数によらずスタイルは記号の数だけになる
+    """
+    styles = {}
+    for symbol, color in _SYMBOL_FILLS.items():
+        # 正・負・0 のいずれの値でも記号だけを表示する
+        text = '"' + symbol.char.replace('"', '""') + '"'
+        styles[symbol.number] = NamedStyle(
+            name=f"symbol_{symbol.name.lower()}",
+            number_format=";".join([text] * 3),
+            fill=PatternFill("solid", fgColor=color) if color is not None else PatternFill(),
+            font=Font(name=_SYMBOL_FONT_NAME),
+            alignment=Alignment(horizontal="center", vertical="center"),
+        )
+    return styles
+
+def _runs(row: np.ndarray) -> list[tuple[int, int]]:
+    """ 行を同じ値が続く区間に分け、(値, 長さ) のリストを返す """
+    if row.size == 0:
+        return []
+    starts = np.flatnonzero(np.diff(row)) + 1
+    bounds = np.concatenate(([0], starts, [row.size]))
+    return list(zip(row[bounds[:-1]].tolist(), np.diff(bounds).tolist()))
+
+def _square_column_width(gauge: Gauge | None, row_height: float = XLSX_ROW_HEIGHT) -> float | None:
+    """
+    1目の縦横比に合わせた列幅（文字数単位）を返す
+
+    行の高さ row_height（ポイント）を 96dpi のピクセルに直し、目の幅と高さの比を掛けた
+    ピクセル数を Excel の列幅（既定のフォントで 1文字 7px、余白 5px）に換算する
+    """
+    if gauge is None or gauge.stitch_length <= 0:
+        return None
+    pixels = row_height * 4 / 3 * gauge.stitch_width / gauge.stitch_length
+    return max(pixels - 5, 0) / 7
+
+class XLSX():
+    # チャートの前に空ける列数（先頭2列は固定列）
+    NUM_FROZEN_COLS = 2
+
+    def __init__(self, xlsx: openpyxl.Workbook):
+        self._xlsx = xlsx
+
+    def __getattr__(self, name):
+        # クラスにないものはopenpyxl.Workbookに投げる
+        if name == "_xlsx":
+            raise AttributeError(name)
+        return getattr(self._xlsx, name)
+
+    @classmethod
+    def from_charts(cls, charts: dict[str, 'Chart | RunLengthChart'], write_only: bool = True, styled: bool = True) -> 'XLSX':
+        """
+        チャートをパーツごとのシートに書き出したワークブックを作る
+
+        Args:
+            charts (dict[str, Chart | RunLengthChart]): パーツ名とチャート
+            write_only (bool): 書き込み専用のワークブックに行単位で追記する。
+                メモリ使用量がシートの大きさによらずほぼ一定になる。
+                False のときはテンプレートをそのまま開き、書き出し前に編集できるワークブックを返す。
+                テンプレートがない場合は、どちらも空の info シートから始める
+            styled (bool): 記号ごとの名前付きスタイルで記号と色を表示し、セルを目の縦横比に合わせる。
+                False のときは数値だけを書き出す
+        """
+        if write_only:
+            template = _parse_template()
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet("info")
+            template.write_to(ws)
+        else:
+            data = _load_template()
+            wb = openpyxl.Workbook() if data is None else openpyxl.load_workbook(io.BytesIO(data))
+            ws = wb.active
+            if ws is None:
+                raise ValueError
+            ws.title = "info"
+
+        styles = {}
+        if styled:
+            styles = _symbol_named_styles()
+            for style in styles.values():
+                wb.add_named_style(style)
+
+        for name, chart in charts.items():
+            ws = wb.create_sheet(name)
+            if styled:
+                cls._format_chart_sheet(ws, chart)
+            if write_only:
+                cls._append_chart(ws, chart, styles)
+            else:
+                cls._write_chart(ws, chart, styles)
+
+        return cls(wb)
+
+    @classmethod
+    def _format_chart_sheet(cls, ws, chart: 'Chart | RunLengthChart'):
+        """ チャートのシートの行の高さと列幅を目の縦横比に合わせる """
+        ws.sheet_format = SheetFormatProperties(defaultRowHeight=XLSX_ROW_HEIGHT, customHeight=True)
+        width = _square_column_width(chart.gauge)
+        if width is None or chart.shape[1] == 0:
+            return
+        first = cls.NUM_FROZEN_COLS + 1
+        last = cls.NUM_FROZEN_COLS + chart.shape[1]
+        key = openpyxl.utils.get_column_letter(first)
+        ws.column_dimensions[key] = ColumnDimension(ws, index=key, min=first, max=last, width=width, customWidth=True)
+
+    @classmethod
+    def _append_chart(cls, ws, chart: 'Chart | RunLengthChart', styles: dict[int, NamedStyle]):
+        """
+        書き込み専用のシートにチャートを行ごとに追記する
+
+        スタイルを付ける場合は、記号ごとのセルを1つだけ作り、同じ記号が続く区間では
+        同じセルを並べて渡す（書き込み専用のシートは渡されたセルを順に書き出すだけなので、
+        セルの位置は書き出し時に設定される）
+        """
+        padding = [None] * cls.NUM_FROZEN_COLS
+        cells = {}
+        for number, style in styles.items():
+            cells[number] = WriteOnlyCell(ws, value=number)
+            cells[number].style = style.name
+
+        for runs in chart.row_runs():
+            values = list(padding)
+            for number, length in runs:
+                # スタイルのない値はそのまま書き出す
+                values.extend([cells.get(number, number)] * length)
+            ws.append(values)
+
+    @classmethod
+    def _write_chart(cls, ws, chart: 'Chart | RunLengthChart', styles: dict[int, NamedStyle]):
+        """ 編集できるシートにチャートを書き出し、同じ記号が続く区間ごとにスタイルを付ける """
+        padding = [None] * cls.NUM_FROZEN_COLS
+        for row_idx, runs in enumerate(chart.row_runs(), 1):
+            values = list(padding)
+            for number, length in runs:
+                values.extend([number] * length)
+            ws.append(values)
+
+            column = cls.NUM_FROZEN_COLS + 1
+            for number, length in runs:
+                style = styles.get(number)
+                if style is not None:
+                    for col in range(column, column + length):
+                        ws.cell(row=row_idx, column=col).style = style.name
+                column += length
+
+    def save(self, filename: str):
+        return self._xlsx.save(filename)
+
+    def to_bytes(self) -> bytes:
+        """ ファイルに書き出さずに XLSX の内容を返す """
+        stream = io.BytesIO()
+        self._xlsx.save(stream)
+        return stream.getvalue()
+        
+
+    
+    
+# チャート生成の実行方式のEnum
+class ExecutorType(str, Enum):
+    PROCESS = "process"   # プロセスプール
+    THREAD = "thread"     # スレッドプール（GIL を解放する処理が中心の場合）
+
+class WorkerPoolSaturated(Exception):
+    """ ワーカープールの実行中と待機中の処理が上限に達している """
+
+# ワーカープールが混雑しているときに返すメッセージ
+_SATURATED_DETAIL = "サーバーが混雑しています。しばらくしてから再度お試しください。"
+
+def _log_saturated():
+    """ ワーカープールが混雑していることを警告ログに残す """
+    logger.warning(f"ChartWorkerPool is saturated: pending={worker_pool.num_pending}")
+
+def _saturated_response() -> HTTPException:
+    """ ワーカープールが混雑していることをログに残し、Retry-After を付けた 503 の HTTPException を返す """
+    _log_saturated()
+    return HTTPException(
+        status_code=503,
+        detail=_SATURATED_DETAIL,
+        headers={"Retry-After": str(worker_pool.retry_after)},
+    )
+
+def _warm_up_worker(is_process: bool = False):
+    """
+    ワーカーの初期化処理
+
+    テンプレートを読み込み、小さなチャートを一度生成して重いモジュールの初期化を済ませておく。
+    パーツ単位のメモは親プロセスで保持するので、ワーカープロセスでは保持しない
+    """
+    if is_process:
+        shape_memo.enabled = False
+        chart_memo.enabled = False
+
+    try:
+        _parse_template()
+    except OSError as e:
+        logger.warning(f"Could not preload {TEMPLATE_PATH} due to {e}")
+
+    square = _PathBuilder().move_to(0, 0).line_by(10, 0).vertical_by(10).horizontal_by(-10).close()
+    Chart.from_shape(Shape(square, Gauge(vertical=10, horizontal=10)))
+
+class ChartWorkerPool:
+    """
+    CPU 負荷の高いチャート生成をイベントループの外で実行するワーカープール
+
+    実行中と待機中の処理の合計が max_workers + max_queue に達すると、
+    新しい処理を受け付けずに WorkerPoolSaturated を送出する
+
+    Args:
+        max_workers (int): ワーカー数
+        max_queue (int): 実行を待機できる処理の数
+        executor_type (ExecutorType): プロセスプールまたはスレッドプール
+        retry_after (int): 受け付けられない場合にクライアントに再試行を促すまでの秒数
+    """
+    def __init__(self, max_workers: int, max_queue: int, executor_type: ExecutorType = ExecutorType.PROCESS, retry_after: int = 1):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor_type = executor_type
+        self.retry_after = retry_after
+        self._executor: Executor | None = None
+        self._num_pending = 0
+        # 空きができるのを待っている reserve_when_available の Future
+        self._waiters: list[asyncio.Future] = []
+
+    @classmethod
+    def from_env(cls) -> 'ChartWorkerPool':
+        """ 環境変数から設定を読み込んで生成する """
+        max_workers = int(os.environ.get("SWEATER_CHART_WORKERS", os.cpu_count() or 1))
+        return cls(
+            max_workers=max_workers,
+            max_queue=int(os.environ.get("SWEATER_CHART_MAX_QUEUE", max_workers * 2)),
+            executor_type=ExecutorType(os.environ.get("SWEATER_CHART_EXECUTOR", ExecutorType.PROCESS.value)),
+            retry_after=int(os.environ.get("SWEATER_CHART_RETRY_AFTER", 1)),
+        )
+
+    @property
+    def num_pending(self) -> int:
+        """ 実行中と待機中の処理の数 """
+        return self._num_pending
+
+    def has_capacity(self, num_tasks: int = 1) -> bool:
+        """ num_tasks 個の処理を新たに受け付けられる場合に True を返す """
+        return self._num_pending + num_tasks <= self.max_workers + self.max_queue
+
+    def start(self):
+        """ ワーカーを起動する """
+        if self._executor is not None:
+            return
+        if self.executor_type is ExecutorType.PROCESS:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_warm_up_worker, initargs=(True,))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=_warm_up_worker)
+        logger.info(f"ChartWorkerPool is started: {self.executor_type.value} x {self.max_workers}")
+
+    def shutdown(self):
+        """ ワーカーを停止する """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def reserve(self, num_tasks: int) -> 'WorkerReservation':
+        """
+        num_tasks 個の処理の空きをその場で確保する
+
+        空きの確認と確保の間に他のリクエストが空きを使うことはないので、複数の処理を投入する
+        リクエストが一部の処理だけ受け付けられることはない
+
+        Raises:
+            WorkerPoolSaturated: 空きが足りない場合
+        """
+        if not self.has_capacity(num_tasks):
+            raise WorkerPoolSaturated()
+        self._num_pending += num_tasks
+        return WorkerReservation(self, num_tasks)
+
+    async def reserve_when_available(self, num_tasks: int) -> 'WorkerReservation':
+        """
+        num_tasks 個の処理の空きができるまで待ってから確保する
+
+        一括生成のように、混雑していても失敗させずに順番を待たせたい処理で使う
+
+        Raises:
+            WorkerPoolSaturated: num_tasks が実行中と待機中の処理の上限を超えていて、空きを待っても確保できない場合
+        """
+        if num_tasks > self.max_workers + self.max_queue:
+            raise WorkerPoolSaturated()
+        while not self.has_capacity(num_tasks):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return self.reserve(num_tasks)
+
+    async def run(self, func, *args):
+        """
+        func(*args) をワーカーで実行し、結果を返す
+
+        ワーカープロセスが異常終了してプールが使えなくなった場合は、プールを破棄して次の処理で作り直す
+
+        Raises:
+            WorkerPoolSaturated: 実行中と待機中の処理が上限に達している場合
+            BrokenExecutor: 処理中にプールが使えなくなった場合
+        """
+        return await self.reserve(1).run(func, *args)
+
+    async def _run_reserved(self, func, *args):
+        """
+        確保済みの空きを1つ使って func(*args) をワーカーで実行し、結果を返す
+
+        待っている側がキャンセルされても実行を始めた処理は止められないので、空きは
+        ワーカーでの処理が終わったとき（実行前にキャンセルされた場合はそのとき）に返す
+        """
+        loop = asyncio.get_running_loop()
+        executor = None
+        future = None
+        try:
+            self.start()
+            executor = self._executor
+            future = executor.submit(func, *args) # type: ignore
+            future.add_done_callback(lambda _: self._release_from_worker(loop))
+            return await asyncio.wrap_future(future)
+        except BrokenExecutor:
+            # 同じプールで待っていた他の処理がすでに作り直している場合は何もしない
+            if self._executor is executor:
+                logger.error(f"ChartWorkerPool is broken. restarting workers.")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True) # type: ignore
+            raise
+        finally:
+            # 投入できなかった場合は空きをすぐに返す
+            if future is None:
+                self._release(1)
+
+    def _release_from_worker(self, loop: asyncio.AbstractEventLoop):
+        """ ワーカーのスレッドから、空きを1つイベントループで返す """
+        try:
+            loop.call_soon_threadsafe(self._release, 1)
+        except RuntimeError:
+            # イベントループが終了している場合はその場で返す
+            self._release(1)
+
+    def _release(self, num_tasks: int):
+        """ num_tasks 個の空きを返し、空きを待っている処理を起こす """
+        self._num_pending -= num_tasks
+        if num_tasks <= 0:
+            return
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            # 起きた側がそれぞれ空きを確認し直し、足りなければまた待つ
+            if not waiter.done() and not waiter.get_loop().is_closed():
+                waiter.set_result(None)
+
+class WorkerReservation:
+    """
+    ChartWorkerPool.reserve で確保した空き
+
+    run で1つずつ使い、使わなかった分は release でプールに返す
+
+    Args:
+        pool (ChartWorkerPool): 空きを確保したプール
+        num_tasks (int): 確保した処理の数
+    """
+    def __init__(self, pool: ChartWorkerPool, num_tasks: int):
+        self._pool = pool
+        self._remaining = num_tasks
+
+    async def run(self, func, *args):
+        """ 確保した空きを1つ使って func(*args) をワーカーで実行し、結果を返す """
+        if self._remaining <= 0:
+            raise RuntimeError("no reserved worker slot is left")
+        self._remaining -= 1
+        return await self._pool._run_reserved(func, *args)
+
+    def release(self):
+        """ 使わなかった空きをプールに返す """
+        self._pool._release(self._remaining)
+        self._remaining = 0
+
+# チャート生成のワーカープール
+worker_pool = ChartWorkerPool.from_env()
+
+class CacheEntry:
+    """
+    キャッシュされた生成結果
+
+    Args:
+        charts (dict[str, Chart]): パーツ名とチャート（読み取り専用）
+        outputs (dict[str, bytes]): 出力形式と書き出したファイルの内容
+    """
+    def __init__(self, charts: dict[str, Chart], outputs: dict[str, bytes] | None = None):
+        self.charts = charts
+        self.outputs = outputs if outputs is not None else {}
+
+    @property
+    def nbytes(self) -> int:
+        """ チャートと出力の合計バイト数 """
+        return (
+            sum(chart.nbytes for chart in self.charts.values())
+            + sum(len(output) for output in self.outputs.values())
+        )
+
+class ChartCache:
+    """
+    SweaterDimensions.canonical_hash をキーとする生成結果のキャッシュ
+
+    メモリ上では最近使われていないものから削除し、件数と合計バイト数を上限以下に保つ。
+    directory を指定した場合は、ディスクにも保存してメモリから削除された後も読み込めるようにする
+
+    Args:
+        max_entries (int): メモリ上に保持する件数の上限
+        max_bytes (int): メモリ上に保持する合計バイト数の上限
+        directory (str): ディスクに保存するディレクトリ。None の場合はディスクに保存しない
+    """
+    def __init__(self, max_entries: int, max_bytes: int, directory: str | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._nbytes = 0
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> 'ChartCache':
+        """ 環境変数から設定を読み込んで生成する """
+        return cls(
+            max_entries=int(os.environ.get("SWEATER_CHART_CACHE_ENTRIES", 256)),
+            max_bytes=int(os.environ.get("SWEATER_CHART_CACHE_BYTES", 256 * 1024 * 1024)),
+            directory=os.environ.get("SWEATER_CHART_CACHE_DIR") or None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> CacheEntry | None:
+        """ キーに対応する生成結果を返す。ない場合は None を返す """
+        entry = self._lookup(key)
+        if entry is None and self.directory is not None:
+            entry = self._loaded(key, self._load(key))
+        return self._count(entry)
+
+    async def get_async(self, key: str) -> CacheEntry | None:
+        """ get と同じ。ディスクからの読み込みはイベントループを止めないようスレッドで行う """
+        entry = self._lookup(key)
+        if entry is None and self.directory is not None:
+            entry = self._loaded(key, await asyncio.to_thread(self._load, key))
+        return self._count(entry)
+
+    def put(self, key: str, charts: dict[str, Chart]) -> CacheEntry:
+        """ 生成したチャートを保存する。保存したチャートは変更できなくなる """
+        entry = self._put(key, charts)
+        if self.directory is not None:
+            self._save(key, entry.charts, dict(entry.outputs))
+        return entry
+
+    async def put_async(self, key: str, charts: dict[str, Chart]) -> CacheEntry:
+        """ put と同じ。ディスクへの書き込みはイベントループを止めないようスレッドで行う """
+        entry = self._put(key, charts)
+        if self.directory is not None:
+            await asyncio.to_thread(self._save, key, entry.charts, dict(entry.outputs))
+        return entry
+
+    def put_output(self, key: str, output_format: str, output: bytes):
+        """ 保存済みの生成結果に、書き出したファイルの内容を追加する """
+        entry = self._put_output(key, output_format, output)
+        if entry is not None and self.directory is not None:
+            self._save(key, entry.charts, {output_format: output})
+
+    async def put_output_async(self, key: str, output_format: str, output: bytes):
+        """ put_output と同じ。ディスクへの書き込みはイベントループを止めないようスレッドで行う """
+        entry = self._put_output(key, output_format, output)
+        if entry is not None and self.directory is not None:
+            await asyncio.to_thread(self._save, key, entry.charts, {output_format: output})
+
+    def _lookup(self, key: str) -> CacheEntry | None:
+        """ メモリ上の生成結果を返す """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _loaded(self, key: str, entry: CacheEntry | None) -> CacheEntry | None:
+        """ ディスクから読み込んだ生成結果をメモリ上にも保存する """
+        if entry is not None:
+            self._store(key, entry)
+        return entry
+
+    def _count(self, entry: CacheEntry | None) -> CacheEntry | None:
+        """ ヒット数・ミス数を数える """
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def _put(self, key: str, charts: dict[str, Chart]) -> CacheEntry:
+        """ メモリ上に保存する """
+        for chart in charts.values():
+            chart.array.flags.writeable = False
+        entry = CacheEntry(charts)
+        self._store(key, entry)
+        return entry
+
+    def _put_output(self, key: str, output_format: str, output: bytes) -> CacheEntry | None:
+        """ メモリ上の生成結果に出力を追加する。生成結果がない場合は None を返す """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._nbytes -= entry.nbytes
+        entry.outputs[output_format] = output
+        self._nbytes += entry.nbytes
+        self._evict()
+        return entry
+
+    def _store(self, key: str, entry: CacheEntry):
+        """ メモリ上に保存し、上限を超えた分を削除する """
+        if key in self._entries:
+            self._nbytes -= self._entries.pop(key).nbytes
+        self._entries[key] = entry
+        self._nbytes += entry.nbytes
+        self._evict()
+
+    def _evict(self):
+        """ 最近使われていないものから、件数と合計バイト数が上限以下になるまで削除する """
+        while self._entries and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._nbytes -= entry.nbytes
+
+    def _path(self, key: str, suffix: str = "charts") -> str:
+        return os.path.join(self.directory, f"{key}.{suffix}") # type: ignore
+
+    def _write_atomic(self, path: str, write):
+        """ 書き込み途中のファイルを読まないよう、一時ファイルに書き終えてから置き換える """
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not save cache file {path} due to {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _save(self, key: str, charts: dict[str, Chart], outputs: dict[str, bytes]):
+        """
+        ディスクに保存する
+
+        チャートはバイナリ形式のアーカイブ、出力は形式ごとのファイルに保存する。
+        イベントループのスレッド以外からも呼ばれるので、共有の状態は参照しない
+        """
+        if not os.path.exists(self._path(key)):
+            self._write_atomic(self._path(key), lambda f: Chart.write_binary_charts(f, charts, dimensions_hash=key))
+        for output_format, output in outputs.items():
+            path = self._path(key, f"output.{output_format}")
+            if not os.path.exists(path):
+                self._write_atomic(path, lambda f: f.write(output))
+
+    def _load(self, key: str) -> CacheEntry | None:
+        """ ディスクから読み込む チャートはメモリマップしてコピーせずに参照する """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            charts = Chart.read_binary_charts(path)
+            outputs = {}
+            for output_format in OutputFormat:
+                output_path = self._path(key, f"output.{output_format.value}")
+                if os.path.exists(output_path):
+                    with open(output_path, "rb") as f:
+                        outputs[output_format.value] = f.read()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load cache entry {key} due to {e}")
+            return None
+        return CacheEntry(charts, outputs)
+
+# 生成結果のキャッシュ
+result_cache = ChartCache.from_env()
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中の場合は新たに実行せず、実行中の処理の結果を共有する
+
+    実行中の処理で発生した例外は、結果を待っている全ての呼び出し元に送出する。
+    呼び出し元がキャンセルされても、共有している処理はキャンセルしない
+    """
+    def __init__(self):
+        self.num_coalesced = 0
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: str, func):
+        """
+        func() のコルーチンを実行し、結果を返す。同じキーの処理が実行中の場合はその結果を返す
+
+        Args:
+            key (str): 処理のキー
+            func: 引数なしでコルーチンを返す関数
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.num_coalesced += 1
+            logger.info(f"coalesced with in-flight generation: {key}")
+        return await asyncio.shield(future)
+
+# 実行中のチャート生成
+generation_flight = SingleFlight()
+
+# 差分の再生成で再利用する、寸法ごとのパーツの内外判定・記号の挿入の結果
+incremental_memo = PieceMemo(int(os.environ.get("SWEATER_CHART_INCREMENTAL_ENTRIES", 32)))
+
+async def _generate_and_cache(key: str, data: SweaterDimensions, wait: bool = False, on_piece=None) -> CacheEntry:
+    """ パーツごとのチャートをワーカーで並列に生成し、キャッシュに保存する """
+    charts = await generate_charts_concurrently(data, worker_pool, wait=wait, on_piece=on_piece)
+    return await result_cache.put_async(key, charts)
+
+async def _generate_output_cached(data: SweaterDimensions, output_format: OutputFormat, wait: bool = False) -> bytes:
+    """
+    書き出したファイルの内容を返す
+
+    丸めた後の寸法が同じ生成結果がキャッシュにない場合は、パーツごとのチャートをワーカーで並列に生成する。
+    同じ寸法の生成が実行中の場合はその結果を待つ。書き出したファイルの内容もキャッシュする
+
+    Args:
+        data (SweaterDimensions): 検証済みの寸法データクラス
+        output_format (OutputFormat): 出力ファイルの形式
+        wait (bool): ワーカープールが混雑している場合に、失敗せずに空きができるまで待つかどうか
+
+    Raises:
+        WorkerPoolSaturated: ワーカープールが混雑している場合（wait が False の場合）
+    """
+    key = data.canonical_hash()
+    entry = await result_cache.get_async(key)
+    if entry is None:
+        entry = await generation_flight.run(key, lambda: _generate_and_cache(key, data, wait=wait))
+    else:
+        logger.info(f"cache hit: {key}")
+
+    content = entry.outputs.get(output_format.value)
+    if content is None:
+        reservation = await worker_pool.reserve_when_available(1) if wait else worker_pool.reserve(1)
+        content = await reservation.run(serialize_charts, entry.charts, output_format)
+        await result_cache.put_output_async(key, output_format.value, content)
+    return content
+
+@app.post("/generate_sweater_chart", response_description="generated file")
+async def main(sweaterDimensions: SweaterDimensions, output_format: OutputFormat = OutputFormat.CSV, is_debug=False):
+    """
+    Pydanticモデルで受け取ったデータから生成したファイルを送信する
+
+    チャートの生成はワーカープールで実行し、混雑している場合は 503 を返す。
+    丸めた後の寸法が同じ生成結果はキャッシュから返し、同じ寸法の生成が実行中の場合はその結果を共有する。
+    ファイルはメモリ上で書き出し、一時ファイルは作らない
+    
+    Args:
+        data (SweaterDimensions): 検証済みの寸法データクラス
+        output_format (OutputFormat): 出力ファイルの形式
+    """
+
+    try:
+        # 1. チャートと書き出したファイルの内容をキャッシュから取得するか、ワーカーで生成する
+        content = await _generate_output_cached(sweaterDimensions, output_format)
+
+        # 2. メモリ上のファイルの内容をクライアントに送信
+        return Response(
+            content=content,
+            media_type=output_format.media_type,
+            headers={"Content-Disposition": f'attachment; filename="{output_format.filename}"'},
+        )
+
+    except WorkerPoolSaturated:
+        raise _saturated_response()
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"ファイル生成中にエラーが発生しました: {str(e)}")
+
+# 一括生成で1回のリクエストに含められる寸法の数
+MAX_BATCH_SIZE = int(os.environ.get("SWEATER_CHART_MAX_BATCH", 16))
+
+class _ArchiveStream(io.RawIOBase):
+    """ zipfile が書き込んだバイト列を溜めておき、取り出すたびに空にするストリーム """
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+async def _generate_batch_archive(items: list[SweaterDimensions], output_format: OutputFormat, labels: list[str] | None = None):
+    """
+    寸法ごとのファイルを ZIP アーカイブに書き出し、書き出した順にバイト列を返す
+
+    正規化した寸法が同じものは一度だけ生成し、終わったものから順にアーカイブに追加する。
+    最後に寸法ごとの結果（成否・重複元・エラー内容）を status.json に書き出す
+
+    Args:
+        items (list[SweaterDimensions]): 寸法のリスト
+        output_format (OutputFormat): ファイルの形式
+        labels (list[str]): ファイル名の先頭に付ける寸法ごとの名前。None の場合は連番
+    """
+    if labels is None:
+        width = len(str(len(items) - 1))
+        labels = [f"{i:0{width}d}" for i in range(len(items))]
+    names = [f"{label}_{output_format.filename}" for label in labels]
+    keys = [item.canonical_hash() for item in items]
+
+    # 正規化した寸法が同じものは最初の1件だけ生成する
+    first_index: dict[str, int] = {}
+    for i, key in enumerate(keys):
+        first_index.setdefault(key, i)
+    statuses = [
+        {"index": i, "file": names[i], "key": key, "duplicate_of": first_index[key] if first_index[key] != i else None}
+        for i, key in enumerate(keys)
+    ]
+
+    # ワーカーが空かない程度に同時に生成する寸法の数を絞り、待機中の処理が上限を超えないようにする
+    semaphore = asyncio.Semaphore(max(1, -(-worker_pool.max_workers // len(PIECES))))
+
+    async def generate(index: int):
+        try:
+            async with semaphore:
+                try:
+                    # 他のリクエストで混雑していても失敗させず、空きができるまで待つ
+                    content = await _generate_output_cached(items[index], output_format, wait=True)
+                except WorkerPoolSaturated:
+                    # 待たない他のリクエストの生成に相乗りして、その生成が受け付けられなかった場合は自分で生成し直す
+                    content = await _generate_output_cached(items[index], output_format, wait=True)
+                return index, content, None
+        except WorkerPoolSaturated:
+            return index, None, "worker pool is saturated"
+        except Exception as e:
+            logger.exception(f"batch item {index} failed")
+            return index, None, str(e)
+
+    stream = _ArchiveStream()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for task in asyncio.as_completed([generate(i) for i in first_index.values()]):
+            index, content, error = await task
+            # 重複していたものにも同じ内容を書き出す
+            for status in statuses:
+                if keys[status["index"]] != keys[index]:
+                    continue
+                status["status"] = "ok" if error is None else "error"
+                status["error"] = error
+                if content is not None:
+                    archive.writestr(status["file"], content)
+            yield stream.drain()
+
+        archive.writestr("status.json", json.dumps(statuses, ensure_ascii=False, indent=2))
+    yield stream.drain()
+
+@app.post("/generate_sweater_charts", response_description="zip archive of generated files")
+async def generate_batch(
+    sweaterDimensionsList: Annotated[list[SweaterDimensions], Field(min_length=1, max_length=MAX_BATCH_SIZE)],
+    output_format: OutputFormat = OutputFormat.CSV,
+):
+    """
+    複数の寸法から生成したファイルを1つの ZIP アーカイブにまとめて送信する
+
+    寸法ごとの生成は1件ずつのリクエストと同じワーカープールとキャッシュを使い、並列に実行する。
+    アーカイブは生成が終わったものから順に送信し、最後に寸法ごとの結果を status.json に書き出す。
+    ワーカープールが混雑している場合は、送信を始める前に 503 を返す。送信を始めた後は、
+    他のリクエストで混雑しても寸法ごとの生成を失敗させずに空きができるまで待つ
+
+    Args:
+        sweaterDimensionsList (list[SweaterDimensions]): 検証済みの寸法データクラスのリスト
+        output_format (OutputFormat): アーカイブに含めるファイルの形式
+    """
+    if not worker_pool.has_capacity(len(PIECES)):
+        raise _saturated_response()
+
+    return StreamingResponse(
+        _generate_batch_archive(sweaterDimensionsList, output_format),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="sweater_pattern_data.zip"'},
+    )
+
+@app.post("/generate_graded_charts", response_description="zip archive of generated files")
+async def generate_graded(sizeGrading: SizeGrading, output_format: OutputFormat = OutputFormat.CSV):
+    """
+    基準サイズの寸法と1サイズごとの増分から、サイズ展開の全てのサイズのファイルを ZIP アーカイブにまとめて送信する
+
+    キャッシュにないサイズは、パーツごとに小さいサイズから順に直前のサイズの結果を再利用して生成する。
+    アーカイブの形式は /generate_sweater_charts と同じで、ファイル名の先頭にサイズ名を付ける
+
+    Args:
+        sizeGrading (SizeGrading): 検証済みのサイズ展開のデータクラス
+        output_format (OutputFormat): アーカイブに含めるファイルの形式
+    """
+    sizes = sizeGrading.dimensions()
+    missing = {}
+    for data in sizes.values():
+        key = data.canonical_hash()
+        if await result_cache.get_async(key) is None:
+            missing[key] = data
+
+    try:
+        if missing:
+            graded = await generate_graded_charts_concurrently(list(missing.values()), worker_pool)
+            for key, charts in zip(missing, graded):
+                await result_cache.put_async(key, charts)
+    except WorkerPoolSaturated:
+        raise _saturated_response()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"ファイル生成中にエラーが発生しました: {str(e)}")
+
+    return StreamingResponse(
+        _generate_batch_archive(list(sizes.values()), output_format, labels=list(sizes)),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="sweater_pattern_data.zip"'},
+    )
+
+@app.post("/regenerate_sweater_chart", response_description="row-level differences from the previous charts")
+async def regenerate(chartRegeneration: ChartRegeneration):
+    """
+    直前の寸法から一部の寸法だけを変更したチャートを生成し、直前のチャートからの段単位の差分を返す
+
+    直前の寸法の内外判定・記号の挿入の結果が残っていれば、シェイプが変わらないパーツはそのまま使い、
+    変わるパーツは輪郭が変わる段だけ生成し直す。生成したチャートは /generate_sweater_chart と同じキャッシュに保存する。
+    差分はパーツごとに、直前のチャートの上端と下端から残す段数と、間を置き換える段を返す。
+    カーディガンへの変更などで無くなったパーツは removed に返す
+
+    Args:
+        chartRegeneration (ChartRegeneration): 検証済みの差分の再生成のデータクラス
+    """
+    previous_data = chartRegeneration.previous
+    data = chartRegeneration.dimensions()
+    previous_key = previous_data.canonical_hash()
+    key = data.canonical_hash()
+
+    try:
+        pieces, charts, diffs, removed = await worker_pool.run(
+            regenerate_charts, data, previous_data, incremental_memo.get(previous_key)
+        )
+    except WorkerPoolSaturated:
+        raise _saturated_response()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"ファイル生成中にエラーが発生しました: {str(e)}")
+
+    incremental_memo.put(key, pieces)
+    if await result_cache.get_async(key) is None:
+        await result_cache.put_async(key, charts)
+
+    return {
+        "key": key,
+        "previous_key": previous_key,
+        "pieces": [{"piece": name, **diff} for name, diff in diffs.items()],
+        "removed": removed,
+    }
+
+# プレビューの粗いチャートの行数の上限と、チャートの段を送信するイベントごとの段数
+PREVIEW_MAX_ROWS = int(os.environ.get("SWEATER_CHART_PREVIEW_ROWS", 48))
+PREVIEW_ROWS_PER_EVENT = 64
+
+# GET /preview_sweater_chart/{key} で生成するための、キーに対応する寸法
+preview_dimensions = PieceMemo(int(os.environ.get("SWEATER_CHART_PREVIEW_ENTRIES", 64)))
+
+def _sse_event(event: str, data) -> bytes:
+    """ Server-Sent Events の1つのイベントを返す """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+def _chart_row_events(name: str, chart: Chart):
+    """ チャートの大きさのイベントと、上端から PREVIEW_ROWS_PER_EVENT 段ずつの段のイベントを返す """
+    num_rows, num_cols = chart.array.shape
+    yield _sse_event("piece", {"piece": name, "shape": [num_rows, num_cols]})
+    for start in range(0, num_rows, PREVIEW_ROWS_PER_EVENT):
+        yield _sse_event("rows", {
+            "piece": name,
+            "start": start,
+            "rows": chart.array[start:start + PREVIEW_ROWS_PER_EVENT].tolist(),
+        })
+
+async def _generate_preview_events(key: str, data: SweaterDimensions | None):
+    """
+    粗い輪郭のチャートを送信した後、パーツごとのチャートを生成が終わったものから順に段ごとに送信する
+
+    生成結果がキャッシュにある場合は、輪郭を送信せずにキャッシュのチャートを送信する。
+    ない場合は /generate_sweater_chart と同じく generation_flight で生成し、同じ寸法の生成が実行中の場合は
+    その結果を待って送信する
+
+    Args:
+        key (str): 丸めた後の寸法のハッシュ値
+        data (SweaterDimensions): 検証済みの寸法データクラス。None の場合はキャッシュにあるものだけを送信する
+    """
+    try:
+        entry = await result_cache.get_async(key)
+        if entry is not None:
+            logger.info(f"cache hit: {key}")
+            for name, chart in entry.charts.items():
+                for event in _chart_row_events(name, chart):
+                    yield event
+        elif data is None:
+            yield _sse_event("error", {"detail": f"プレビューの寸法が見つかりません: {key}"})
+            return
+        else:
+            # 1. 粗い輪郭のチャート
+            outlines = await worker_pool.run(generate_outlines, data, PREVIEW_MAX_ROWS)
+            for name, outline in outlines.items():
+                yield _sse_event("outline", {
+                    "piece": name,
+                    "shape": list(outline.array.shape),
+                    "stitch_width": outline.gauge.stitch_width,
+                    "stitch_length": outline.gauge.stitch_length,
+                    "rows": outline.array.tolist(),
+                })
+
+            # 2. パーツごとのチャート
+            # クライアントが切断しても生成は続け、他のリクエストと同じくキャッシュに保存する
+            pieces: asyncio.Queue = asyncio.Queue()
+            generation = asyncio.ensure_future(generation_flight.run(
+                key, lambda: _generate_and_cache(key, data, on_piece=pieces.put_nowait)))
+            generation.add_done_callback(lambda _: pieces.put_nowait(None))
+            streamed = set()
+            try:
+                while (piece_charts := await pieces.get()) is not None:
+                    for name, chart in piece_charts.items():
+                        streamed.add(name)
+                        for event in _chart_row_events(name, chart):
+                            yield event
+                # 実行中の生成に相乗りした場合は、まだ送信していないパーツを生成結果から送信する
+                entry = await generation
+            finally:
+                # 切断された場合は待つのをやめる（generation_flight の生成自体は止めない）
+                generation.cancel()
+            for name, chart in entry.charts.items():
+                if name not in streamed:
+                    for event in _chart_row_events(name, chart):
+                        yield event
+
+        yield _sse_event("done", {"key": key})
+
+    except WorkerPoolSaturated:
+        _log_saturated()
+        yield _sse_event("error", {
+            "detail": _SATURATED_DETAIL,
+            "retry_after": worker_pool.retry_after,
+        })
+    except Exception as e:
+        yield _sse_event("error", {"detail": f"ファイル生成中にエラーが発生しました: {str(e)}"})
+
+def _preview_response(key: str, data: SweaterDimensions | None) -> StreamingResponse:
+    """ プレビューのイベントを送信するレスポンスを返す """
+    return StreamingResponse(
+        _generate_preview_events(key, data),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+@app.post("/preview_sweater_chart", response_description="server-sent events of the outline and rows of charts")
+async def preview(sweaterDimensions: SweaterDimensions):
+    """
+    寸法から生成するチャートを Server-Sent Events で段階的に送信する
+
+    最初に、シェイプから粗いゲージで内外判定だけを行ったパーツごとの輪郭を outline イベントで送信する。
+    次に、パーツごとのチャートを生成が終わったものから順に、大きさを piece イベント、
+    上端からの段を rows イベントで送信し、最後に done イベントを送信する。
+    生成結果は /generate_sweater_chart と同じキャッシュに保存する。
+    ワーカープールが混雑している場合は、送信を始める前に 503 を返す
+
+    ブラウザの EventSource は GET しか送れないので、このエンドポイントは fetch でレスポンスの body を
+    ストリームとして読み出す。EventSource を使う場合は /preview_sweater_chart_key でキーを取得し、
+    GET /preview_sweater_chart/{key} に接続する
+
+    Args:
+        sweaterDimensions (SweaterDimensions): 検証済みの寸法データクラス
+    """
+    # 輪郭の生成が終わってからパーツを投入するので、同時に必要な空きはパーツの数
+    if not worker_pool.has_capacity(len(PIECES)):
+        raise _saturated_response()
+
+    key = sweaterDimensions.canonical_hash()
+    preview_dimensions.put(key, sweaterDimensions)
+    return _preview_response(key, sweaterDimensions)
+
+@app.post("/preview_sweater_chart_key", response_description="key of the dimensions for GET /preview_sweater_chart/{key}")
+async def preview_key(sweaterDimensions: SweaterDimensions):
+    """
+    寸法を登録し、GET /preview_sweater_chart/{key} で使うキー（丸めた後の寸法のハッシュ値）を返す
+
+    登録した寸法は最近使われていないものから削除するので、キーを取得したらすぐに接続する
+
+    Args:
+        sweaterDimensions (SweaterDimensions): 検証済みの寸法データクラス
+    """
+    key = sweaterDimensions.canonical_hash()
+    preview_dimensions.put(key, sweaterDimensions)
+    return {"key": key}
+
+@app.get("/preview_sweater_chart/{key}", response_description="server-sent events of the outline and rows of charts")
+async def preview_by_key(key: str):
+    """
+    キーに対応するチャートを、POST /preview_sweater_chart と同じイベントで段階的に送信する
+
+    EventSource から接続できるよう GET で受け付ける。生成結果がキャッシュにある場合はそれを送信し、
+    ない場合は /preview_sweater_chart_key で登録した寸法から生成する。どちらもない場合は 404 を返す
+
+    Args:
+        key (str): /preview_sweater_chart_key が返したキー
+    """
+    data = preview_dimensions.get(key)
+    if await result_cache.get_async(key) is None:
+        if data is None:
+            raise HTTPException(status_code=404, detail=f"プレビューの寸法が見つかりません: {key}")
+        if not worker_pool.has_capacity(len(PIECES)):
+            raise _saturated_response()
+
+    return _preview_response(key, data)
+
+# 前身頃が左右に分かれる形状
+CARDIGAN_TYPES = (
+    SweaterType.CREW_NECK_CARDIGAN,
+    SweaterType.V_NECK_CARDIGAN,
+    SweaterType.BOX_CARDIGAN,
+)
+
+def generate_body_charts(data: SweaterDimensions) -> dict[str, Chart]:
+    """
+    身頃のチャートを生成する
+
+    前身頃と後身頃は襟ぐり下がりより下の輪郭が共通なので、後身頃のチャートを再利用する。
+    カーディガンの場合は、前身頃を中心で左右に分ける
+
+    Args:
+        data (SweaterDimensions): 検証済みの寸法データクラス
+
+    Returns:
+        dict[str, Chart]: パーツ名とチャート
+    """
+    back_body_chart = Chart.from_shape(Shape.back_body_from(data))
+    front_body_chart = Chart.from_shape_sharing_rows(
+        Shape.front_body_from(data),
+        back_body_chart,
+        num_differing_rows=_front_body_differing_rows(data)
+    )
+    return _finish_body_charts(data, front_body_chart, back_body_chart)
+
+def _front_body_differing_rows(data: SweaterDimensions) -> int:
+    """ 前身頃と後身頃で内外判定の結果が異なりうる上端からの段数（深い方の襟ぐり下がり + 1段） """
+    return max(data.rows_of_front_neck_drop, data.rows_of_back_neck_drop) + 1
+
+def generate_outlines(data: SweaterDimensions, max_rows: int) -> dict[str, Chart]:
+    """
+    プレビュー用に、身頃と袖の粗い輪郭のチャートを生成する
+
+    カーディガンの場合も前身頃は分けない
+
+    Args:
+        data (SweaterDimensions): 検証済みの寸法データクラス
+        max_rows (int): 粗いチャートの行数の上限
+
+    Returns:
+        dict[str, Chart]: パーツ名と粗いゲージのチャート
+    """
+    return {
+        "front_body": Chart.outline_from_shape(Shape.front_body_from(data), max_rows),
+        "back_body": Chart.outline_from_shape(Shape.back_body_from(data), max_rows),
+        "sleeve": Chart.outline_from_shape(Shape.sleeve_from(data), max_rows),
+    }
+
+def _finish_body_charts(data: SweaterDimensions, front_body_chart: Chart, back_body_chart: Chart) -> dict[str, Chart]:
+    """ 身頃のチャートに裾のゴム編みを入れ、カーディガンの場合は前身頃を左右に分ける """
+    return {
+        **_finish_front_body_charts(data, front_body_chart),
+        **_finish_back_body_charts(data, back_body_chart),
+    }
+
+def _insert_ribbed_hem(data: SweaterDimensions, chart: Chart):
+    """ 身頃のチャートに裾のゴム編みを入れる """
+    chart.replace_vertical_stripes_below(
+        chart.array.shape[0] - data.rows_of_ribbed_hem, Symbol.KNIT.number, Symbol.PURL.number, in_place=True
+    )
+
+def _finish_front_body_charts(data: SweaterDimensions, front_body_chart: Chart) -> dict[str, Chart]:
+    """
+    前身頃のチャートに裾のゴム編みを入れ、カーディガンの場合は左右に分ける
+
+    目数が奇数（is_odd）のカーディガンでは、中心列は前立てを編む位置なので左右どちらのチャートにも含めない。
+    左右の前身頃はそれぞれ (列数 - 1) / 2 目になる
+    """
+    _insert_ribbed_hem(data, front_body_chart)
+
+    if data.type not in CARDIGAN_TYPES:
+        return {"front_body": front_body_chart}
+
+    # チャートは表側から見た図なので、左半分が右前身頃になる
+    num_cols = front_body_chart.array.shape[1]
+    return {
+        "right_front_body": Chart(front_body_chart.array[:, :num_cols // 2].copy(), data.gauge),
+        "left_front_body": Chart(front_body_chart.array[:, num_cols - num_cols // 2:].copy(), data.gauge),
+    }
+
+def _finish_back_body_charts(data: SweaterDimensions, back_body_chart: Chart) -> dict[str, Chart]:
+    """ 後身頃のチャートに裾のゴム編みを入れる """
+    _insert_ribbed_hem(data, back_body_chart)
+    return {"back_body": back_body_chart}
+
+def generate_sleeve_charts(data: SweaterDimensions) -> dict[str, Chart]:
+    """
+    袖のチャートを生成する
+
+    Args:
+        data (SweaterDimensions): 検証済みの寸法データクラス
+
+    Returns:
+        dict[str, Chart]: パーツ名とチャート
+    """
+    return _finish_sleeve_charts(data, Chart.from_shape(Shape.sleeve_from(data)))
+
+def _finish_sleeve_charts(data: SweaterDimensions, sleeve_chart: Chart) -> dict[str, Chart]:
+    """ 袖のチャートに袖口のゴム編みを入れる """
+    # 袖口のゴム編み
+    sleeve_chart.replace_vertical_stripes_below(
+        sleeve_chart.array.shape[0] - data.rows_of_ribbed_cuff, Symbol.KNIT.number, Symbol.PURL.number, in_place=True
+    )
+    return {"sleeve": sleeve_chart}
+
+# ワーカープールに1パーツずつ投入する、パーツのシェイプと仕上げの処理
+PIECES = {
+    "front_body": (Shape.front_body_from, _finish_front_body_charts),
+    "back_body": (Shape.back_body_from, _finish_back_body_charts),
+    "sleeve": (Shape.sleeve_from, _finish_sleeve_charts),
+}
+
+# 他のパーツのチャートの段を再利用して生成するパーツと、再利用元のパーツ・異なりうる段数
+SHARED_ROW_PIECES = {
+    "front_body": ("back_body", _front_body_differing_rows),
+}
+
+def rasterize_piece(shape: Shape, base_chart: Chart | None = None, num_differing_rows: int = 0) -> Chart:
+    """
+    ワーカーで実行する、シェイプの内外判定と編み目記号の挿入
+
+    base_chart を渡した場合は、上端の num_differing_rows 段以外を base_chart から再利用する
+    """
+    if base_chart is None:
+        return Chart.from_shape(shape)
+    return Chart.from_shape_sharing_rows(shape, base_chart, num_differing_rows)
+
+def generate_charts(data: SweaterDimensions) -> dict[str, Chart]:
+    """
+    全てのパーツのチャートを順番に生成する
+
+    順番に生成するので、前身頃は後身頃のチャートを再利用する
+
+    Args:
+        data (SweaterDimensions): 検証済みの寸法データクラス
+
+    Returns:
+        dict[str, Chart]: パーツ名とチャート
+    """
+    return {**generate_body_charts(data), **generate_sleeve_charts(data)}
+
+async def _generate_pieces(data: SweaterDimensions, pool: ChartWorkerPool, wait: bool = False):
+    """
+    パーツごとのチャートを、終わったものから順に (PIECES での順番, パーツ名とチャート) として返す
+
+    シェイプの生成と仕上げは親プロセスで行い、内外判定と編み目記号の挿入だけをワーカーに投入する。
+    内外判定と編み目記号の挿入の結果は親プロセスのメモに保持し、メモにあるパーツはワーカーに投入しない。
+    SHARED_ROW_PIECES のパーツ（前身頃）は、再利用元のパーツ（後身頃）のチャートができてから投入し、
+    異なりうる段だけを生成する
+
+    wait が True の場合は、ワーカープールが混雑していても失敗せずに空きができるまで待つ
+
+    Raises:
+        WorkerPoolSaturated: ワーカープールが混雑している場合（wait が False の場合）
+    """
+    names = list(PIECES)
+    shapes = [PIECES[name][0](data) for name in names]
+    rasters = [Chart.memoized_from_shape(shape) for shape in shapes]
+    missing = [index for index, raster in enumerate(rasters) if raster is None]
+    # 再利用元のチャートは仕上げで書き換えないよう、コピーを仕上げる
+    bases = {names.index(base) for base, _ in SHARED_ROW_PIECES.values()}
+
+    # 一部のパーツだけ受け付けられて処理が無駄にならないよう、投入する前に全てのパーツの空きを確保する
+    reservation = await pool.reserve_when_available(len(missing)) if wait else pool.reserve(len(missing))
+
+    tasks: dict[int, asyncio.Future] = {}
+
+    async def rasterize(index: int) -> tuple[int, Chart]:
+        shared = SHARED_ROW_PIECES.get(names[index])
+        if shared is None:
+            raster = await reservation.run(rasterize_piece, shapes[index])
+        else:
+            base, differing_rows = shared
+            base_index = names.index(base)
+            if base_index in tasks:
+                _, base_chart = await tasks[base_index]
+            else:
+                base_chart = rasters[base_index]
+            raster = await reservation.run(rasterize_piece, shapes[index], base_chart, differing_rows(data))
+        Chart.memoize_from_shape(shapes[index], raster)
+        return index, raster
+
+    def finish(index: int, raster: Chart) -> dict[str, Chart]:
+        if index in bases:
+            raster = Chart(raster.array.copy(), raster.gauge)
+        return PIECES[names[index]][1](data, raster)
+
+    for index in missing:
+        tasks[index] = asyncio.ensure_future(rasterize(index))
+    try:
+        for index, raster in enumerate(rasters):
+            if raster is not None:
+                yield index, finish(index, raster)
+        for task in asyncio.as_completed(list(tasks.values())):
+            index, raster = await task
+            yield index, finish(index, raster)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        # 再利用元の失敗などで投入しなかったパーツの空きを返す
+        reservation.release()
+
+async def generate_charts_concurrently(data: SweaterDimensions, pool: ChartWorkerPool, wait: bool = False, on_piece=None) -> dict[str, Chart]:
+    """
+    パーツごとの処理をワーカープールで並列に実行し、結果をまとめる
+
+    後身頃と袖をそれぞれ1つの処理として投入し、前身頃は後身頃のチャートができてから襟ぐりの帯だけを
+    生成する処理として投入する。ワーカーが空いていれば、後身頃と前身頃の帯・袖の長い方の生成時間で全体が終わる
+
+    Args:
+        data (SweaterDimensions): 検証済みの寸法データクラス
+        pool (ChartWorkerPool): ワーカープール
+        wait (bool): ワーカープールが混雑している場合に、失敗せずに空きができるまで待つかどうか
+        on_piece: パーツのチャートができるたびに、そのパーツのパーツ名とチャートを渡して呼ぶ関数
+
+    Returns:
+        dict[str, Chart]: パーツ名とチャート
+    """
+    results = {}
+    async for index, piece_charts in _generate_pieces(data, pool, wait=wait):
+        results[index] = piece_charts
+        if on_piece is not None:
+            on_piece(piece_charts)
+
+    charts = {}
+    for index in sorted(results):
+        charts.update(results[index])
+    return charts
+
+def grade_body_charts(sizes: list[SweaterDimensions]) -> list[dict[str, Chart]]:
+    """
+    サイズ展開の身頃のチャートを、小さいサイズから順に直前のサイズの結果を再利用して生成する
+
+    Args:
+        sizes (list[SweaterDimensions]): 小さい順に並べたサイズごとの寸法
+
+    Returns:
+        list[dict[str, Chart]]: サイズごとのパーツ名とチャート
+    """
+    results = []
+    front_body = back_body = None
+    for data in sizes:
+        back_body = Chart.from_shape_reusing(Shape.back_body_from(data), back_body)
+        front_body = Chart.from_shape_reusing(Shape.front_body_from(data), front_body)
+        results.append(_finish_body_charts(
+            data,
+            Chart(front_body.chart.array.copy(), data.gauge),
+            Chart(back_body.chart.array.copy(), data.gauge),
+        ))
+    return results
+
+def grade_sleeve_charts(sizes: list[SweaterDimensions]) -> list[dict[str, Chart]]:
+    """
+    サイズ展開の袖のチャートを、小さいサイズから順に直前のサイズの結果を再利用して生成する
+
+    Args:
+        sizes (list[SweaterDimensions]): 小さい順に並べたサイズごとの寸法
+
+    Returns:
+        list[dict[str, Chart]]: サイズごとのパーツ名とチャート
+    """
+    results = []
+    sleeve = None
+    for data in sizes:
+        sleeve = Chart.from_shape_reusing(Shape.sleeve_from(data), sleeve)
+        results.append(_finish_sleeve_charts(data, Chart(sleeve.chart.array.copy(), data.gauge)))
+    return results
+
+# サイズ展開で、パーツごとに独立して実行できるチャート生成の処理
+GRADED_PIECE_GENERATORS = [
+    grade_body_charts,
+    grade_sleeve_charts,
+]
+
+def generate_graded_charts(sizes: list[SweaterDimensions]) -> list[dict[str, Chart]]:
+    """
+    サイズ展開の全てのパーツのチャートを順番に生成する
+
+    Args:
+        sizes (list[SweaterDimensions]): 小さい順に並べたサイズごとの寸法
+
+    Returns:
+        list[dict[str, Chart]]: サイズごとのパーツ名とチャート
+    """
+    results: list[dict[str, Chart]] = [{} for _ in sizes]
+    for generator in GRADED_PIECE_GENERATORS:
+        for charts, piece_charts in zip(results, generator(sizes)):
+            charts.update(piece_charts)
+    return results
+
+async def generate_graded_charts_concurrently(sizes: list[SweaterDimensions], pool: ChartWorkerPool) -> list[dict[str, Chart]]:
+    """
+    サイズ展開のパーツごとの処理をワーカープールで並列に実行し、結果をまとめる
+
+    各パーツはサイズの順に1つのワーカーで生成し、直前のサイズの結果を再利用する
+
+    Args:
+        sizes (list[SweaterDimensions]): 小さい順に並べたサイズごとの寸法
+        pool (ChartWorkerPool): ワーカープール
+
+    Returns:
+        list[dict[str, Chart]]: サイズごとのパーツ名とチャート
+    """
+    reservation = pool.reserve(len(GRADED_PIECE_GENERATORS))
+    try:
+        results = await asyncio.gather(*[reservation.run(generator, sizes) for generator in GRADED_PIECE_GENERATORS])
+    finally:
+        reservation.release()
+
+    graded: list[dict[str, Chart]] = [{} for _ in sizes]
+    for piece_results in results:
+        for charts, piece_charts in zip(graded, piece_results):
+            charts.update(piece_charts)
+    return graded
+
+# 差分の再生成で、内外判定・記号の挿入の結果を保持するパーツとシェイプ、シェイプの寸法
+_INCREMENTAL_PIECES = {
+    "back_body": (Shape.back_body_from, lambda data: _body_piece_key(data, is_front=False)),
+    "front_body": (Shape.front_body_from, lambda data: _body_piece_key(data, is_front=True)),
+    "sleeve": (Shape.sleeve_from, _sleeve_piece_key),
+}
+
+def _rasterize_pieces(
+    data: SweaterDimensions,
+    previous: dict[str, RasterizedPiece] | None = None,
+    reuse: frozenset[str] | set[str] = frozenset(),
+) -> dict[str, RasterizedPiece]:
+    """
+    身頃と袖のシェイプの内外判定・記号の挿入を、previous の同じパーツの結果を再利用して行う
+
+    reuse に含まれるパーツは、シェイプが変わらないものとして previous の結果をそのまま使う
+    """
+    previous = previous or {}
+    return {
+        name: previous[name] if name in reuse else Chart.from_shape_reusing(build(data), previous.get(name))
+        for name, (build, _) in _INCREMENTAL_PIECES.items()
+    }
+
+def _finish_pieces(data: SweaterDimensions, pieces: dict[str, RasterizedPiece]) -> dict[str, Chart]:
+    """ _rasterize_pieces の結果にゴム編みを入れ、パーツ名とチャートにする """
+    def copy(name):
+        return Chart(pieces[name].chart.array.copy(), data.gauge)
+    charts = _finish_body_charts(data, copy("front_body"), copy("back_body"))
+    charts.update(_finish_sleeve_charts(data, copy("sleeve")))
+    return charts
+
+def row_diff(previous: Chart | None, chart: Chart) -> dict:
+    """
+    previous から chart への段単位の差分を返す
+
+    上端から一致する段数 keep_top と下端から一致する段数 keep_bottom の段は previous のものを使い、
+    間の段を rows で置き換える。列数が異なる場合は全ての段を置き換える
+
+    Returns:
+        dict: shape, keep_top, keep_bottom, rows
+    """
+    num_rows, num_cols = chart.array.shape
+    keep_top = keep_bottom = 0
+    if previous is not None and previous.array.shape[1] == num_cols:
+        num_shared = min(num_rows, previous.array.shape[0])
+        top_equal = (chart.array[:num_shared] == previous.array[:num_shared]).all(axis=1)
+        keep_top = num_shared if top_equal.all() else int(np.argmin(top_equal))
+        bottom_equal = (chart.array[num_rows - num_shared:] == previous.array[previous.array.shape[0] - num_shared:]).all(axis=1)[::-1]
+        keep_bottom = num_shared if bottom_equal.all() else int(np.argmin(bottom_equal))
+        # 両端から一致する段が重なる場合は上端を優先する
+        keep_bottom = min(keep_bottom, num_rows - keep_top, previous.array.shape[0] - keep_top)
+    return {
+        "shape": [num_rows, num_cols],
+        "keep_top": keep_top,
+        "keep_bottom": keep_bottom,
+        "rows": chart.array[keep_top:num_rows - keep_bottom].tolist(),
+    }
+
+def apply_row_diff(previous: np.ndarray | None, diff: dict) -> np.ndarray:
+    """ row_diff の差分を previous に適用したチャートの配列を返す """
+    num_rows, num_cols = diff["shape"]
+    rows = np.array(diff["rows"], dtype=np.int8).reshape(-1, num_cols)
+    parts = [rows]
+    if diff["keep_top"]:
+        parts.insert(0, previous[:diff["keep_top"]]) # type: ignore
+    if diff["keep_bottom"]:
+        parts.append(previous[previous.shape[0] - diff["keep_bottom"]:]) # type: ignore
+    return np.concatenate(parts)
+
+def regenerate_charts(
+    data: SweaterDimensions,
+    previous_data: SweaterDimensions,
+    previous_pieces: dict[str, RasterizedPiece] | None = None
+) -> tuple[dict[str, RasterizedPiece], dict[str, Chart], dict[str, dict], list[str]]:
+    """
+    previous_data から data に寸法を変更したチャートを、変更の影響を受ける段だけ生成し直す
+
+    シェイプが変わらないパーツは内外判定・記号の挿入をせずに previous_pieces の結果を使い、
+    シェイプが変わるパーツは Chart.from_shape_reusing で輪郭が変わる段だけ生成し直す。
+    前身頃の形状だけが変わる場合などは、前身頃を分け直すだけになる
+
+    Args:
+        data (SweaterDimensions): 変更後の寸法
+        previous_data (SweaterDimensions): 変更前の寸法
+        previous_pieces (dict[str, RasterizedPiece]): 変更前の _rasterize_pieces の結果。
+            None の場合は previous_data から生成する
+
+    Returns:
+        tuple: 変更後の _rasterize_pieces の結果、パーツ名とチャート、パーツ名と変更前からの段単位の差分、
+            変更後に無くなったパーツ名
+    """
+    if previous_pieces is None:
+        previous_pieces = _rasterize_pieces(previous_data)
+
+    # シェイプの寸法が変わらないパーツはそのまま使う
+    reuse = {
+        name for name, (_, piece_key) in _INCREMENTAL_PIECES.items()
+        if name in previous_pieces and piece_key(previous_data) == piece_key(data)
+    }
+    pieces = _rasterize_pieces(data, previous_pieces, reuse)
+
+    previous_charts = _finish_pieces(previous_data, previous_pieces)
+    charts = _finish_pieces(data, pieces)
+    diffs = {name: row_diff(previous_charts.get(name), chart) for name, chart in charts.items()}
+    return pieces, charts, diffs, sorted(set(previous_charts) - set(charts))
+
+def serialize_charts(charts: dict[str, Chart], output_format: OutputFormat) -> bytes:
+    """
+    チャートを指定された形式でメモリ上に書き出す
+
+    Args:
+        charts (dict[str, Chart]): パーツ名とチャート
+        output_format (OutputFormat): 出力ファイルの形式
+
+    Returns:
+        bytes: ファイルの内容
+    """
+    if output_format is OutputFormat.XLSX:
+        return XLSX.from_charts(charts).to_bytes()
+
+    # CSV はパーツごとに見出しを付けて続けて書き出す
+    stream = io.BytesIO()
+    Chart.write_csv_charts(stream, charts)
+    return stream.getvalue()
+
+def generate_output(data: SweaterDimensions, output_format: OutputFormat = OutputFormat.CSV) -> bytes:
+    """
+    データから生成したファイルの内容を返す
+
+    Args:
+        data (SweaterDimensions): 検証済みの寸法データクラス
+        output_format (OutputFormat): 出力ファイルの形式
+
+    Returns:
+        bytes: ファイルの内容
+    
+    """
+    return serialize_charts(generate_charts(data), output_format)
@@ -0,0 +1,58 @@
+import json
+import os
+import sys
+
+import pytest
+
+# テストではワーカーをスレッドで起動する
+os.environ.setdefault("SWEATER_CHART_EXECUTOR", "thread")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import Gauge, Metric, SweaterDimensions, SweaterType  # noqa: E402
+
+
+def make_dimensions(**changes) -> SweaterDimensions:
+    """ 標準的な寸法の一部を変更した SweaterDimensions を返す """
+    fields = dict(
+        gauge=Gauge(metric=Metric.MM, vertical=24.5, horizontal=18.5),
+        length_of_body=530,
+        length_of_shoulder_drop=20,
+        length_of_ribbed_hem=70,
+        length_of_front_neck_drop=75,
+        length_of_back_neck_drop=20,
+        width_of_body=460,
+        width_of_neck=160,
+        length_of_sleeve=510,
+        length_of_ribbed_cuff=70,
+        width_of_sleeve=180,
+        width_of_cuff=110,
+        type=SweaterType.CREW_NECK_SWEATER,
+        is_odd=True,
+    )
+    fields.update(changes)
+    return SweaterDimensions(**fields)
+
+
+def request_body(data: SweaterDimensions) -> dict:
+    """ API に送る JSON の寸法（計算される項目を除く） """
+    body = json.loads(data.model_dump_json(exclude=set(SweaterDimensions.model_computed_fields)))
+    body["gauge"] = json.loads(data.gauge.model_dump_json(exclude=set(Gauge.model_computed_fields)))
+    return body
+
+
+# 目数の偶奇・ゲージ・身幅を変えた寸法
+CASES = [
+    make_dimensions(
+        is_odd=is_odd,
+        gauge=Gauge(metric=Metric.MM, vertical=vertical, horizontal=horizontal),
+        width_of_body=width_of_body,
+    )
+    for is_odd in (True, False)
+    for vertical, horizontal in ((24.5, 18.5), (30, 22), (40, 33))
+    for width_of_body in (460, 520)
+]
+
+
+@pytest.fixture(params=range(len(CASES)), ids=lambda i: f"case{i}")
+def dimensions(request) -> SweaterDimensions:
+    return CASES[request.param]
@@ -0,0 +1,183 @@
+import asyncio
+import io
+import json
+import zipfile
+
+import numpy as np
+import pytest
+
+from fastapi.testclient import TestClient
+
+from conftest import make_dimensions, request_body
+import main
+from main import MAX_BATCH_SIZE, ChartCache, OutputFormat, SweaterType, generate_charts, generate_output
+
+
+def test_batch_archive_contains_every_item_and_status():
+    items = [make_dimensions(), make_dimensions(length_of_body=530.01), make_dimensions(width_of_body=520)]
+    with TestClient(main.app) as client:
+        response = client.post("/generate_sweater_charts", json=[request_body(item) for item in items])
+    assert response.status_code == 200
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    names = [f"{i}_{OutputFormat.CSV.filename}" for i in range(len(items))]
+    assert sorted(archive.namelist()) == sorted([*names, "status.json"])
+    for name, item in zip(names, items):
+        assert archive.read(name) == generate_output(item)
+
+    statuses = json.loads(archive.read("status.json"))
+    assert [status["file"] for status in statuses] == names
+    assert [status["status"] for status in statuses] == ["ok"] * len(items)
+    # 丸めると同じ寸法は1件目の結果を使う
+    assert [status["duplicate_of"] for status in statuses] == [None, 0, None]
+    assert statuses[0]["key"] == statuses[1]["key"] != statuses[2]["key"]
+
+
+def test_batch_items_wait_for_a_busy_pool(monkeypatch):
+    pool = main.ChartWorkerPool(max_workers=len(main.PIECES), max_queue=0, executor_type=main.ExecutorType.THREAD)
+    monkeypatch.setattr(main, "worker_pool", pool)
+    monkeypatch.setattr(main, "result_cache", ChartCache(max_entries=4, max_bytes=64 * 1024 * 1024))
+    main.chart_memo.clear()
+    main.shape_memo.clear()
+    items = [make_dimensions(), make_dimensions(width_of_body=520), make_dimensions(width_of_sleeve=200)]
+
+    async def scenario():
+        # 他のリクエストが空きを全て使っている間に一括生成を始め、少し後に空きを返す
+        held = pool.reserve(pool.max_workers)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, held.release)
+        return [chunk async for chunk in main._generate_batch_archive(items, OutputFormat.CSV)]
+
+    try:
+        chunks = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    statuses = json.loads(archive.read("status.json"))
+    assert [status["status"] for status in statuses] == ["ok"] * len(items)
+    for status, item in zip(statuses, items):
+        assert archive.read(status["file"]) == generate_output(item)
+    assert pool.num_pending == 0
+
+
+def test_batch_rejects_too_many_items():
+    body = request_body(make_dimensions())
+    with TestClient(main.app) as client:
+        assert client.post("/generate_sweater_charts", json=[]).status_code == 422
+        assert client.post("/generate_sweater_charts", json=[body] * (MAX_BATCH_SIZE + 1)).status_code == 422
+
+
+def _parse_events(text: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def _preview(client, data) -> tuple[list[str], dict[str, np.ndarray]]:
+    """ プレビューのイベントの種類と、段のイベントから組み立てたチャートを返す """
+    response = client.post("/preview_sweater_chart", json=request_body(data))
+    assert response.status_code == 200
+    return _reconstruct(response.text)
+
+
+def _reconstruct(text: str) -> tuple[list[str], dict[str, np.ndarray]]:
+    events = _parse_events(text)
+    charts = {}
+    for event, payload in events:
+        if event == "piece":
+            charts[payload["piece"]] = np.full(payload["shape"], 127, dtype=np.int8)
+        elif event == "rows":
+            rows = np.array(payload["rows"], dtype=np.int8).reshape(-1, charts[payload["piece"]].shape[1])
+            charts[payload["piece"]][payload["start"]:payload["start"] + len(rows)] = rows
+    return [event for event, _ in events], charts
+
+
+@pytest.mark.parametrize("sweater_type", [SweaterType.CREW_NECK_SWEATER, SweaterType.CREW_NECK_CARDIGAN])
+def test_preview_events_reconstruct_charts(monkeypatch, sweater_type):
+    monkeypatch.setattr(main, "result_cache", ChartCache(max_entries=4, max_bytes=64 * 1024 * 1024))
+    data = make_dimensions(type=sweater_type)
+    expected = generate_charts(data)
+
+    with TestClient(main.app) as client:
+        events, charts = _preview(client, data)
+        assert events[0] == "outline" and events[-1] == "done"
+        assert sorted(charts) == sorted(expected)
+        for name, chart in expected.items():
+            assert np.array_equal(charts[name], chart.array)
+
+        # 2回目はキャッシュのチャートを輪郭なしで送信する
+        events, charts = _preview(client, data)
+        assert "outline" not in events and events[-1] == "done"
+        assert list(charts) == list(expected)
+        for name, chart in expected.items():
+            assert np.array_equal(charts[name], chart.array)
+
+
+def test_preview_by_key_for_event_source(monkeypatch):
+    monkeypatch.setattr(main, "result_cache", ChartCache(max_entries=4, max_bytes=64 * 1024 * 1024))
+    main.preview_dimensions.clear()
+    data = make_dimensions(width_of_body=505)
+    expected = generate_charts(data)
+
+    with TestClient(main.app) as client:
+        assert client.get("/preview_sweater_chart/unknown").status_code == 404
+
+        key = client.post("/preview_sweater_chart_key", json=request_body(data)).json()["key"]
+        assert key == data.canonical_hash()
+        response = client.get(f"/preview_sweater_chart/{key}")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events, charts = _reconstruct(response.text)
+        assert events[0] == "outline" and events[-1] == "done"
+        for name, chart in expected.items():
+            assert np.array_equal(charts[name], chart.array)
+
+        # 寸法の登録が消えても、キャッシュにあれば送信する
+        main.preview_dimensions.clear()
+        events, charts = _reconstruct(client.get(f"/preview_sweater_chart/{key}").text)
+        assert "outline" not in events and events[-1] == "done"
+        assert list(charts) == list(expected)
+
+
+def test_preview_miss_joins_in_flight_generation(monkeypatch):
+    monkeypatch.setattr(main, "result_cache", ChartCache(max_entries=4, max_bytes=64 * 1024 * 1024))
+    flight = main.SingleFlight()
+    monkeypatch.setattr(main, "generation_flight", flight)
+    data = make_dimensions(width_of_body=515)
+    key = data.canonical_hash()
+    expected = generate_charts(data)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def held_generation():
+            await release.wait()
+            return await main._generate_and_cache(key, data)
+
+        # /generate_sweater_chart の生成が実行中の間にプレビューを始める
+        generation = asyncio.ensure_future(flight.run(key, held_generation))
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        text = b"".join([event async for event in main._generate_preview_events(key, data)]).decode()
+        await generation
+        return text
+
+    events, charts = _reconstruct(asyncio.run(scenario()))
+    assert flight.num_coalesced == 1
+    assert events[0] == "outline" and events[-1] == "done"
+    assert list(charts) == list(expected)
+    for name, chart in expected.items():
+        assert np.array_equal(charts[name], chart.array)
+
+
+@pytest.mark.parametrize("path", ["/generate_sweater_chart", "/preview_sweater_chart"])
+def test_saturated_pool_returns_503_with_retry_after(monkeypatch, path):
+    monkeypatch.setattr(main, "result_cache", ChartCache(max_entries=4, max_bytes=64 * 1024 * 1024))
+    pool = main.worker_pool
+    monkeypatch.setattr(pool, "_num_pending", pool.max_workers + pool.max_queue)
+    with TestClient(main.app) as client:
+        response = client.post(path, json=request_body(make_dimensions()))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(pool.retry_after)
+    assert response.json()["detail"] == main._SATURATED_DETAIL
@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import CASES, make_dimensions
+from main import Chart, Gauge, Metric, Shape, Symbol, SweaterDimensions, SweaterType, generate_charts
+
+# 既知の寸法から生成したチャート
+#   case{i}/{パーツ名}                 : 現在の Chart.from_shape の結果
+#   case{i}/{パーツ名}/before_user003 : 100点で標本化していた頃の Chart.from_shape の結果
+#   {形状}/{パーツ名}                   : 現在の generate_charts の結果
+#   revalidated/{パーツ名}              : REVALIDATED の generate_charts の結果
+BASELINE = np.load(os.path.join(os.path.dirname(__file__), "data", "baseline_charts.npz"))
+
+PIECE_SHAPES = {
+    "front_body": Shape.front_body_from,
+    "back_body": Shape.back_body_from,
+    "sleeve": Shape.sleeve_from,
+}
+
+# 丸め済みの寸法をもう一度検証すると、割り算の誤差で身頃の寸法が1目減っていた寸法
+REVALIDATED = make_dimensions(
+    gauge=Gauge(metric=Metric.MM, vertical=36.6, horizontal=28.4),
+    length_of_body=534,
+    length_of_shoulder_drop=18,
+    length_of_ribbed_hem=61,
+    length_of_front_neck_drop=70,
+    length_of_back_neck_drop=26,
+    width_of_body=447,
+    width_of_neck=169,
+    length_of_sleeve=517,
+    length_of_ribbed_cuff=84,
+    width_of_sleeve=185,
+    width_of_cuff=94,
+    is_odd=False,
+)
+
+# パーツごとの (丈, ゴム編みの長さ, ゴム編みの段数)
+RIBBINGS = {
+    "front_body": lambda data: (data.length_of_body, data.length_of_ribbed_hem, data.rows_of_ribbed_hem),
+    "back_body": lambda data: (data.length_of_body, data.length_of_ribbed_hem, data.rows_of_ribbed_hem),
+    "sleeve": lambda data: (data.length_of_sleeve, data.length_of_ribbed_cuff, data.rows_of_ribbed_cuff),
+}
+
+
+@pytest.mark.parametrize("piece", PIECE_SHAPES)
+def test_from_shape_matches_baseline(dimensions, piece):
+    index = CASES.index(dimensions)
+    chart = Chart.from_shape(PIECE_SHAPES[piece](dimensions))
+    assert np.array_equal(chart.array, BASELINE[f"case{index}/{piece}"])
+
+
+@pytest.mark.parametrize("sweater_type", list(SweaterType), ids=lambda t: t.value)
+def test_generate_charts_matches_baseline(sweater_type):
+    charts = generate_charts(make_dimensions(type=sweater_type))
+    names = sorted(key.split("/")[1] for key in BASELINE.files if key.startswith(f"{sweater_type.value}/"))
+    assert sorted(charts) == names
+    for name, chart in charts.items():
+        assert np.array_equal(chart.array, BASELINE[f"{sweater_type.value}/{name}"]), name
+
+
+def test_revalidated_charts_match_baseline():
+    """ 丸め済みの寸法をもう一度検証しても、同じチャートになる """
+    for data in (REVALIDATED, SweaterDimensions(**REVALIDATED.model_dump(exclude=set(SweaterDimensions.model_computed_fields)))):
+        charts = generate_charts(data)
+        names = sorted(key.split("/")[1] for key in BASELINE.files if key.startswith("revalidated/"))
+        assert sorted(charts) == names
+        for name, chart in charts.items():
+            assert np.array_equal(chart.array, BASELINE[f"revalidated/{name}"]), name
+
+
+@pytest.mark.parametrize("piece", PIECE_SHAPES)
+def test_adaptive_flattening_changes_only_outline_cells(dimensions, piece):
+    """ 折れ線近似を変えた際に結果が変わったのは、輪郭に接するわずかなグリッドだけ """
+    index = CASES.index(dimensions)
+    current = BASELINE[f"case{index}/{piece}"]
+    before = BASELINE[f"case{index}/{piece}/before_user003"]
+    assert current.shape == before.shape
+
+    rows, cols = np.nonzero(current != before)
+    assert len(rows) <= 20
+
+    # 変わったグリッドの2目以内に、内外の境界がある
+    inside = np.pad(current != Symbol.NONE.number, 2, constant_values=False)
+    for row, col in zip(rows, cols):
+        window = inside[row:row + 5, col:col + 5]
+        assert window.any() and not window.all()
+
+
+@pytest.mark.parametrize("piece", PIECE_SHAPES)
+def test_ribbing_covers_only_ribbing_rows_of_baseline(dimensions, piece):
+    """ ゴム編みは基準のチャートの下端から、ゴム編みの段数だけに入る """
+    index = CASES.index(dimensions)
+    baseline = BASELINE[f"case{index}/{piece}"]
+    length, length_of_ribbing, num_ribbing_rows = RIBBINGS[piece](dimensions)
+    start_row = baseline.shape[0] - num_ribbing_rows
+
+    chart = Chart(baseline.copy(), dimensions.gauge)
+    chart.replace_vertical_stripes_below(start_row, Symbol.KNIT.number, Symbol.PURL.number, in_place=True)
+    changed_rows = np.flatnonzero((chart.array != baseline).any(axis=1))
+    assert changed_rows.tolist() == list(range(start_row, baseline.shape[0]))
+
+    # 以前の開始段は追加された最上行を数えておらず、ゴム編みの上の段まで縞にすることがあった
+    # （丈の段数が切り捨てで1段減る場合だけ一致する）
+    previous_start_row = int((length - length_of_ribbing) / dimensions.gauge.stitch_length)
+    assert start_row - previous_start_row in (0, 1, 2)
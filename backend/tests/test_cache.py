@@ -0,0 +1,148 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import make_dimensions
+from main import Chart, ChartCache, Gauge, SingleFlight, SweaterDimensions, Symbol
+
+GAUGE = Gauge(vertical=10, horizontal=10)
+
+
+def _charts(value: int = Symbol.KNIT.number, size: int = 4) -> dict[str, Chart]:
+    return {"front_body": Chart(np.full((size, size), value, dtype=np.int8), GAUGE)}
+
+
+def test_dimensions_rounding_to_the_same_stitches_share_a_key():
+    base = make_dimensions()
+    # 1目・1段より十分小さい差は丸めると同じ寸法になる
+    assert make_dimensions(length_of_body=530.01, width_of_body=460.01).canonical_hash() == base.canonical_hash()
+    # 検証し直しても（丸め直しても）キーは変わらない
+    assert SweaterDimensions.model_validate(base.model_dump()).canonical_hash() == base.canonical_hash()
+
+
+def test_dimensions_with_different_charts_have_different_keys():
+    base = make_dimensions()
+    assert make_dimensions(length_of_body=560).canonical_hash() != base.canonical_hash()
+    assert make_dimensions(is_odd=False).canonical_hash() != base.canonical_hash()
+
+
+def test_cache_returns_stored_charts_read_only():
+    cache = ChartCache(max_entries=2, max_bytes=1024)
+    assert cache.get("a") is None
+
+    charts = _charts()
+    cache.put("a", charts)
+    entry = cache.get("a")
+    assert entry is not None and entry.charts is charts
+    assert not entry.charts["front_body"].array.flags.writeable
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ChartCache(max_entries=2, max_bytes=1024)
+    cache.put("a", _charts())
+    cache.put("b", _charts())
+    cache.get("a")
+    cache.put("c", _charts())
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+    # 合計バイト数の上限を超えた分も削除する
+    cache = ChartCache(max_entries=10, max_bytes=40)
+    cache.put("a", _charts())
+    cache.put("b", _charts())
+    cache.put_output("b", "csv", b"x" * 16)
+    assert cache.get("a") is None
+    assert cache.get("b").outputs == {"csv": b"x" * 16}
+
+
+def test_cache_reloads_evicted_entries_from_disk(tmp_path):
+    cache = ChartCache(max_entries=1, max_bytes=1024, directory=str(tmp_path))
+    cache.put("a", _charts(Symbol.PURL.number))
+    cache.put_output("a", "csv", b"content")
+    cache.put("b", _charts())
+    assert len(cache) == 1
+
+    entry = cache.get("a")
+    assert entry is not None
+    assert np.array_equal(entry.charts["front_body"].array, _charts(Symbol.PURL.number)["front_body"].array)
+    assert entry.outputs == {"csv": b"content"}
+
+
+def test_async_cache_does_disk_io_off_the_event_loop(tmp_path, monkeypatch):
+    cache = ChartCache(max_entries=1, max_bytes=1024, directory=str(tmp_path))
+    io_threads = []
+    save, load = cache._save, cache._load
+
+    def recording_save(*args):
+        io_threads.append(threading.get_ident())
+        return save(*args)
+
+    def recording_load(*args):
+        io_threads.append(threading.get_ident())
+        return load(*args)
+
+    monkeypatch.setattr(cache, "_save", recording_save)
+    monkeypatch.setattr(cache, "_load", recording_load)
+
+    async def scenario():
+        await cache.put_async("a", _charts(Symbol.PURL.number))
+        await cache.put_output_async("a", "csv", b"content")
+        await cache.put_async("b", _charts())
+        return threading.get_ident(), await cache.get_async("a")
+
+    loop_thread, entry = asyncio.run(scenario())
+    assert len(io_threads) == 4 and loop_thread not in io_threads
+    assert np.array_equal(entry.charts["front_body"].array, _charts(Symbol.PURL.number)["front_body"].array)
+    assert entry.outputs == {"csv": b"content"}
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    async def generate(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return object()
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.run(key, lambda key=key: generate(key)) for key in "aab"))
+        assert results[0] is results[1] and results[0] is not results[2]
+        assert sorted(calls) == ["a", "b"] and flight.num_coalesced == 1
+        assert len(flight) == 0
+
+        # 完了後は新たに実行する
+        await flight.run("a", lambda: generate("a"))
+        assert calls.count("a") == 2
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_shares_errors_and_survives_cancellation():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    async def finish():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        results = await asyncio.gather(flight.run("a", fail), flight.run("a", fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+        # 待っている呼び出し元がキャンセルされても、共有している処理は続く
+        first = asyncio.ensure_future(flight.run("b", finish))
+        second = asyncio.ensure_future(flight.run("b", finish))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "done"
+
+    asyncio.run(scenario())
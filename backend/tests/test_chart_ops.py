@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+from main import Chart, Gauge, RunLengthChart, Symbol
+
+GAUGE = Gauge(vertical=10, horizontal=10)
+NONE, KNIT, PURL = Symbol.NONE.number, Symbol.KNIT.number, Symbol.PURL.number
+
+
+def _random_arrays(seed, count=500):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        shape = tuple(rng.integers(1, 12, size=2))
+        yield rng.choice([NONE, KNIT, PURL], size=shape).astype(np.int8), rng
+
+
+def _apply_both_ways(array, operation):
+    """ 同じ操作を in_place=False と in_place=True で適用した配列を返す """
+    copied = Chart(array.copy(), GAUGE)
+    original = copied.array
+    operation(copied, False)
+    # コピーする場合は元の配列を書き換えない
+    assert np.array_equal(original, array)
+
+    in_place = Chart(array.copy(), GAUGE)
+    operation(in_place, True)
+    return copied.array, in_place.array
+
+
+def test_replace_in_in_place_equals_copy():
+    template = np.array([[NONE, KNIT]])
+    for array, rng in _random_arrays(0):
+        start_row, step_rows = int(rng.integers(0, 3)), int(rng.integers(1, 3))
+        copied, in_place = _apply_both_ways(
+            array, lambda chart, in_place: chart._replace_in(template, PURL, (0, 0), start_row, step_rows, in_place=in_place)
+        )
+        assert np.array_equal(copied, in_place)
+
+
+def test_insert_pattern_repeatedly_in_place_equals_copy():
+    pattern = np.array([[KNIT, PURL], [PURL, KNIT]])
+    for array, rng in _random_arrays(1):
+        h, w = array.shape
+        start_row, start_col = int(rng.integers(0, h)), int(rng.integers(0, w))
+        end_row, end_col = int(rng.integers(start_row, h + 1)), int(rng.integers(start_col, w + 1))
+        copied, in_place = _apply_both_ways(
+            array,
+            lambda chart, in_place: chart.insert_pattern_repeatedly(pattern, start_row, end_row, start_col, end_col, in_place=in_place),
+        )
+        assert np.array_equal(copied, in_place)
+
+
+def test_symmetrize_rows_in_place_equals_copy():
+    for array, rng in _random_arrays(2):
+        start_row = int(rng.integers(0, array.shape[0]))
+        based_on_right = bool(rng.integers(0, 2))
+        copied, in_place = _apply_both_ways(
+            array, lambda chart, in_place: chart.symmetrize_rows(start_row, based_on_right=based_on_right, in_place=in_place)
+        )
+        assert np.array_equal(copied, in_place)
+
+
+def test_replace_vertical_stripes_below_in_place_equals_copy():
+    for array, rng in _random_arrays(3):
+        start_row = int(rng.integers(0, array.shape[0]))
+        copied, in_place = _apply_both_ways(
+            array, lambda chart, in_place: chart.replace_vertical_stripes_below(start_row, KNIT, PURL, in_place=in_place)
+        )
+        assert np.array_equal(copied, in_place)
+
+
+def test_insert_row_to_top_uses_headroom():
+    for array, _ in _random_arrays(4):
+        copied = Chart(array.copy(), GAUGE)
+        copied._insert_row_to_top(fill=NONE)
+
+        allocated = Chart.allocate(array.shape, GAUGE)
+        allocated.array[...] = array
+        buffer = allocated._buffer
+        allocated._insert_row_to_top(fill=NONE, in_place=True)
+
+        assert np.array_equal(allocated.array, copied.array)
+        # 確保済みの領域を使い、配列をコピーしない
+        assert np.shares_memory(allocated.array, buffer)
+
+        # 確保した行を使い切った後はコピーして挿入する
+        allocated._insert_row_to_top(fill=KNIT, in_place=True)
+        copied._insert_row_to_top(fill=KNIT)
+        assert np.array_equal(allocated.array, copied.array)
+
+
+def _assert_runs_equal_dense(runs: RunLengthChart, chart: Chart):
+    assert np.array_equal(runs.to_array(), chart.array)
+    # 連は常に隣り合う同じ値をまとめた形で保持する
+    assert list(runs.row_runs()) == list(chart.row_runs())
+    for symbol in (NONE, KNIT, PURL):
+        assert runs.count(symbol) == chart.count(symbol)
+        assert np.array_equal(runs.count(symbol, per_row=True), chart.count(symbol, per_row=True))
+
+
+def _random_operations(rng, shape):
+    h, w = shape
+    start_row, end_row = sorted(int(n) for n in rng.integers(0, h + 1, size=2))
+    start_col, end_col = sorted(int(n) for n in rng.integers(0, w + 1, size=2))
+    pattern = rng.choice([NONE, KNIT, PURL], size=tuple(rng.integers(1, 4, size=2))).astype(np.int8)
+    symbol, stripe_symbol = (int(n) for n in rng.choice([NONE, KNIT, PURL], size=2, replace=False))
+    based_on_right = bool(rng.integers(0, 2))
+    return [
+        lambda chart: chart.replace_vertical_stripes_below(start_row, symbol, stripe_symbol, in_place=True),
+        lambda chart: chart.insert_pattern_repeatedly(pattern, start_row, end_row, start_col, end_col, in_place=True),
+        lambda chart: chart.symmetrize_rows(start_row, end_row, based_on_right=based_on_right, in_place=True),
+    ]
+
+
+def test_run_length_operations_equal_dense():
+    for array, rng in _random_arrays(5, count=1000):
+        chart = Chart(array.copy(), GAUGE)
+        runs = RunLengthChart.from_array(array, GAUGE)
+        _assert_runs_equal_dense(runs, chart)
+        for operation in _random_operations(rng, array.shape):
+            operation(chart)
+            operation(runs)
+            _assert_runs_equal_dense(runs, chart)
+
+
+@pytest.mark.parametrize("rows, cols", [((0, 5), (3, 8)), ((0, 5), (-1, 2)), ((2, 7), (0, 5)), ((-1, 2), (0, 5))])
+def test_run_length_insert_pattern_outside_chart_raises(rows, cols):
+    array = np.zeros((5, 5), dtype=np.int8)
+    pattern = np.array([[KNIT, PURL]], dtype=np.int8)
+    # 密な Chart と同じく、はみ出す範囲は受け付けない
+    with pytest.raises(ValueError):
+        Chart(array.copy(), GAUGE).insert_pattern_repeatedly(pattern, *rows, *cols, in_place=True)
+    runs = RunLengthChart.from_array(array, GAUGE)
+    with pytest.raises(ValueError):
+        runs.insert_pattern_repeatedly(pattern, *rows, *cols)
+    assert np.array_equal(runs.to_array(), array)
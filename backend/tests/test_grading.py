@@ -0,0 +1,114 @@
+import random
+
+import numpy as np
+
+from conftest import make_dimensions
+from main import (
+    GRADABLE_FIELDS,
+    Chart,
+    Rasterizer,
+    Shape,
+    SizeGrading,
+    SweaterDimensions,
+    SweaterType,
+    generate_charts,
+    generate_graded_charts,
+)
+
+
+def _random_raw_dimensions(rng: random.Random, sweater_type: str = "crew-neck-sweater") -> dict:
+    return dict(
+        gauge=dict(metric="mm", vertical=round(rng.uniform(18, 40), 1), horizontal=round(rng.uniform(14, 33), 1)),
+        length_of_body=rng.uniform(450, 650),
+        length_of_shoulder_drop=rng.uniform(10, 40),
+        length_of_ribbed_hem=rng.uniform(30, 90),
+        length_of_front_neck_drop=rng.uniform(50, 100),
+        length_of_back_neck_drop=rng.uniform(10, 30),
+        width_of_body=rng.uniform(380, 600),
+        width_of_neck=rng.uniform(140, 200),
+        length_of_sleeve=rng.uniform(400, 600),
+        length_of_ribbed_cuff=rng.uniform(30, 90),
+        width_of_sleeve=rng.uniform(150, 220),
+        width_of_cuff=rng.uniform(80, 130),
+        type=sweater_type,
+        is_odd=rng.random() < 0.5,
+    )
+
+
+def test_rounding_is_idempotent():
+    rng = random.Random(0)
+    for _ in range(200):
+        data = SweaterDimensions(**_random_raw_dimensions(rng))
+        again = SweaterDimensions(**data.model_dump(exclude=set(SweaterDimensions.model_computed_fields)))
+        assert again.canonical_hash() == data.canonical_hash()
+
+
+def test_size_with_zero_increments_equals_base():
+    rng = random.Random(1)
+    for _ in range(50):
+        base = SweaterDimensions(**_random_raw_dimensions(rng))
+        grading = SizeGrading(
+            base=base, size_names=["S", "M", "L"], base_size="M",
+            increments={name: 0.0 for name in GRADABLE_FIELDS},
+        )
+        for data in grading.dimensions().values():
+            assert data.canonical_hash() == base.canonical_hash()
+
+    base = make_dimensions()
+    grading = SizeGrading(base=base, size_names=["S", "M"], base_size="M", increments={"length_of_ribbed_hem": 0.0})
+    expected = generate_charts(base)
+    charts = generate_charts(grading.dimensions()["S"])
+    assert set(charts) == set(expected)
+    for name, chart in charts.items():
+        assert np.array_equal(chart.array, expected[name].array)
+
+
+def test_untouched_fields_do_not_drift_between_sizes():
+    rng = random.Random(2)
+    for _ in range(50):
+        base = SweaterDimensions(**_random_raw_dimensions(rng))
+        grading = SizeGrading(
+            base=base, size_names=["XS", "S", "M", "L", "XL"], base_size="M",
+            increments={"width_of_body": 40.0},
+        )
+        for data in grading.dimensions().values():
+            for name in GRADABLE_FIELDS:
+                if name != "width_of_body":
+                    assert getattr(data, name) == getattr(base, name)
+
+
+def test_graded_charts_equal_full_generation():
+    grading = SizeGrading(
+        base=make_dimensions(), size_names=["XS", "S", "M", "L", "XL"], base_size="M",
+        increments={"width_of_body": 40, "length_of_body": 20, "width_of_sleeve": 10, "length_of_sleeve": 15},
+    )
+    sizes = list(grading.dimensions().values())
+    for data, charts in zip(sizes, generate_graded_charts(sizes)):
+        expected = generate_charts(data)
+        assert set(charts) == set(expected)
+        for name, chart in charts.items():
+            assert np.array_equal(chart.array, expected[name].array), name
+
+
+def test_random_graded_charts_equal_full_generation():
+    # 辺の上に中心がある判定点は、寸法の誤差程度の違いでも結果が変わる
+    rng = random.Random(3)
+    types = [sweater_type.value for sweater_type in SweaterType]
+    for _ in range(40):
+        base = SweaterDimensions(**_random_raw_dimensions(rng, rng.choice(types)))
+        increments = {name: round(rng.uniform(0, 25), 2) for name in rng.sample(GRADABLE_FIELDS, 4)}
+        grading = SizeGrading(base=base, size_names=["S", "M", "L", "XL"], base_size="S", increments=increments)
+        sizes = list(grading.dimensions().values())
+        for data, charts in zip(sizes, generate_graded_charts(sizes)):
+            expected = generate_charts(data)
+            for name, chart in charts.items():
+                assert np.array_equal(chart.array, expected[name].array), (increments, name)
+
+
+def test_reusing_falls_back_when_rasterizing_fails(monkeypatch):
+    # 内外判定に失敗した場合は全体の生成（空のチャート）に切り替える
+    monkeypatch.setattr(Chart, "_rasterize", classmethod(lambda cls, *args, **kwargs: False))
+    shape = Shape.back_body_from(make_dimensions())
+    piece = Chart.from_shape_reusing(shape, None, Rasterizer.VECTORIZED)
+    assert piece.raster is None
+    assert np.array_equal(piece.chart.array, Chart._generate_from_shape(shape, Rasterizer.VECTORIZED).array)
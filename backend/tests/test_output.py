@@ -0,0 +1,141 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+import main
+from main import Chart, ChartEncoding, ChartFileError, Gauge, RunLengthChart, Symbol, generate_charts
+
+GAUGE = Gauge(vertical=10, horizontal=10)
+VALUES = np.array([symbol.number for symbol in Symbol if not symbol.name.startswith("_")], dtype=np.int8)
+
+
+def _random_charts(seed, count=200):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        shape = tuple(rng.integers(0, 12, size=2))
+        yield Chart(VALUES[rng.integers(0, len(VALUES), size=shape)], GAUGE)
+
+
+def _savetxt(chart: Chart, header: str = "") -> bytes:
+    """ np.savetxt で書き出していた頃の Chart.write_csv の出力 """
+    stream = io.BytesIO()
+    np.savetxt(stream, chart.array, fmt='%d', delimiter=',', header=header)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize("header", ["", "front_body"])
+def test_csv_equals_savetxt(header):
+    for chart in _random_charts(0):
+        for csv_chart in (chart, chart.to_runs()):
+            stream = io.BytesIO()
+            csv_chart.write_csv(stream, header=header)
+            assert stream.getvalue() == _savetxt(chart, header)
+
+
+def test_csv_in_small_blocks_equals_savetxt(monkeypatch):
+    # 数行ずつに分けて書き出しても同じ内容になる
+    monkeypatch.setattr(main, "_CSV_BLOCK_CELLS", 7)
+    for chart in _random_charts(2, count=50):
+        for csv_chart in (chart, chart.to_runs()):
+            stream = io.BytesIO()
+            csv_chart.write_csv(stream)
+            assert stream.getvalue() == _savetxt(chart)
+
+
+def test_csv_charts_equal_savetxt(dimensions):
+    charts = generate_charts(dimensions)
+    stream = io.BytesIO()
+    Chart.write_csv_charts(stream, charts)
+    assert stream.getvalue() == b"".join(_savetxt(chart, name) for name, chart in charts.items())
+
+
+@pytest.mark.parametrize("encoding", list(ChartEncoding))
+def test_binary_roundtrip(encoding):
+    for chart in _random_charts(1):
+        data = chart.to_binary(name="front_body", dimensions_hash="abc", encoding=encoding)
+        for cls in (Chart, RunLengthChart):
+            read, header = cls.read_binary(data)
+            assert np.array_equal(np.asarray(read.to_array() if cls is RunLengthChart else read.array), chart.array)
+            assert read.gauge == GAUGE
+            assert (header.name, header.shape, header.encoding, header.dimensions_hash) == ("front_body", chart.shape, encoding, "abc")
+
+        # 連のまま書き出しても同じ内容になる
+        assert chart.to_runs().to_binary(name="front_body", dimensions_hash="abc", encoding=encoding) == data
+
+
+@pytest.mark.parametrize("encoding", list(ChartEncoding))
+def test_binary_archive_roundtrip(dimensions, tmp_path, encoding):
+    charts = generate_charts(dimensions)
+    path = tmp_path / "charts.bin"
+    size = Chart.write_binary_charts(str(path), charts, dimensions_hash=dimensions.canonical_hash(), encoding=encoding)
+    assert size == path.stat().st_size
+
+    read = Chart.read_binary_charts(str(path))
+    assert list(read) == list(charts)
+    for name, chart in charts.items():
+        assert np.array_equal(read[name].array, chart.array)
+        assert not read[name].array.flags.writeable
+
+
+@pytest.mark.parametrize("encoding", list(ChartEncoding))
+def test_truncated_binary_is_rejected(encoding):
+    chart = Chart(np.arange(-6, 6, dtype=np.int8).reshape(3, 4), GAUGE)
+    data = chart.to_binary(encoding=encoding)
+    # 末尾の値は 0 でないので、末尾の 0 は位置をそろえるための詰め物
+    end = len(data.rstrip(b"\0"))
+    for size in range(end):
+        with pytest.raises(ChartFileError):
+            Chart.read_binary(data[:size])
+    # 詰め物だけが欠けている場合は読み込める
+    for size in range(end, len(data)):
+        assert np.array_equal(Chart.read_binary(data[:size])[0].array, chart.array)
+
+
+def _replace_header(data: bytes, **changes) -> bytes:
+    """ レコードのヘッダーの一部を書き換える """
+    magic, version, header_nbytes = main._CHART_FILE_PREFIX.unpack_from(data)
+    fields = json.loads(data[main._CHART_FILE_PREFIX.size:main._CHART_FILE_PREFIX.size + header_nbytes])
+    header_json = json.dumps({**fields, **changes}).encode()
+    prefix = main._CHART_FILE_PREFIX.pack(magic, version, len(header_json)) + header_json
+    payload = data[main._align(main._CHART_FILE_PREFIX.size + header_nbytes):]
+    return prefix + bytes(main._align(len(prefix)) - len(prefix)) + payload
+
+
+@pytest.mark.parametrize("encoding", list(ChartEncoding))
+def test_negative_header_fields_are_rejected(encoding):
+    data = Chart(np.arange(-6, 6, dtype=np.int8).reshape(3, 4), GAUGE).to_binary(encoding=encoding)
+    for changes in ({"shape": [-2, 3]}, {"shape": [3, -4]}, {"num_runs": -1}):
+        for cls in (Chart, RunLengthChart):
+            with pytest.raises(ChartFileError):
+                cls.read_binary(_replace_header(data, **changes))
+
+
+@pytest.mark.parametrize("row_offsets", [[0, 8, 4, 12], [1, 4, 8, 12], [0, 4, 8, 11]])
+def test_inconsistent_row_offsets_are_rejected(row_offsets):
+    chart = Chart(np.arange(-6, 6, dtype=np.int8).reshape(3, 4), GAUGE)
+    data = chart.to_binary(encoding=ChartEncoding.RLE)
+    _, data_offset = main._read_chart_header(data)
+    assert list(np.frombuffer(data, dtype="<u4", count=4, offset=data_offset)) == [0, 4, 8, 12]
+    corrupted = data[:data_offset] + np.array(row_offsets, dtype="<u4").tobytes() + data[data_offset + 16:]
+    for cls in (Chart, RunLengthChart):
+        with pytest.raises(ChartFileError):
+            cls.read_binary(corrupted)
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.int32, np.int64, np.uint8, np.bool_])
+def test_csv_of_other_integer_dtypes_equals_savetxt(dtype):
+    array = np.array([[1, 0, 1], [0, 1, 1]]) if dtype is np.bool_ or dtype is np.uint8 else np.array([[1, 0, -1], [-101, 60, 2]])
+    chart = Chart(array.astype(dtype), GAUGE)
+    for csv_chart in (chart, RunLengthChart.from_array(chart.array, GAUGE)):
+        stream = io.BytesIO()
+        csv_chart.write_csv(stream)
+        assert stream.getvalue() == _savetxt(chart)
+
+
+def test_csv_rejects_values_outside_int8():
+    with pytest.raises(ValueError):
+        Chart(np.array([[1, 200]]), GAUGE).write_csv(io.BytesIO())
+    with pytest.raises(TypeError):
+        Chart(np.array([[1.0, 0.0]]), GAUGE).write_csv(io.BytesIO())
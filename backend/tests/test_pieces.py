@@ -0,0 +1,115 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from conftest import make_dimensions
+import main
+from main import (
+    PIECES,
+    ChartWorkerPool,
+    ExecutorType,
+    SweaterType,
+    chart_memo,
+    shape_memo,
+    generate_charts,
+    generate_charts_concurrently,
+)
+
+
+@pytest.mark.parametrize("sweater_type", [SweaterType.CREW_NECK_SWEATER, SweaterType.V_NECK_CARDIGAN])
+def test_concurrent_generation_equals_sequential(dimensions, sweater_type):
+    data = dimensions.model_copy(update={"type": sweater_type})
+    pool = ChartWorkerPool(max_workers=len(PIECES), max_queue=0, executor_type=ExecutorType.THREAD)
+    try:
+        charts = asyncio.run(generate_charts_concurrently(data, pool))
+    finally:
+        pool.shutdown()
+
+    expected = generate_charts(data)
+    assert list(charts) == list(expected)
+    for name, chart in expected.items():
+        assert np.array_equal(charts[name].array, chart.array), name
+
+
+@pytest.mark.parametrize("is_odd", [True, False])
+def test_cardigan_split_leaves_out_odd_center_column(is_odd):
+    data = make_dimensions(type=SweaterType.CREW_NECK_CARDIGAN, is_odd=is_odd)
+    charts = generate_charts(data)
+    front = generate_charts(data.model_copy(update={"type": SweaterType.CREW_NECK_SWEATER}))["front_body"].array
+    num_cols = front.shape[1]
+    assert num_cols % 2 == is_odd
+    assert np.array_equal(charts["right_front_body"].array, front[:, :num_cols // 2])
+    assert np.array_equal(charts["left_front_body"].array, front[:, num_cols - num_cols // 2:])
+
+
+def test_piece_memo_is_kept_in_parent_process():
+    data = make_dimensions()
+    changed = make_dimensions(length_of_front_neck_drop=90)
+    pool = ChartWorkerPool(max_workers=2, max_queue=1, executor_type=ExecutorType.PROCESS)
+    submitted = []
+    run_reserved = pool._run_reserved
+
+    async def counting_run_reserved(func, *args):
+        submitted.append(args)
+        return await run_reserved(func, *args)
+
+    pool._run_reserved = counting_run_reserved
+    chart_memo.clear()
+    shape_memo.clear()
+    try:
+        asyncio.run(generate_charts_concurrently(data, pool))
+        assert len(submitted) == len(PIECES)
+        # 前身頃は後身頃のチャートの段を再利用して生成する
+        assert [len(args) for args in submitted].count(3) == 1
+
+        # 前襟ぐり下がりだけを変えると、後身頃と袖は親プロセスのメモから使う
+        submitted.clear()
+        charts = asyncio.run(generate_charts_concurrently(changed, pool))
+        assert len(submitted) == 1
+        shape, base_chart, _ = submitted[0]
+        assert np.array_equal(base_chart.array, chart_memo.get((main.Shape.back_body_from(changed).key, main.Rasterizer.VECTORIZED)).array)
+    finally:
+        pool.shutdown()
+
+    expected = generate_charts(changed)
+    assert list(charts) == list(expected)
+    for name, chart in expected.items():
+        assert np.array_equal(charts[name].array, chart.array), name
+
+
+def test_process_worker_skips_piece_memos(monkeypatch):
+    monkeypatch.setattr(shape_memo, "enabled", True)
+    monkeypatch.setattr(chart_memo, "enabled", True)
+    main._warm_up_worker(is_process=True)
+    assert not shape_memo.enabled and not chart_memo.enabled
+
+    shape_memo.clear()
+    chart_memo.clear()
+    # メモに追加するためのコピーも作らない
+    monkeypatch.setattr(main.Chart, "_remember", classmethod(lambda cls, key, chart: pytest.fail("copied into the memo")))
+    data = make_dimensions()
+    for _ in range(2):
+        shape = main.Shape.back_body_from(data)
+        chart = main.Chart.from_shape(shape)
+        assert chart.array.flags.writeable
+    assert len(shape_memo) == len(chart_memo) == 0
+    assert chart_memo.hits == chart_memo.misses == 0
+
+
+def test_ribbed_hem_change_reuses_body_pieces():
+    # 裾のゴム編みの長さだけを変えても身頃のシェイプは変わらないので、メモから使う
+    data = make_dimensions()
+    changed = make_dimensions(length_of_ribbed_hem=60)
+    chart_memo.clear()
+    shape_memo.clear()
+    generate_charts(data)
+    misses = chart_memo.misses
+    charts = generate_charts(changed)
+    assert chart_memo.misses == misses
+
+    chart_memo.clear()
+    shape_memo.clear()
+    expected = generate_charts(changed)
+    for name, chart in expected.items():
+        assert np.array_equal(charts[name].array, chart.array), name
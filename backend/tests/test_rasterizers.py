@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import shapely
+
+from conftest import make_dimensions
+from main import Chart, Rasterizer, Shape
+
+PIECE_SHAPES = {
+    "front_body": Shape.front_body_from,
+    "back_body": Shape.back_body_from,
+    "sleeve": Shape.sleeve_from,
+}
+
+
+def _raster(shape: Shape, rasterizer: Rasterizer):
+    """ 編み目記号を挿入する前の内外判定の結果と、判定に使った輪郭・大きさを返す """
+    start_x, end_x, start_y, end_y = shape.bbox()
+    width, height = end_x - start_x, end_y - start_y
+    array = np.zeros((int(height / shape.gauge.stitch_length), int(width / shape.gauge.stitch_width)), dtype=np.int8)
+    polygon_points = Chart._flatten(shape)
+    assert Chart._rasterize(array, shape, polygon_points, width, height, rasterizer)
+    return array, polygon_points, width, height
+
+
+@pytest.mark.parametrize("piece", PIECE_SHAPES)
+def test_vectorized_equals_pointwise(dimensions, piece):
+    shape = PIECE_SHAPES[piece](dimensions)
+    pointwise = Chart._generate_from_shape(shape, Rasterizer.POINTWISE)
+    vectorized = Chart._generate_from_shape(shape, Rasterizer.VECTORIZED)
+    assert np.array_equal(vectorized.array, pointwise.array)
+
+
+@pytest.mark.parametrize("piece", PIECE_SHAPES)
+def test_scanline_differs_only_on_outline_ties(dimensions, piece):
+    shape = PIECE_SHAPES[piece](dimensions)
+    vectorized, polygon_points, width, height = _raster(shape, Rasterizer.VECTORIZED)
+    scanline, _, _, _ = _raster(shape, Rasterizer.SCANLINE)
+
+    # 中心が輪郭上にあるグリッドだけ、浮動小数点の誤差で判定が分かれる
+    rows, cols = np.nonzero(vectorized != scanline)
+    x_centers, y_centers = Chart._grid_centers(width, height, shape.gauge, vectorized.shape)
+    distances = shapely.distance(shapely.LinearRing(polygon_points), shapely.points(x_centers[cols], y_centers[rows]))
+    assert np.all(distances < 1e-9)
+
+
+def _assert_sharing_rows_equals_full(data):
+    back_body = Chart._generate_from_shape(Shape.back_body_from(data), Rasterizer.VECTORIZED)
+    front_shape = Shape.front_body_from(data)
+    full = Chart._generate_from_shape(front_shape, Rasterizer.VECTORIZED)
+    # 後身頃と大きさが同じで、帯だけ生成する経路を通る
+    assert back_body.array.shape == full.array.shape
+
+    num_differing_rows = max(data.rows_of_front_neck_drop, data.rows_of_back_neck_drop) + 1
+    shared = Chart._generate_sharing_rows(front_shape, back_body, num_differing_rows, Rasterizer.VECTORIZED)
+    assert np.array_equal(shared.array, full.array)
+
+
+def test_sharing_rows_equals_full_generation(dimensions):
+    _assert_sharing_rows_equals_full(dimensions)
+
+
+@pytest.mark.parametrize("front_neck_drop", [30, 55, 75, 110])
+@pytest.mark.parametrize("back_neck_drop", [5, 20, 40])
+@pytest.mark.parametrize("is_odd", [True, False])
+def test_sharing_rows_equals_full_generation_for_neck_drops(front_neck_drop, back_neck_drop, is_odd):
+    _assert_sharing_rows_equals_full(make_dimensions(
+        length_of_front_neck_drop=front_neck_drop,
+        length_of_back_neck_drop=back_neck_drop,
+        is_odd=is_odd,
+    ))
@@ -0,0 +1,105 @@
+import json
+import random
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import make_dimensions
+import main
+from main import (
+    GRADABLE_FIELDS,
+    ChartRegeneration,
+    Gauge,
+    Metric,
+    SweaterDimensions,
+    SweaterType,
+    apply_row_diff,
+    generate_charts,
+    regenerate_charts,
+)
+
+CHANGES = [
+    {"length_of_ribbed_hem": 60},
+    {"width_of_body": 480},
+    {"type": "crew-neck-cardigan"},
+    {"length_of_sleeve": 530},
+    {"width_of_neck": 170},
+    {"is_odd": False},
+]
+
+
+def _request_body(data: SweaterDimensions, changes: dict) -> dict:
+    previous = json.loads(data.model_dump_json(exclude=set(SweaterDimensions.model_computed_fields)))
+    previous["gauge"] = json.loads(data.gauge.model_dump_json(exclude=set(Gauge.model_computed_fields)))
+    return {"previous": previous, "changes": changes}
+
+
+@pytest.mark.parametrize("changes", CHANGES, ids=lambda c: next(iter(c)))
+def test_regenerate_equals_full_generation(changes):
+    # 丸める前の値から変更した寸法と同じになる
+    raw = {"length_of_shoulder_drop": 19.89, "length_of_back_neck_drop": 20.59}
+    previous = make_dimensions(**raw)
+    data = ChartRegeneration(previous=previous, changes=changes).dimensions()
+    assert data.canonical_hash() == make_dimensions(**raw, **changes).canonical_hash()
+
+    _, charts, diffs, removed = regenerate_charts(data, previous)
+    previous_charts = generate_charts(previous)
+    expected = generate_charts(data)
+    assert set(charts) == set(expected)
+    assert set(removed) == set(previous_charts) - set(expected)
+    for name, chart in expected.items():
+        assert np.array_equal(charts[name].array, chart.array)
+        previous_array = previous_charts[name].array if name in previous_charts else None
+        assert np.array_equal(apply_row_diff(previous_array, diffs[name]), chart.array)
+
+
+def test_random_edit_chain_equals_full_generation():
+    # 前回の結果を引き継いで寸法を1つずつ変更し続けても、全体の生成と同じになる
+    for seed in range(40):
+        rng = random.Random(seed)
+        data = make_dimensions(
+            gauge=Gauge(metric=rng.choice(list(Metric)), vertical=round(rng.uniform(18, 45), 1), horizontal=round(rng.uniform(10, 33), 1)),
+            type=rng.choice(list(SweaterType)),
+            is_odd=rng.random() < 0.5,
+            **{name: round(getattr(make_dimensions(), name) * rng.uniform(0.9, 1.1), 2) for name in GRADABLE_FIELDS},
+        )
+        previous_charts = generate_charts(data)
+        pieces = None
+        for _ in range(6):
+            name = rng.choice(GRADABLE_FIELDS)
+            changes = {name: round(getattr(data, name) * rng.uniform(0.95, 1.05), 2)}
+            previous, data = data, ChartRegeneration(previous=data, changes=changes).dimensions()
+
+            pieces, charts, diffs, _ = regenerate_charts(data, previous, pieces)
+            expected = generate_charts(data)
+            assert set(charts) == set(expected)
+            for piece, chart in expected.items():
+                assert np.array_equal(charts[piece].array, chart.array), (changes, piece)
+                previous_array = previous_charts[piece].array if piece in previous_charts else None
+                assert np.array_equal(apply_row_diff(previous_array, diffs[piece]), chart.array), (changes, piece)
+            previous_charts = expected
+
+
+def test_unchanged_pieces_have_empty_diffs():
+    previous = make_dimensions()
+    data = ChartRegeneration(previous=previous, changes={"length_of_ribbed_hem": 60}).dimensions()
+    _, charts, diffs, _ = regenerate_charts(data, previous)
+    assert diffs["sleeve"]["rows"] == []
+    assert diffs["sleeve"]["keep_top"] == charts["sleeve"].array.shape[0]
+
+
+def test_regenerate_endpoint():
+    previous = make_dimensions()
+    with TestClient(main.app) as client:
+        response = client.post("/regenerate_sweater_chart", json=_request_body(previous, {"width_of_neck": 170}))
+        assert response.status_code == 200
+        body = response.json()
+        expected = generate_charts(ChartRegeneration(previous=previous, changes={"width_of_neck": 170}).dimensions())
+        previous_charts = generate_charts(previous)
+        for diff in body["pieces"]:
+            array = apply_row_diff(previous_charts[diff["piece"]].array, diff)
+            assert np.array_equal(array, expected[diff["piece"]].array)
+
+        assert client.post("/regenerate_sweater_chart", json=_request_body(previous, {"nope": 1})).status_code == 422
+        assert client.post("/regenerate_sweater_chart", json=_request_body(previous, {"width_of_body": -5})).status_code == 422
@@ -0,0 +1,59 @@
+import pytest
+from svgpathtools import parse_path
+
+from main import Shape, SweaterDimensions
+
+
+def _legacy_body_path(data: SweaterDimensions, is_front: bool) -> str:
+    """ SVG のパス文字列を組み立てていた頃の身頃のパス """
+    length_of_neck_drop = data.length_of_front_neck_drop if is_front else data.length_of_back_neck_drop
+    stitch_num_of_shoulder_drop = int(data.length_of_shoulder_drop / data.gauge.stitch_length)
+    stitch_num_of_shoulder_width = int(data.width_of_shoulder / data.gauge.stitch_width)
+    stitch_num_of_horizonal_shoulder_line = int((stitch_num_of_shoulder_width / stitch_num_of_shoulder_drop) / 2)
+    horizonal_shoulder_line_width = stitch_num_of_horizonal_shoulder_line * data.gauge.stitch_width
+    return (
+        f"M {0} {data.length_of_shoulder_drop + data.length_of_vertical_armhole} "
+        f"c {data.width_of_horizontal_armhole},0 {data.width_of_horizontal_armhole},-{data.length_of_vertical_armhole / 2} {data.width_of_horizontal_armhole},-{data.length_of_vertical_armhole / 2} "
+        f"v -{data.length_of_vertical_armhole / 2} "
+        f"l {data.width_of_shoulder - horizonal_shoulder_line_width},-{data.length_of_shoulder_drop} "
+        f"h {horizonal_shoulder_line_width} "
+        f"c 0,{length_of_neck_drop} {data.width_of_neck / 2},{length_of_neck_drop} {data.width_of_neck / 2},{length_of_neck_drop} "
+        f"c {data.width_of_neck / 2},0 {data.width_of_neck / 2},-{length_of_neck_drop} {data.width_of_neck / 2},-{length_of_neck_drop} "
+        f"h {horizonal_shoulder_line_width} "
+        f"l {data.width_of_shoulder - horizonal_shoulder_line_width},{data.length_of_shoulder_drop} "
+        f"v {data.length_of_vertical_armhole / 2} "
+        f"c 0,{data.length_of_vertical_armhole / 2} {data.width_of_horizontal_armhole},{data.length_of_vertical_armhole / 2} {data.width_of_horizontal_armhole},{data.length_of_vertical_armhole / 2} "
+        f"v {data.length_of_body_side + data.length_of_ribbed_hem} "
+        f"h {-data.width_of_body}"
+        f"Z"
+    )
+
+
+def _legacy_sleeve_path(data: SweaterDimensions) -> str:
+    """ SVG のパス文字列を組み立てていた頃の袖のパス """
+    return (
+        f"M {0},{data.length_of_sleeve_cap} "
+        f" c {data.width_of_sleeve/2},{0} {data.width_of_sleeve/2},{-data.length_of_sleeve_cap} {data.width_of_sleeve},{-data.length_of_sleeve_cap} "
+        f" c {data.width_of_sleeve/2},{0} {data.width_of_sleeve/2},{data.length_of_sleeve_cap} {data.width_of_sleeve},{data.length_of_sleeve_cap} "
+        f"l {data.width_of_cuff - data.width_of_sleeve},{data.length_of_sleeve_side} "
+        f"v {data.length_of_ribbed_cuff} "
+        f"h {-data.width_of_cuff * 2} "
+        f"v {-data.length_of_ribbed_cuff} "
+        f"Z"
+    )
+
+
+@pytest.mark.parametrize("piece", ["front_body", "back_body", "sleeve"])
+def test_segments_equal_parsed_svg_path(dimensions, piece):
+    if piece == "sleeve":
+        shape = Shape.sleeve_from(dimensions)
+        legacy = parse_path(_legacy_sleeve_path(dimensions))
+    else:
+        is_front = piece == "front_body"
+        shape = (Shape.front_body_from if is_front else Shape.back_body_from)(dimensions)
+        legacy = parse_path(_legacy_body_path(dimensions, is_front))
+
+    assert len(shape.segments) == len(legacy)
+    for segment, expected in zip(shape.segments, legacy):
+        assert type(segment) is type(expected)
+        assert segment.bpoints() == expected.bpoints()
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from main import _MARKER_1_TEMPLATE, _MARKER_2_TEMPLATE, _SYMBOL_RULES, Chart, Gauge, Rasterizer, RewriteRule, Shape, Symbol
+
+GAUGE = Gauge(vertical=10, horizontal=10)
+NONE, KNIT = Symbol.NONE.number, Symbol.KNIT.number
+MARKER_1, MARKER_2 = Symbol._MARKER_1.number, Symbol._MARKER_2.number
+
+
+def _legacy_replace_in(arr, template, replacement, position, start_row=0, step_rows=1):
+    """ 一致する箇所を元の配列で全て判定してから置換していた頃の Chart._replace_in """
+    rows, cols = template.shape
+    h, w = arr.shape
+    result = arr.copy()
+    for y in range(start_row, h - rows + 1, step_rows):
+        for x in range(w - cols + 1):
+            if np.array_equal(arr[y:y + rows, x:x + cols], template):
+                result[y + position[0], x + position[1]] = replacement
+    return result
+
+
+def _legacy_propagate_markers(arr):
+    """ 変化がなくなるまでマーカーを1目ずつ伝播させていた頃の処理 """
+    while True:
+        previous = arr
+        arr = _legacy_replace_in(arr, np.array([[MARKER_1, NONE]]), MARKER_1, (0, 1))
+        arr = _legacy_replace_in(arr, np.array([[NONE, MARKER_2]]), MARKER_2, (0, 0))
+        if np.array_equal(previous, arr):
+            arr[arr == MARKER_1] = KNIT
+            arr[arr == MARKER_2] = KNIT
+            return arr
+
+
+def test_propagate_markers_equals_fixed_point_loop():
+    rng = np.random.default_rng(0)
+    values = np.array([NONE, NONE, NONE, KNIT, MARKER_1, MARKER_2], dtype=np.int8)
+    for _ in range(3000):
+        shape = tuple(rng.integers(1, 12, size=2))
+        array = values[rng.integers(0, len(values), size=shape)]
+        chart = Chart(array.copy(), GAUGE)
+        chart._propagate_markers()
+        assert np.array_equal(chart.array, _legacy_propagate_markers(array))
+
+
+def test_rewrite_rules_equal_legacy_replace_in():
+    rules = [
+        RewriteRule(template=_MARKER_1_TEMPLATE, replacement=MARKER_1, position=(0, 1), start_row=0, step_rows=2),
+        RewriteRule(template=_MARKER_2_TEMPLATE, replacement=MARKER_2, position=(0, 0), start_row=1, step_rows=2),
+        *_SYMBOL_RULES,
+    ]
+    rng = np.random.default_rng(1)
+    values = np.array([symbol.number for symbol in Symbol], dtype=np.int8)
+    for _ in range(300):
+        shape = tuple(rng.integers(1, 10, size=2))
+        array = np.where(rng.random(shape) < 0.8, rng.integers(0, 2, size=shape) * KNIT, rng.choice(values, size=shape)).astype(np.int8)
+        for rule in rules:
+            expected = _legacy_replace_in(array, rule.template, rule.replacement, rule.position, rule.start_row, rule.step_rows)
+            assert np.array_equal(rule.apply(array.copy()), expected)
+
+            # _replace_in を経由しても同じで、規則を順番に適用した結果も一致する
+            chart = Chart(array.copy(), GAUGE)
+            chart._replace_in(rule.template, rule.replacement, rule.position, rule.start_row, rule.step_rows)
+            assert np.array_equal(chart.array, expected)
+            array = expected
+
+
+def _insert_symbol_both_ways(array):
+    """ ルックアップテーブルと置換規則のそれぞれで編み目記号を挿入した配列を返す """
+    charts = []
+    for use_lookup_table in (True, False):
+        chart = Chart.allocate(array.shape, GAUGE)
+        chart.array[...] = array
+        chart._insert_symbol(use_lookup_table=use_lookup_table)
+        charts.append(chart.array)
+    return charts
+
+
+def test_lookup_table_equals_symbol_rules():
+    rng = np.random.default_rng(2)
+    for _ in range(3000):
+        shape = tuple(rng.integers(1, 12, size=2))
+        array = (rng.random(shape) < rng.random()).astype(np.int8) * KNIT
+        by_table, by_rules = _insert_symbol_both_ways(array)
+        assert np.array_equal(by_table, by_rules)
+
+
+@pytest.mark.parametrize("shape_from", [Shape.front_body_from, Shape.back_body_from, Shape.sleeve_from])
+def test_lookup_table_equals_symbol_rules_on_pieces(dimensions, shape_from):
+    shape = shape_from(dimensions)
+    start_x, end_x, start_y, end_y = shape.bbox()
+    width, height = end_x - start_x, end_y - start_y
+    array = np.zeros((int(height / shape.gauge.stitch_length), int(width / shape.gauge.stitch_width)), dtype=np.int8)
+    assert Chart._rasterize(array, shape, Chart._flatten(shape), width, height, Rasterizer.VECTORIZED)
+
+    by_table, by_rules = _insert_symbol_both_ways(array)
+    assert np.array_equal(by_table, by_rules)
@@ -0,0 +1,199 @@
+import asyncio
+import os
+import threading
+
+import pytest
+from concurrent.futures import BrokenExecutor
+
+from conftest import make_dimensions
+from main import ChartWorkerPool, ExecutorType, WorkerPoolSaturated, chart_memo, generate_charts_concurrently
+
+
+def _crash():
+    os._exit(1)
+
+
+def _square(value: int) -> int:
+    return value * value
+
+
+def test_pool_recovers_after_worker_crash():
+    pool = ChartWorkerPool(max_workers=1, max_queue=1, executor_type=ExecutorType.PROCESS)
+
+    async def scenario():
+        assert await pool.run(_square, 3) == 9
+        with pytest.raises(BrokenExecutor):
+            await pool.run(_crash)
+        assert await pool.run(_square, 4) == 16
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+
+def test_pool_rejects_when_saturated():
+    pool = ChartWorkerPool(max_workers=1, max_queue=0, executor_type=ExecutorType.THREAD)
+
+    async def scenario():
+        pool._num_pending = 1
+        with pytest.raises(WorkerPoolSaturated):
+            await pool.run(_square, 2)
+
+    asyncio.run(scenario())
+
+
+def test_reserved_slots_are_not_taken_by_other_requests():
+    pool = ChartWorkerPool(max_workers=1, max_queue=2, executor_type=ExecutorType.THREAD)
+
+    async def scenario():
+        reservation = pool.reserve(2)
+        assert pool.num_pending == 2
+        with pytest.raises(WorkerPoolSaturated):
+            pool.reserve(2)
+        assert await reservation.run(_square, 5) == 25
+        assert pool.num_pending == 1
+        # 使わなかった空きを返す
+        reservation.release()
+        assert pool.num_pending == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+
+def test_concurrent_requests_are_never_partly_admitted():
+    pool = ChartWorkerPool(max_workers=1, max_queue=2, executor_type=ExecutorType.THREAD)
+    submitted = []
+    run_reserved = pool._run_reserved
+
+    async def counting_run_reserved(func, *args):
+        submitted.append(func)
+        return await run_reserved(func, *args)
+
+    pool._run_reserved = counting_run_reserved
+    chart_memo.clear()
+
+    async def scenario():
+        # 2件目は空きが足りないので、どのパーツも投入せずに WorkerPoolSaturated を送出する
+        return await asyncio.gather(
+            generate_charts_concurrently(make_dimensions(), pool),
+            generate_charts_concurrently(make_dimensions(width_of_body=520), pool),
+            return_exceptions=True,
+        )
+
+    try:
+        first, second = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert isinstance(first, dict)
+    assert isinstance(second, WorkerPoolSaturated)
+    assert len(submitted) == 3
+    assert pool.num_pending == 0
+
+
+def test_cancelled_runs_keep_their_slots_until_the_worker_finishes():
+    pool = ChartWorkerPool(max_workers=1, max_queue=0, executor_type=ExecutorType.THREAD)
+    finished = threading.Event()
+
+    async def scenario():
+        task = asyncio.create_task(pool.run(finished.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # 実行中の処理はキャンセルできないので、空きは返さない
+        assert pool.num_pending == 1
+        assert not pool.has_capacity()
+        with pytest.raises(WorkerPoolSaturated):
+            await pool.run(_square, 2)
+
+        finished.set()
+        for _ in range(100):
+            if pool.num_pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.num_pending == 0
+        assert await pool.run(_square, 3) == 9
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        finished.set()
+        pool.shutdown()
+
+
+def test_queued_runs_return_their_slots_when_cancelled():
+    pool = ChartWorkerPool(max_workers=1, max_queue=1, executor_type=ExecutorType.THREAD)
+    finished = threading.Event()
+
+    async def scenario():
+        running = asyncio.create_task(pool.run(finished.wait))
+        queued = asyncio.create_task(pool.run(_square, 2))
+        await asyncio.sleep(0.05)
+        # 実行前の処理はキャンセルできるので、空きをすぐに返す
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        await asyncio.sleep(0)
+        assert pool.num_pending == 1
+
+        finished.set()
+        assert await running
+        assert pool.num_pending == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        finished.set()
+        pool.shutdown()
+
+
+def test_reserve_when_available_waits_for_released_slots():
+    pool = ChartWorkerPool(max_workers=1, max_queue=1, executor_type=ExecutorType.THREAD)
+
+    async def scenario():
+        held = pool.reserve(2)
+        waiting = asyncio.create_task(pool.reserve_when_available(2))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+
+        # 1つ返しただけでは足りないので待ち続ける
+        held._remaining = 1
+        pool._release(1)
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+
+        held.release()
+        reservation = await asyncio.wait_for(waiting, 1)
+        assert pool.num_pending == 2
+        assert await reservation.run(_square, 3) == 9
+        reservation.release()
+        assert pool.num_pending == 0
+
+        # プール全体の上限を超える数は待っても確保できない
+        with pytest.raises(WorkerPoolSaturated):
+            await pool.reserve_when_available(3)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+
+def test_cancelled_waiter_does_not_take_slots():
+    pool = ChartWorkerPool(max_workers=1, max_queue=0, executor_type=ExecutorType.THREAD)
+
+    async def scenario():
+        held = pool.reserve(1)
+        waiting = asyncio.create_task(pool.reserve_when_available(1))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert pool._waiters == []
+        held.release()
+        assert pool.num_pending == 0
+
+    asyncio.run(scenario())
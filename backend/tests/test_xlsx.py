@@ -0,0 +1,101 @@
+import io
+
+import openpyxl
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import make_dimensions, request_body
+import main
+from main import XLSX, Symbol, generate_charts
+
+
+@pytest.fixture
+def template_path(monkeypatch, tmp_path):
+    """ テンプレートのパスを差し替え、読み込み済みのテンプレートを破棄する """
+    def use(path):
+        monkeypatch.setattr(main, "TEMPLATE_PATH", str(path))
+        main._load_template.cache_clear()
+        main._parse_template.cache_clear()
+    yield use
+    main._load_template.cache_clear()
+    main._parse_template.cache_clear()
+
+
+@pytest.mark.parametrize("write_only", [True, False])
+def test_xlsx_without_template(template_path, tmp_path, write_only):
+    template_path(tmp_path / "missing.xlsx")
+    charts = generate_charts(make_dimensions())
+    wb = openpyxl.load_workbook(io.BytesIO(XLSX.from_charts(charts, write_only=write_only).to_bytes()))
+    assert wb.sheetnames == ["info", *charts]
+    assert wb["info"].max_row == 1 and wb["info"]["A1"].value is None
+
+
+def test_xlsx_endpoint_without_template(template_path, tmp_path):
+    template_path(tmp_path / "missing.xlsx")
+    with TestClient(main.app) as client:
+        response = client.post("/generate_sweater_chart?output_format=xlsx", json=request_body(make_dimensions(is_odd=False)))
+    assert response.status_code == 200
+    wb = openpyxl.load_workbook(io.BytesIO(response.content))
+    assert wb.sheetnames[0] == "info"
+
+
+def _write_template(path):
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.worksheet.datavalidation import DataValidation
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = "title"
+    ws["A1"].font = Font(bold=True, size=14)
+    ws["A1"].fill = PatternFill("solid", fgColor="FFFF00")
+    ws.merge_cells("A1:D1")
+    ws["A2"] = "yarn"
+    ws["B2"].number_format = "0.00"
+    ws["B2"].fill = PatternFill("solid", fgColor="DDEBF7")
+    ws.row_dimensions[1].height = 30
+    ws.column_dimensions["A"].width = 20
+    validation = DataValidation(type="list", formula1='"a,b"')
+    validation.add("B3")
+    ws.add_data_validation(validation)
+    wb.save(path)
+
+
+@pytest.mark.parametrize("write_only", [True, False])
+def test_xlsx_keeps_template_styles(template_path, tmp_path, write_only):
+    _write_template(tmp_path / "template.xlsx")
+    template_path(tmp_path / "template.xlsx")
+    charts = generate_charts(make_dimensions())
+    ws = openpyxl.load_workbook(io.BytesIO(XLSX.from_charts(charts, write_only=write_only).to_bytes()))["info"]
+
+    assert ws["A1"].value == "title"
+    assert ws["A1"].font.bold and ws["A1"].font.size == 14
+    assert ws["A1"].fill.fgColor.rgb.endswith("FFFF00")
+    assert [str(merged) for merged in ws.merged_cells.ranges] == ["A1:D1"]
+    assert ws["A2"].value == "yarn"
+    assert ws["B2"].value is None and ws["B2"].number_format == "0.00"
+    assert ws["B2"].fill.fgColor.rgb.endswith("DDEBF7")
+    assert ws.row_dimensions[1].height == 30
+    assert ws.column_dimensions["A"].width == 20
+    assert [str(v.sqref) for v in ws.data_validations.dataValidation] == ["B3"]
+
+
+@pytest.mark.parametrize("write_only", [True, False])
+@pytest.mark.parametrize("run_length", [False, True])
+def test_styled_xlsx_keeps_numeric_values(write_only, run_length):
+    charts = generate_charts(make_dimensions())
+    written = {name: chart.to_runs() for name, chart in charts.items()} if run_length else charts
+    wb = openpyxl.load_workbook(io.BytesIO(XLSX.from_charts(written, write_only=write_only).to_bytes()))
+
+    # 記号ごとの名前付きスタイルがワークブックに1つずつ登録される
+    symbol_styles = [name for name in wb.named_styles if name.startswith("symbol_")]
+    assert sorted(symbol_styles) == sorted(f"symbol_{symbol.name.lower()}" for symbol in Symbol if not symbol.name.startswith("_"))
+
+    for name, chart in charts.items():
+        ws = wb[name]
+        for row, cells in zip(chart.array.tolist(), ws.iter_rows(min_col=XLSX.NUM_FROZEN_COLS + 1)):
+            assert [cell.value for cell in cells] == row
+            assert [cell.style for cell in cells] == [f"symbol_{Symbol.from_number(value).name.lower()}" for value in row]
+            assert {cell.font.name for cell in cells} <= {main._SYMBOL_FONT_NAME}
+        assert ws.max_row == chart.shape[0]
+
+    # セルの書式は記号の種類の数だけで、セルの数によらない
+    assert len(wb._cell_styles) <= len(symbol_styles) + 1